@@ -0,0 +1,276 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from itertools import islice
+from config import load_config, STORAGE_SECTION, STORAGE
+
+# Interfaz común de los almacenes: CRUD (Neo4j) y MemoryCRUD (en memoria, memoria.py). La interfaz,
+# la importación/exportación y la escritura diferida solo usan estos métodos, así funcionan igual
+# sobre cualquiera de los dos. Aquí están también las constantes compartidas, para que quien use el
+# almacén en memoria no necesite importar el driver de Neo4j
+
+# Tamaño por defecto de los lotes para las inserciones masivas
+BATCH_SIZE = 1000
+
+# Tamaño por defecto de las páginas de lectura
+PAGE_SIZE = 200
+
+# Filas cambiadas que devuelve como mucho changes_since; si hay más, se pide recargar
+CHANGE_LIMIT = 1000
+
+# Registros que pide el driver al servidor en cada viaje en las lecturas en streaming
+FETCH_SIZE = 1000
+
+# Claves indexadas por las que se puede paginar la lista de empleados
+EMPLOYEE_ORDER_KEYS = ('emp_no', 'dept_no', 'job')
+
+# Etiquetas con seguimiento de cambios (changes_since)
+TRACKED_LABELS = ('Department', 'Employee')
+
+# Resultados de las escrituras validadas (create_employee_checked / update_employee_checked)
+OK = 'ok'
+MISSING_MANAGER = 'missing_manager'
+CYCLE = 'cycle'  # el nuevo manager es el propio empleado o uno de sus subordinados
+MISSING_DEPARTMENT = 'missing_department'
+DUPLICATE = 'duplicate'
+NOT_FOUND = 'not_found'
+HAS_EMPLOYEES = 'has_employees'
+
+
+# Clases de los errores de un almacén (Storage.error_kind), para informar de ellos sin importar el driver
+CONFLICT = 'conflict'  # clave duplicada
+INVALID = 'invalid'  # la base de datos rechaza la sentencia o sus parámetros
+UNAVAILABLE = 'unavailable'  # sin conexión con la base de datos
+FAILED = 'failed'  # cualquier otro error de la base de datos
+
+
+class ConstraintViolation(Exception):
+    # Clave duplicada en el almacén en memoria; el equivalente de ConstraintError de Neo4j
+    pass
+
+
+def chunks(rows, size):
+    # Parte cualquier iterable en listas de como mucho `size` elementos sin materializarlo entero
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def as_row(row, fields):
+    # Acepta tanto diccionarios como tuplas en el mismo orden que los argumentos de create_*
+    if isinstance(row, dict):
+        return {field: row.get(field) for field in fields}
+    return dict(zip(fields, row))
+
+
+def open_storage(path=None, **options):
+    # Almacén según la sección [storage] de la configuración: backend = neo4j (por defecto) o memory.
+    # Los módulos se importan aquí porque los dos dependen de este; `options` van al CRUD de Neo4j
+    storage = load_config(path, section=STORAGE_SECTION, defaults=STORAGE)
+    if storage['backend'] == 'memory':
+        from memoria import MemoryCRUD
+        return MemoryCRUD(storage['snapshot'], load_config(path)['team_aggregates'])
+    if storage['backend'] != 'neo4j':
+        raise ValueError(f"Almacén desconocido: {storage['backend']}")
+    from crud import CRUD
+    return CRUD(**load_config(path), **options)
+
+
+class Storage(ABC):
+    # Excepciones de una escritura rechazada por los datos (no por la conexión): quien escribe por
+    # lotes las captura para reintentar fila a fila
+    write_errors = ()
+
+    # Agregados de equipo materializados en cada empleado (team_stats); la interfaz los muestra si están activos
+    team_aggregates = False
+
+    def error_kind(self, error):
+        # CONFLICT, INVALID, UNAVAILABLE o FAILED si el error viene del almacén; None si no
+        return CONFLICT if isinstance(error, ConstraintViolation) else None
+
+#CONNECT
+
+    @abstractmethod
+    def close(self): ...
+
+    @abstractmethod
+    def warm_up(self, connections=None): ...
+
+    @abstractmethod
+    def ping(self): ...
+
+    @abstractmethod
+    def ensure_schema(self): ...
+
+    @abstractmethod
+    def metrics(self): ...
+
+    @abstractmethod
+    def cache_stats(self): ...
+
+#CREATE
+
+    @abstractmethod
+    def create_department(self, dept_no, dname, loc): ...
+
+    @abstractmethod
+    def create_employee(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no): ...
+
+    @abstractmethod
+    def create_employee_checked(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no): ...
+
+#BULK
+
+    @abstractmethod
+    def bulk_create_departments(self, rows, batch_size=BATCH_SIZE): ...
+
+    @abstractmethod
+    def bulk_create_employees(self, rows, batch_size=BATCH_SIZE): ...
+
+    @abstractmethod
+    def bulk_update_departments(self, rows, batch_size=BATCH_SIZE): ...
+
+    @abstractmethod
+    def bulk_update_employees(self, rows, batch_size=BATCH_SIZE): ...
+
+    @abstractmethod
+    def bulk_delete_departments(self, dept_nos, batch_size=BATCH_SIZE): ...
+
+    @abstractmethod
+    def bulk_delete_employees(self, emp_nos, batch_size=BATCH_SIZE): ...
+
+#READ
+
+    @abstractmethod
+    def read_department(self, dept_no): ...
+
+    @abstractmethod
+    def read_employee(self, emp_no): ...
+
+    @abstractmethod
+    def read_all_departments(self, as_tuples=False): ...
+
+    @abstractmethod
+    def read_all_employees(self, as_tuples=False): ...
+
+    @abstractmethod
+    def read_departments_page(self, after_dept_no=None, limit=PAGE_SIZE, as_tuples=False): ...
+
+    @abstractmethod
+    def read_employees_page(self, after_emp_no=None, limit=PAGE_SIZE, order_by='emp_no', after_key=None, as_tuples=False): ...
+
+    @abstractmethod
+    def search_employees(self, name_prefix=None, job=None, dept_no=None, min_sal=None, max_sal=None,
+                         hired_from=None, hired_to=None, text=None, after_emp_no=None, limit=PAGE_SIZE): ...
+
+    @abstractmethod
+    def iter_departments(self, fetch_size=FETCH_SIZE, as_tuples=False): ...
+
+    @abstractmethod
+    def iter_employees(self, fetch_size=FETCH_SIZE, as_tuples=False): ...
+
+#HIERARCHY
+
+    @abstractmethod
+    def reporting_chain(self, emp_no): ...
+
+    @abstractmethod
+    def subordinates(self, emp_no, max_depth=None): ...
+
+    @abstractmethod
+    def span_of_control(self, emp_no): ...
+
+#TEAMS
+
+    @abstractmethod
+    def team_stats(self, emp_nos): ...
+
+    @abstractmethod
+    def rebuild_team_aggregates(self, batch_size=BATCH_SIZE): ...
+
+#UPDATE
+
+    @abstractmethod
+    def update_department(self, dept_no, new_dname, new_loc): ...
+
+    @abstractmethod
+    def update_employee(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no): ...
+
+    @abstractmethod
+    def update_employee_checked(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no): ...
+
+#AGGREGATES
+
+    @abstractmethod
+    def department_stats(self): ...
+
+    @abstractmethod
+    def job_stats(self): ...
+
+    @abstractmethod
+    def hire_histogram(self, group_by='dept_no', interval='year'): ...
+
+#CHANGES
+
+    @abstractmethod
+    def changes_since(self, label, version=None, limit=CHANGE_LIMIT): ...
+
+    @abstractmethod
+    def mark_reset(self, label): ...
+
+    @abstractmethod
+    def prune_tombstones(self, label, up_to_version, batch_size=BATCH_SIZE): ...
+
+#DELETE
+
+    @abstractmethod
+    def delete_department(self, dept_no): ...
+
+    @abstractmethod
+    def delete_employee(self, emp_no): ...
+
+    @abstractmethod
+    def delete_department_if_empty(self, dept_no): ...
+
+    @abstractmethod
+    def delete_department_cascade(self, dept_no, batch_size=BATCH_SIZE, progress=None): ...
+
+    @abstractmethod
+    def delete_employees_where(self, name_prefix=None, job=None, dept_no=None, min_sal=None, max_sal=None,
+                               hired_from=None, hired_to=None, batch_size=BATCH_SIZE, progress=None): ...
+
+    @abstractmethod
+    def department_has_employees(self, dept_no): ...
+
+    @abstractmethod
+    def delete_all(self, batch_size=BATCH_SIZE, progress=None): ...
+
+#SCOTT
+
+    def insert_scott_D(self):
+        self.bulk_create_departments([
+            (10, 'ACCOUNTING', 'NEW YORK'),
+            (20, 'RESEARCH', 'DALLAS'),
+            (30, 'SALES', 'CHICAGO'),
+            (40, 'OPERATIONS', 'BOSTON'),
+        ])
+
+    def insert_scott_E(self):
+        self.bulk_create_employees([
+            (7369, 'SMITH', 'CLERK', 7902, datetime(1980, 12, 17), 800, None, 20),
+            (7499, 'ALLEN', 'SALESMAN', 7698, datetime(1981, 2, 20), 1600, 300, 30),
+            (7521, 'WARD', 'SALESMAN', 7698, datetime(1981, 2, 22), 1250, 500, 30),
+            (7566, 'JONES', 'MANAGER', 7839, datetime(1981, 4, 2), 2975, None, 20),
+            (7654, 'MARTIN', 'SALESMAN', 7698, datetime(1981, 9, 28), 1250, 1400, 30),
+            (7698, 'BLAKE', 'MANAGER', 7839, datetime(1981, 5, 1), 2850, None, 30),
+            (7782, 'CLARK', 'MANAGER', 7839, datetime(1981, 6, 9), 2450, None, 10),
+            (7788, 'SCOTT', 'ANALYST', 7566, datetime(1987, 7, 13), 3000, None, 20),
+            (7839, 'KING', 'PRESIDENT', None, datetime(1981, 11, 17), 5000, None, 10),
+            (7844, 'TURNER', 'SALESMAN', 7698, datetime(1981, 9, 8), 1500, 0, 30),
+            (7876, 'ADAMS', 'CLERK', 7788, datetime(1987, 7, 13), 1100, None, 20),
+            (7900, 'JAMES', 'CLERK', 7698, datetime(1981, 12, 3), 950, None, 30),
+            (7902, 'FORD', 'ANALYST', 7566, datetime(1981, 12, 3), 3000, None, 20),
+            (7934, 'MILLER', 'CLERK', 7782, datetime(1982, 1, 23), 1300, None, 10),
+        ])
@@ -0,0 +1,201 @@
+import asyncio
+from neo4j import AsyncGraphDatabase
+from almacen import BATCH_SIZE
+from crud import TRACKED, DELETE_ROUND_BATCHES
+from consultas import (CREATE_DEPARTMENT, ENSURE_DEPARTMENTS, CREATE_EMPLOYEE, READ_DEPARTMENT, READ_EMPLOYEE,
+                       READ_ALL_DEPARTMENTS, READ_ALL_EMPLOYEES, UPDATE_DEPARTMENT, UPDATE_EMPLOYEE, DELETE_DEPARTMENT,
+                       DELETE_EMPLOYEE, DEPARTMENT_HAS_EMPLOYEES, DELETE_ALL_RELATIONSHIPS, DELETE_ALL_NODES,
+                       MARK_RESET, REFRESH_TEAMS)
+from modelos import department_row, employee_row, employee_detail_row
+
+# Consultas simultáneas por defecto en las lecturas en abanico
+CONCURRENCY = 100
+
+
+async def gather_bounded(func, items, concurrency=CONCURRENCY):
+    # Aplica la corrutina func a cada elemento con como mucho `concurrency` llamadas en vuelo,
+    # devolviendo los resultados en el mismo orden que los elementos
+    items = list(items)
+    results = [None] * len(items)
+    pending = iter(enumerate(items))
+
+    async def worker():
+        for index, item in pending:
+            results[index] = await func(item)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(items)))))
+    return results
+
+
+class AsyncCRUD:
+    # Misma interfaz que CRUD pero sobre el driver asíncrono, para trabajos sin interfaz gráfica
+    # que necesitan muchas consultas en vuelo a la vez sobre un mismo pool de conexiones
+
+#CONNECT
+
+    def __init__(self, uri, user, password, max_connection_pool_size=CONCURRENCY, team_aggregates=False):
+        self._driver = AsyncGraphDatabase.driver(uri, auth=(user, password), max_connection_pool_size=max_connection_pool_size)
+        self.team_aggregates = team_aggregates
+
+    async def close(self):
+        await self._driver.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+#CREATE
+
+    async def create_department(self, dept_no, dname, loc):
+        async with self._driver.session() as session:
+            return await session.execute_write(self._create_department, dept_no, dname, loc)
+
+    @staticmethod
+    async def _create_department(tx, dept_no, dname, loc):
+        result = await tx.run(CREATE_DEPARTMENT, dept_no=dept_no, dname=dname, loc=loc)
+        return department_row((await result.single()).values())
+
+    async def create_employee(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
+        async with self._driver.session() as session:
+            return await session.execute_write(self._create_employee, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no, self.team_aggregates)
+
+    @staticmethod
+    async def _create_employee(tx, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no, teams=False):
+        # Mismas sentencias que CRUD (ver consultas.py), con el mismo seguimiento de cambios y agregados de equipo
+        await (await tx.run(ENSURE_DEPARTMENTS, dept_nos=[dept_no])).consume()
+        result = await tx.run(CREATE_EMPLOYEE, emp_no=emp_no, ename=ename, job=job, mgr=mgr, hire_date=hire_date, sal=sal, comm=comm, dept_no=dept_no)
+        employee = employee_row((await result.single()).values())
+        if teams:
+            await AsyncCRUD._refresh_teams(tx, [emp_no])
+        return employee
+
+    @staticmethod
+    async def _refresh_teams(tx, emp_nos):
+        emp_nos = list(dict.fromkeys(emp_no for emp_no in emp_nos if emp_no is not None))
+        if emp_nos:
+            await (await tx.run(REFRESH_TEAMS, emp_nos=emp_nos)).consume()
+
+#READ
+
+    async def read_department(self, dept_no):
+        async with self._driver.session() as session:
+            return await session.execute_read(self._read_department, dept_no)
+
+    @staticmethod
+    async def _read_department(tx, dept_no):
+        result = await tx.run(READ_DEPARTMENT, dept_no=dept_no)
+        record = await result.single()
+        return department_row(record.values()) if record else None
+
+    async def read_employee(self, emp_no):
+        async with self._driver.session() as session:
+            return await session.execute_read(self._read_employee, emp_no)
+
+    @staticmethod
+    async def _read_employee(tx, emp_no):
+        result = await tx.run(READ_EMPLOYEE, emp_no=emp_no)
+        record = await result.single()
+        return employee_detail_row(record.values()) if record else None
+
+    async def read_employees_many(self, emp_nos, concurrency=CONCURRENCY):
+        # Lectura en abanico: una consulta por empleado con concurrencia acotada
+        return await gather_bounded(self.read_employee, emp_nos, concurrency)
+
+    async def read_all_departments(self):
+        async with self._driver.session() as session:
+            return await session.execute_read(self._read_all_departments)
+
+    @staticmethod
+    async def _read_all_departments(tx):
+        result = await tx.run(READ_ALL_DEPARTMENTS)
+        return [department_row(record.values()) async for record in result]
+
+    async def read_all_employees(self):
+        async with self._driver.session() as session:
+            return await session.execute_read(self._read_all_employees)
+
+    @staticmethod
+    async def _read_all_employees(tx):
+        result = await tx.run(READ_ALL_EMPLOYEES)
+        return [employee_row(record.values()) async for record in result]
+
+#UPDATE
+
+    async def update_department(self, dept_no, new_dname, new_loc):
+        async with self._driver.session() as session:
+            return await session.execute_write(self._update_department, dept_no, new_dname, new_loc)
+
+    @staticmethod
+    async def _update_department(tx, dept_no, new_dname, new_loc):
+        result = await tx.run(UPDATE_DEPARTMENT, dept_no=dept_no, new_dname=new_dname, new_loc=new_loc)
+        record = await result.single()
+        return department_row(record.values()) if record else None
+
+    async def update_employee(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
+        async with self._driver.session() as session:
+            return await session.execute_write(self._update_employee, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no, self.team_aggregates)
+
+    @staticmethod
+    async def _update_employee(tx, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no, teams=False):
+        result = await tx.run(UPDATE_EMPLOYEE, emp_no=emp_no, new_ename=new_ename, new_job=new_job, new_mgr=new_mgr, new_hire_date=new_hire_date, new_sal=new_sal, new_comm=new_comm, new_dept_no=new_dept_no)
+        record = await result.single()
+        if record is None:
+            return None
+        if teams:
+            await AsyncCRUD._refresh_teams(tx, [record['old_mgr'] if record['old_mgr'] != new_mgr else None, emp_no])
+        return employee_row(record['e'])
+
+#DELETE
+
+    async def delete_department(self, dept_no):
+        async with self._driver.session() as session:
+            return await session.execute_write(self._delete_department, dept_no)
+
+    @staticmethod
+    async def _delete_department(tx, dept_no):
+        result = await tx.run(DELETE_DEPARTMENT, dept_no=dept_no)
+        return (await result.consume()).counters.nodes_deleted > 0
+
+    async def delete_employee(self, emp_no):
+        async with self._driver.session() as session:
+            return await session.execute_write(self._delete_employee, emp_no, self.team_aggregates)
+
+    @staticmethod
+    async def _delete_employee(tx, emp_no, teams=False):
+        result = await tx.run(DELETE_EMPLOYEE, emp_no=emp_no)
+        record = await result.single()
+        if record is None:
+            return False
+        if teams:
+            await AsyncCRUD._refresh_teams(tx, [record['mgr']])
+        return True
+
+    async def department_has_employees(self, dept_no):
+        async with self._driver.session() as session:
+            return await session.execute_read(self._department_has_employees, dept_no)
+
+    @staticmethod
+    async def _department_has_employees(tx, dept_no):
+        result = await tx.run(DEPARTMENT_HAS_EMPLOYEES, dept_no=dept_no)
+        return (await result.single())[0]
+
+#ALL
+
+    async def delete_all(self, batch_size=BATCH_SIZE):
+        # Como CRUD.delete_all: primero las relaciones y luego los nodos, con CALL { ... } IN TRANSACTIONS
+        # en transacciones implícitas, así ninguna transacción pasa de batch_size filas
+        limit = batch_size * DELETE_ROUND_BATCHES
+        report = {'nodes_deleted': 0, 'relationships_deleted': 0}
+        async with self._driver.session() as session:
+            for query, counter in ((DELETE_ALL_RELATIONSHIPS, 'relationships_deleted'), (DELETE_ALL_NODES, 'nodes_deleted')):
+                while True:
+                    counters = (await (await session.run(query, limit=limit, batch_size=batch_size)).consume()).counters
+                    report['nodes_deleted'] += counters.nodes_deleted
+                    report['relationships_deleted'] += counters.relationships_deleted
+                    if getattr(counters, counter) < limit:
+                        break
+            for label in TRACKED:
+                await (await session.run(MARK_RESET, label=label)).consume()
+        return report
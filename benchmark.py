@@ -0,0 +1,228 @@
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from almacen import BATCH_SIZE, PAGE_SIZE
+from config import load_config
+from crud import CRUD
+from memoria import MemoryCRUD
+
+# Banco de pruebas de rendimiento del CRUD contra una instancia local de Neo4j.
+# Genera un conjunto de datos con la forma del esquema SCOTT a la escala pedida, mide cada operación
+# y escribe throughput y percentiles de latencia en JSON. Con --baseline compara con una ejecución
+# anterior y termina con código 1 si alguna operación empeora más de la tolerancia.
+# Con --backend memory mide el almacén en memoria, como referencia de lo que cuesta cada operación
+# sin red ni motor de consultas.
+
+FIRST_EMP_NO = 1000
+FANOUT = 6  # subordinados directos por manager en los árboles generados
+
+LOCATIONS = ['NEW YORK', 'DALLAS', 'CHICAGO', 'BOSTON', 'SEATTLE', 'DENVER', 'MIAMI', 'ATLANTA']
+DEPARTMENT_NAMES = ['ACCOUNTING', 'RESEARCH', 'SALES', 'OPERATIONS', 'SUPPORT', 'LEGAL', 'MARKETING', 'FINANCE']
+
+# Salario mediano por puesto; el salario real sigue una lognormal alrededor de él
+MEDIAN_SAL = {'PRESIDENT': 5000, 'MANAGER': 2800, 'ANALYST': 3000, 'SALESMAN': 1400, 'CLERK': 1000}
+LEAF_JOBS = ['CLERK', 'SALESMAN', 'ANALYST']
+LEAF_WEIGHTS = [5, 3, 2]
+
+
+def dept_no_of(index):
+    return (index + 1) * 10
+
+
+def generate_departments(count):
+    for index in range(count):
+        name = DEPARTMENT_NAMES[index % len(DEPARTMENT_NAMES)]
+        if index >= len(DEPARTMENT_NAMES):
+            name = f"{name} {index // len(DEPARTMENT_NAMES)}"
+        yield (dept_no_of(index), name, LOCATIONS[index % len(LOCATIONS)])
+
+
+def generate_employees(count, departments, seed=0):
+    # Un presidente y, en cada departamento, un árbol de managers con FANOUT subordinados por nodo.
+    # Se genera de forma perezosa: los managers siempre salen antes que sus subordinados
+    rng = random.Random(seed)
+    start = datetime(1980, 1, 1)
+
+    def employee(emp_no, job, mgr, dept_no):
+        sal = round(MEDIAN_SAL[job] * rng.lognormvariate(0, 0.2))
+        comm = rng.choice([0, 300, 500, 1400]) if job == 'SALESMAN' else None
+        hire_date = start + timedelta(days=rng.randrange(3650))
+        return (emp_no, f"EMP{emp_no}", job, mgr, hire_date, sal, comm, dept_no)
+
+    if count <= 0:
+        return
+    president = FIRST_EMP_NO
+    yield employee(president, 'PRESIDENT', None, dept_no_of(0))
+
+    remaining = count - 1
+    emp_no = president + 1
+    for index in range(departments):
+        size = remaining // (departments - index)
+        remaining -= size
+        first = emp_no
+        for position in range(size):
+            if position == 0:
+                job, mgr = 'MANAGER', president
+            else:
+                mgr = first + (position - 1) // FANOUT
+                has_reports = position * FANOUT + 1 < size
+                job = 'MANAGER' if has_reports else rng.choices(LEAF_JOBS, LEAF_WEIGHTS)[0]
+            yield employee(emp_no, job, mgr, dept_no_of(index))
+            emp_no += 1
+
+
+def percentile(sorted_values, fraction):
+    # Percentil por rango más cercano
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        'count': len(latencies),
+        'total_s': round(total, 6),
+        'ops_per_s': round(len(latencies) / total, 2) if total else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def timed(operation, arguments):
+    latencies = []
+    for args in arguments:
+        started = time.perf_counter()
+        operation(*args)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def full_scan(crud):
+    after = None
+    while True:
+        page = crud.read_employees_page(after, PAGE_SIZE)
+        if not page:
+            return
+        after = page[-1].emp_no
+
+
+def load(crud, departments, employees, seed, batch_size):
+    crud.delete_all()
+    crud.ensure_schema()
+    started = time.perf_counter()
+    crud.bulk_create_departments(generate_departments(departments), batch_size)
+    crud.bulk_create_employees(generate_employees(employees, departments, seed), batch_size)
+    elapsed = time.perf_counter() - started
+    rows = departments + employees
+    return {'rows': rows, 'seconds': round(elapsed, 3), 'rows_per_s': round(rows / elapsed, 2) if elapsed else 0.0}
+
+
+def run(crud, departments, employees, ops, seed, batch_size=BATCH_SIZE, scans=3, do_load=True):
+    rng = random.Random(seed + 1)
+    report = {
+        'meta': {
+            'departments': departments,
+            'employees': employees,
+            'ops': ops,
+            'seed': seed,
+            'backend': 'memory' if isinstance(crud, MemoryCRUD) else 'neo4j',
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+        },
+        'operations': {},
+    }
+    if do_load:
+        report['load'] = load(crud, departments, employees, seed, batch_size)
+
+    emp_nos = [FIRST_EMP_NO + rng.randrange(employees) for _ in range(ops)]
+    dept_nos = [dept_no_of(rng.randrange(departments)) for _ in range(ops)]
+    new_emp_nos = range(FIRST_EMP_NO + employees, FIRST_EMP_NO + employees + ops)
+    hire_date = datetime(1990, 1, 1)
+    operations = report['operations']
+
+    operations['read_employee'] = timed(crud.read_employee, [(emp_no,) for emp_no in emp_nos])
+    operations['read_department'] = timed(crud.read_department, [(dept_no,) for dept_no in dept_nos])
+    operations['department_has_employees'] = timed(crud.department_has_employees, [(dept_no,) for dept_no in dept_nos])
+    operations['read_employees_page'] = timed(crud.read_employees_page, [(emp_no, PAGE_SIZE) for emp_no in emp_nos])
+    operations['search_employees'] = timed(crud.search_employees, [(f"EMP{emp_no // 10}",) for emp_no in emp_nos])
+    operations['read_all_departments'] = timed(crud.read_all_departments, [()] * scans)
+    operations['full_scan_employees'] = timed(full_scan, [(crud,)] * scans)
+    operations['create_employee'] = timed(crud.create_employee, [
+        (emp_no, f"NEW{emp_no}", 'CLERK', FIRST_EMP_NO, hire_date, 1000, None, dept_no)
+        for emp_no, dept_no in zip(new_emp_nos, dept_nos)
+    ])
+    operations['update_employee'] = timed(crud.update_employee, [
+        (emp_no, f"NEW{emp_no}", 'ANALYST', FIRST_EMP_NO, hire_date, 3000, None, dept_no)
+        for emp_no, dept_no in zip(new_emp_nos, dept_nos)
+    ])
+    operations['delete_employee'] = timed(crud.delete_employee, [(emp_no,) for emp_no in new_emp_nos])
+    return report
+
+
+def regressions(report, baseline, tolerance):
+    # Operaciones cuyo p95 empeora más de `tolerance` (fracción) respecto a la ejecución de referencia
+    found = []
+    for name, current in report['operations'].items():
+        previous = baseline.get('operations', {}).get(name)
+        if previous and previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            found.append({'operation': name, 'baseline_p95_ms': previous['p95_ms'], 'p95_ms': current['p95_ms']})
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del CRUD contra una instancia local de Neo4j")
+    parser.add_argument('--config', help="fichero de configuración (por defecto, CRUD_CONFIG o crud.ini)")
+    parser.add_argument('--uri', help="por defecto, el de la configuración")
+    parser.add_argument('--user', help="por defecto, el de la configuración")
+    parser.add_argument('--password', help="por defecto, la de la configuración")
+    parser.add_argument('--backend', choices=['neo4j', 'memory'], default='neo4j')
+    parser.add_argument('--departments', type=int, default=4)
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--ops', type=int, default=1000, help="repeticiones de cada operación puntual")
+    parser.add_argument('--scans', type=int, default=3, help="repeticiones de cada lectura completa")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--skip-load', action='store_true', help="reutiliza los datos de una carga anterior con la misma escala")
+    parser.add_argument('--output', help="fichero JSON de salida (por defecto, salida estándar)")
+    parser.add_argument('--baseline', help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="empeoramiento admitido del p95 (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    if args.backend == 'memory':
+        crud = MemoryCRUD()
+    else:
+        # De la configuración solo se toma la conexión: sin caché, para medir las consultas y no sus aciertos
+        config = load_config(args.config)
+        crud = CRUD(args.uri or config['uri'], args.user or config['user'], args.password or config['password'])
+    try:
+        report = run(crud, args.departments, args.employees, args.ops, args.seed, args.batch_size, args.scans, not args.skip_load)
+    finally:
+        crud.close()
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            report['regressions'] = regressions(report, json.load(file), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    if report.get('regressions'):
+        for regression in report['regressions']:
+            print(f"Regresión en {regression['operation']}: p95 {regression['baseline_p95_ms']} ms -> {regression['p95_ms']} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Marca para distinguir "no está en caché" de un valor None guardado
+MISSING = object()
+
+
+class TTLCache:
+    # Caché LRU con caducidad por tiempo, segura entre hilos
+    def __init__(self, max_size=1024, ttl=30.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # clave -> (instante de caducidad, valor)
+        self._lock = threading.Lock()
+        self._generation = 0  # aumenta con cada invalidación
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return MISSING
+            expires, value = entry
+            if expires <= self._clock():
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def generation(self):
+        # Se toma antes de leer de la base de datos y se pasa a put()
+        with self._lock:
+            return self._generation
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            # Si hubo una invalidación mientras se leía, el valor puede estar obsoleto y no se guarda
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
@@ -0,0 +1,226 @@
+import argparse
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from almacen import BATCH_SIZE, as_row
+from config import load_config
+from consultas import LOAD_EMPLOYEES, LOAD_EMPLOYEES_RETRY
+from crud import CRUD
+from intercambio import _Source, format_of, parse_department, parse_employee
+from modelos import EMPLOYEE_FIELDS
+
+# Carga en paralelo de una instantánea completa (departamentos y empleados) en Neo4j.
+# Los departamentos se escriben primero, en un solo hilo. Los empleados se reparten por dept_no en
+# tantas particiones como hilos: todo un departamento va siempre al mismo hilo, así dos escritores no
+# se disputan nunca el bloqueo de un mismo nodo Department. Cada hilo usa su propia sesión.
+# Para que los hilos no se serialicen en el contador de versiones (ChangeVersion) ni en los managers
+# de otras particiones, los empleados se escriben sin versión ni relaciones MANAGES; al terminar se
+# crean las MANAGES con migrate_manages() y se pide a los clientes que recarguen (mark_reset).
+#
+#   python cargador.py departamentos.csv empleados.csv --workers 8 --batch-size 2000
+
+# Errores tras los que se reintenta el lote: deadlocks y demás errores transitorios, y conexiones
+# perdidas. execute_write ya reintenta durante un tiempo; esto cubre lo que se le escape
+RETRYABLE = (TransientError, ServiceUnavailable, SessionExpired)
+
+MAX_RETRIES = 5
+BACKOFF_S = 0.2  # primera espera; se duplica en cada reintento, con variación aleatoria
+MAX_BACKOFF_S = 5.0
+
+# Lotes en cola por hilo: limita la memoria si el fichero se lee más rápido de lo que se escribe
+QUEUE_BATCHES = 4
+
+def _load_batch(session, rows, max_retries, stats):
+    # Tanto execute_write como _retrying vuelven a ejecutar el lote si se pierde la conexión, también
+    # cuando el commit sí llegó a hacerse: a partir del segundo intento se escribe con MERGE por emp_no
+    attempts = 0
+
+    def write(tx):
+        nonlocal attempts
+        attempts += 1
+        tx.run(LOAD_EMPLOYEES if attempts == 1 else LOAD_EMPLOYEES_RETRY, rows=rows).consume()
+
+    _retrying(lambda: session.execute_write(write), max_retries, stats)
+    return len(rows)
+
+
+def _retrying(write, max_retries, stats):
+    for attempt in range(max_retries + 1):
+        try:
+            return write()
+        except RETRYABLE:
+            if attempt == max_retries:
+                raise
+            stats['retries'] += 1
+            time.sleep(min(MAX_BACKOFF_S, BACKOFF_S * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+class _Partitions:
+    # Asigna cada dept_no nuevo a la partición con menos filas hasta ahora y agrupa las filas en lotes
+    def __init__(self, workers, batch_size, failed):
+        self.queues = [queue.Queue(QUEUE_BATCHES) for _ in range(workers)]
+        self.batch_size = batch_size
+        self.failed = failed
+        self.partition_of = {}
+        self.rows = [0] * workers
+        self.pending = [[] for _ in range(workers)]
+
+    def add(self, row):
+        partition = self.partition_of.get(row['dept_no'])
+        if partition is None:
+            partition = min(range(len(self.rows)), key=self.rows.__getitem__)
+            self.partition_of[row['dept_no']] = partition
+        self.rows[partition] += 1
+        self.pending[partition].append(row)
+        if len(self.pending[partition]) >= self.batch_size:
+            self._put(partition, self.pending[partition])
+            self.pending[partition] = []
+
+    def close(self):
+        # Lotes incompletos y una marca de fin por hilo
+        for partition, rows in enumerate(self.pending):
+            if rows:
+                self._put(partition, rows)
+            self._put(partition, None)
+
+    def _put(self, partition, batch):
+        # Si un hilo ha fallado no va a vaciar su cola: se deja de leer en lugar de bloquearse
+        while True:
+            try:
+                self.queues[partition].put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                if self.failed.is_set():
+                    raise RuntimeError("Carga interrumpida por un error en otro hilo")
+
+
+def _worker(crud, batches, max_retries, progress, stats, failed):
+    try:
+        with crud.session() as session:
+            while True:
+                # Si otro hilo o el lector fallan, nadie va a mandar la marca de fin
+                try:
+                    batch = batches.get(timeout=0.1)
+                except queue.Empty:
+                    if failed.is_set():
+                        return stats
+                    continue
+                if batch is None:
+                    return stats
+                started = time.perf_counter()
+                stats['rows'] += _load_batch(session, batch, max_retries, stats)
+                stats['batches'] += 1
+                stats['seconds'] += time.perf_counter() - started
+                if progress:
+                    progress(dict(stats))
+    except BaseException:
+        failed.set()
+        raise
+
+
+def load_departments(crud, rows, batch_size=BATCH_SIZE):
+    started = time.perf_counter()
+    results = crud.bulk_create_departments(rows, batch_size)
+    elapsed = time.perf_counter() - started
+    created = sum(result['nodes_created'] for result in results)
+    return {'rows': created, 'seconds': round(elapsed, 3), 'rows_per_s': round(created / elapsed, 2) if elapsed else 0.0}
+
+
+def load_employees(crud, rows, workers=4, batch_size=BATCH_SIZE, max_retries=MAX_RETRIES, progress=None):
+    # Devuelve totales y, por hilo, filas, lotes, reintentos, segundos escribiendo y filas/s
+    failed = threading.Event()
+    partitions = _Partitions(workers, batch_size, failed)
+    stats = [{'worker': index, 'rows': 0, 'batches': 0, 'retries': 0, 'seconds': 0.0} for index in range(workers)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cargador') as executor:
+        futures = [executor.submit(_worker, crud, partitions.queues[index], max_retries, progress, stats[index], failed)
+                   for index in range(workers)]
+        try:
+            for row in rows:
+                partitions.add(as_row(row, EMPLOYEE_FIELDS))
+            partitions.close()
+        except BaseException:
+            failed.set()
+            wait(futures)
+            # El error del hilo que falló explica mejor lo ocurrido que el del lector
+            for future in futures:
+                if future.exception():
+                    raise future.exception()
+            raise
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+    for worker in stats:
+        worker['partition_rows'] = partitions.rows[worker['worker']]
+        worker['rows_per_s'] = round(worker['rows'] / worker['seconds'], 2) if worker['seconds'] else 0.0
+        worker['seconds'] = round(worker['seconds'], 3)
+    total = sum(worker['rows'] for worker in stats)
+    return {
+        'rows': total,
+        'seconds': round(elapsed, 3),
+        'rows_per_s': round(total / elapsed, 2) if elapsed else 0.0,
+        'departments': len(partitions.partition_of),
+        'workers': stats,
+    }
+
+
+def load_snapshot(crud, departments, employees, workers=4, batch_size=BATCH_SIZE, max_retries=MAX_RETRIES, progress=None):
+    report = {'departments': load_departments(crud, departments, batch_size)}
+    report['employees'] = load_employees(crud, employees, workers, batch_size, max_retries, progress)
+    started = time.perf_counter()
+    report['manages'] = crud.migrate_manages(batch_size)
+    report['manages']['seconds'] = round(time.perf_counter() - started, 3)
+    for label in ('Department', 'Employee'):
+        crud.mark_reset(label)
+    crud.clear_cache()
+    return report
+
+
+def _parsed(path, parse, errors):
+    # Filas de un fichero de intercambio (CSV o JSONL); las que no se pueden leer solo se cuentan
+    for line_no, raw in _Source(path).rows(format_of(path)):
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            yield parse(raw)
+        except (ValueError, TypeError, AttributeError) as error:
+            errors.append({'path': path, 'line': line_no, 'error': str(error)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga en paralelo departamentos y empleados (CSV o JSONL) en Neo4j")
+    parser.add_argument('departments', help="fichero de departamentos")
+    parser.add_argument('employees', help="fichero de empleados")
+    parser.add_argument('--config', help="fichero de configuración (por defecto, CRUD_CONFIG o crud.ini)")
+    parser.add_argument('--workers', type=int, default=4, help="hilos escritores, cada uno con su sesión")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--max-retries', type=int, default=MAX_RETRIES, help="reintentos de un lote tras errores transitorios")
+    args = parser.parse_args(argv)
+
+    def show(worker):
+        print(f"\rhilo {worker['worker']}: {worker['rows']} filas", end='', file=sys.stderr)
+
+    # El pool tiene que dar al menos una conexión por hilo
+    config = load_config(args.config)
+    config['max_connection_pool_size'] = max(config['max_connection_pool_size'], args.workers + 1)
+    crud = CRUD(**config)
+    errors = []
+    try:
+        report = load_snapshot(crud, _parsed(args.departments, parse_department, errors),
+                               _parsed(args.employees, parse_employee, errors),
+                               args.workers, args.batch_size, args.max_retries, show)
+    finally:
+        crud.close()
+    report['errors'] = errors
+    print(file=sys.stderr)
+    print(json.dumps(report, indent=2))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
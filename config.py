@@ -0,0 +1,81 @@
+import configparser
+import os
+
+# Configuración de la conexión y del CRUD. Cada valor sale, por orden de prioridad, de una variable
+# de entorno CRUD_<NOMBRE EN MAYÚSCULAS>, de la sección [crud] del fichero de configuración
+# (CRUD_CONFIG o crud.ini en el directorio actual) o del valor por defecto. Las claves coinciden con
+# los argumentos de CRUD, así que CRUD(**load_config()) basta para crear el cliente.
+# La escritura diferida de la interfaz (diferido.py) se configura aparte, en la sección
+# [write_behind] o con variables CRUD_WRITE_BEHIND_<NOMBRE>: load_config(section=WRITE_BEHIND_SECTION,
+# defaults=WRITE_BEHIND). El almacén se elige en [storage] (CRUD_STORAGE_<NOMBRE>): con backend = memory
+# no hace falta un servidor Neo4j (ver almacen.open_storage)
+
+CONFIG_FILE = 'crud.ini'
+SECTION = 'crud'
+ENV_PREFIX = 'CRUD_'
+
+DEFAULTS = {
+    'uri': 'bolt://localhost:7687',
+    'user': 'neo4j',
+    'password': '12345678',
+    # Pool de conexiones del driver
+    'max_connection_pool_size': 100,
+    'connection_acquisition_timeout': 60.0,  # segundos esperando una conexión libre del pool
+    'fetch_size': 1000,  # registros por viaje al leer resultados
+    'keep_alive': True,
+    'liveness_check_timeout': None,  # segundos ociosa tras los que se comprueba una conexión antes de usarla
+    # Caché de lecturas por clave (0 la desactiva)
+    'cache_size': 10000,
+    'cache_ttl': 30.0,
+    # Agregados de equipo materializados en cada empleado (ver CRUD.team_stats)
+    'team_aggregates': False,
+}
+
+WRITE_BEHIND_SECTION = 'write_behind'
+
+WRITE_BEHIND = {
+    'enabled': False,
+    'max_pending': 100,  # operaciones pendientes que provocan un volcado
+    'flush_interval': 2.0,  # segundos como mucho entre una edición y su volcado
+}
+
+STORAGE_SECTION = 'storage'
+
+STORAGE = {
+    'backend': 'neo4j',  # neo4j o memory
+    'snapshot': None,  # fichero del almacén en memoria: se carga al abrir y se guarda al cerrar
+}
+
+# Tipo de los valores cuyo defecto es None
+TYPES = {'liveness_check_timeout': float, 'snapshot': str}
+
+
+def _convert(name, text, defaults):
+    kind = TYPES.get(name) or type(defaults[name])
+    if text.strip().lower() in ('', 'none'):
+        return None
+    if kind is bool:
+        if text.strip().lower() in ('1', 'true', 'yes', 'si', 'sí', 'on'):
+            return True
+        if text.strip().lower() in ('0', 'false', 'no', 'off'):
+            return False
+        raise ValueError(f"Valor no válido para {name}: {text}")
+    return kind(text)
+
+
+def load_config(path=None, environ=None, section=SECTION, defaults=DEFAULTS):
+    environ = os.environ if environ is None else environ
+    path = path or environ.get(ENV_PREFIX + 'CONFIG', CONFIG_FILE)
+    prefix = ENV_PREFIX if section == SECTION else ENV_PREFIX + section.upper() + '_'
+    config = dict(defaults)
+    parser = configparser.ConfigParser()
+    if parser.read(path) and parser.has_section(section):
+        for name, text in parser.items(section):
+            if name not in defaults:
+                raise ValueError(f"Opción desconocida en {path}: {name}")
+            config[name] = _convert(name, text, defaults)
+    for name in defaults:
+        text = environ.get(prefix + name.upper())
+        if text is not None:
+            config[name] = _convert(name, text, defaults)
+    return config
@@ -0,0 +1,656 @@
+from datetime import datetime
+from modelos import DEPARTMENT_FIELDS, EMPLOYEE_FIELDS, TEAM_FIELDS
+
+# Registro de las sentencias Cypher del CRUD (crud.py, async_crud.py y cargador.py). Las fijas son
+# constantes; las que cambian según los argumentos (filtros, orden, profundidad) se construyen con las
+# funciones de más abajo. QUERIES reúne todas, con todas sus variantes y unos parámetros de ejemplo,
+# para que verificar_planes.py compruebe con EXPLAIN que cada una sigue usando sus índices
+
+# Restricciones e índices sobre las claves que usan las consultas (nombre, sentencia idempotente)
+SCHEMA = [
+    ('department_dept_no', "CREATE CONSTRAINT department_dept_no IF NOT EXISTS FOR (d:Department) REQUIRE d.dept_no IS UNIQUE"),
+    ('employee_emp_no', "CREATE CONSTRAINT employee_emp_no IF NOT EXISTS FOR (e:Employee) REQUIRE e.emp_no IS UNIQUE"),
+    ('employee_dept_no', "CREATE RANGE INDEX employee_dept_no IF NOT EXISTS FOR (e:Employee) ON (e.dept_no)"),
+    ('employee_mgr', "CREATE RANGE INDEX employee_mgr IF NOT EXISTS FOR (e:Employee) ON (e.mgr)"),
+    ('employee_job', "CREATE RANGE INDEX employee_job IF NOT EXISTS FOR (e:Employee) ON (e.job)"),
+    ('employee_ename', "CREATE RANGE INDEX employee_ename IF NOT EXISTS FOR (e:Employee) ON (e.ename)"),
+    ('employee_sal', "CREATE RANGE INDEX employee_sal IF NOT EXISTS FOR (e:Employee) ON (e.sal)"),
+    ('employee_hire_date', "CREATE RANGE INDEX employee_hire_date IF NOT EXISTS FOR (e:Employee) ON (e.hire_date)"),
+    ('employee_text', "CREATE FULLTEXT INDEX employee_text IF NOT EXISTS FOR (e:Employee) ON EACH [e.ename, e.job]"),
+    ('change_version_label', "CREATE CONSTRAINT change_version_label IF NOT EXISTS FOR (v:ChangeVersion) REQUIRE v.label IS UNIQUE"),
+    ('department_version', "CREATE RANGE INDEX department_version IF NOT EXISTS FOR (d:Department) ON (d._version)"),
+    ('employee_version', "CREATE RANGE INDEX employee_version IF NOT EXISTS FOR (e:Employee) ON (e._version)"),
+    ('tombstone_label_version', "CREATE RANGE INDEX tombstone_label_version IF NOT EXISTS FOR (t:Tombstone) ON (t.label, t._version)"),
+]
+
+
+def _columns(var, fields):
+    # Proyección de las propiedades como columnas: RETURN e.emp_no AS emp_no, ...
+    return ', '.join(f"{var}.{field} AS {field}" for field in fields)
+
+
+def _values(var, fields):
+    # La misma proyección como lista, para devolverla en una sola columna junto a otras
+    return '[' + ', '.join(f"{var}.{field}" for field in fields) + ']'
+
+
+DEPARTMENT_COLUMNS = _columns('d', DEPARTMENT_FIELDS)
+EMPLOYEE_COLUMNS = _columns('e', EMPLOYEE_FIELDS)
+
+
+# Seguimiento de cambios: cada escritura sube en su misma transacción el contador (:ChangeVersion) de
+# la etiqueta y guarda el nuevo valor en la propiedad _version de lo que escribe; los borrados dejan un
+# (:Tombstone). Ver CRUD.changes_since
+def _next_version(label):
+    # Prefijo de las escrituras: deja la nueva versión en `version`. El contador queda bloqueado hasta
+    # el commit, así las versiones de una etiqueta se confirman en orden
+    return f"""
+            MERGE (v:ChangeVersion {{label: '{label}'}})
+            SET v.version = coalesce(v.version, 0) + 1
+            WITH v.version AS version
+    """
+
+
+def _tombstone(label, key):
+    return f"CREATE (:Tombstone {{label: '{label}', key: {key}, _version: version}})"
+
+
+def _sync_manages(*carry):
+    # Fragmento de Cypher que deja las relaciones MANAGES de `e` de acuerdo con las propiedades mgr:
+    # quita la entrante si el manager cambió, crea la del manager actual y enlaza a los empleados que
+    # ya tenían a `e` como manager. `carry` son las variables que deben seguir disponibles después
+    extra = ''.join(', ' + name for name in carry)
+    return f"""
+            WITH e{extra}
+            OPTIONAL MATCH (boss:Employee)-[r:MANAGES]->(e) WHERE boss.emp_no <> coalesce(e.mgr, -1)
+            DELETE r
+            WITH DISTINCT e{extra}
+            OPTIONAL MATCH (m:Employee {{emp_no: e.mgr}})
+            FOREACH (manager IN CASE WHEN m IS NULL THEN [] ELSE [m] END | MERGE (manager)-[:MANAGES]->(e))
+            WITH e{extra}
+            OPTIONAL MATCH (s:Employee {{mgr: e.emp_no}})
+            WITH e{extra}, collect(s) AS subordinates
+            FOREACH (s IN subordinates | MERGE (e)-[:MANAGES]->(s))
+    """
+
+
+# Condiciones sobre `e` de search_employees y delete_employees_where, por nombre de parámetro
+EMPLOYEE_FILTERS = {
+    'name_prefix': "e.ename STARTS WITH $name_prefix",
+    'job': "e.job = $job",
+    'dept_no': "e.dept_no = $dept_no",
+    'min_sal': "e.sal >= $min_sal",
+    'max_sal': "e.sal <= $max_sal",
+    'hired_from': "e.hire_date >= $hired_from",
+    'hired_to': "e.hire_date <= $hired_to",
+}
+
+
+def _filter_conditions(filters):
+    # Solo se incluyen las condiciones con valor, así el planificador puede elegir el índice adecuado
+    return [condition for name, condition in EMPLOYEE_FILTERS.items() if filters.get(name) is not None]
+
+#CONNECT
+
+PING = "RETURN 1"
+
+#CREATE
+
+CREATE_DEPARTMENT = _next_version('Department') + "CREATE (d:Department {dept_no: $dept_no, dname: $dname, loc: $loc, _version: version}) RETURN " + DEPARTMENT_COLUMNS
+
+# Crea los departamentos que falten al escribir empleados, con una sola versión para todos ellos
+ENSURE_DEPARTMENTS = """
+    UNWIND $dept_nos AS dept_no
+    MERGE (d:Department {dept_no: dept_no})
+    ON CREATE SET d._new = true
+    WITH d WHERE d._new
+    WITH collect(d) AS created WHERE size(created) > 0
+    MERGE (v:ChangeVersion {label: 'Department'})
+    SET v.version = coalesce(v.version, 0) + 1
+    FOREACH (d IN created | SET d._version = v.version REMOVE d._new)
+"""
+
+CREATE_EMPLOYEE = _next_version('Employee') + """
+    MATCH (d:Department {dept_no: $dept_no})
+    CREATE (e:Employee {
+        emp_no: $emp_no,
+        ename: $ename,
+        job: $job,
+        mgr: $mgr,
+        hire_date: $hire_date,
+        sal: $sal,
+        comm: $comm,
+        dept_no: $dept_no,
+        _version: version
+    })
+    MERGE (e)-[:WORKS_IN]->(d)
+""" + _sync_manages() + """
+    RETURN """ + EMPLOYEE_COLUMNS
+
+# Si la cadena del manager acaba en un mgr que apunta al emp_no nuevo, crearlo cerraría un ciclo
+CREATE_EMPLOYEE_CHECKED = _next_version('Employee') + """
+    OPTIONAL MATCH (x:Employee {emp_no: $emp_no})
+    OPTIONAL MATCH (d:Department {dept_no: $dept_no})
+    OPTIONAL MATCH (m:Employee {emp_no: $mgr})
+    WITH d, version, CASE
+        WHEN x IS NOT NULL THEN 'duplicate'
+        WHEN d IS NULL THEN 'missing_department'
+        WHEN $mgr IS NOT NULL AND m IS NULL THEN 'missing_manager'
+        WHEN m IS NOT NULL AND EXISTS { MATCH (m)<-[:MANAGES*0..]-(top:Employee) WHERE top.mgr = $emp_no } THEN 'cycle'
+        ELSE 'ok'
+    END AS status
+    CALL {
+        WITH d, status, version
+        WITH d, status, version WHERE status = 'ok'
+        CREATE (e:Employee {
+            emp_no: $emp_no,
+            ename: $ename,
+            job: $job,
+            mgr: $mgr,
+            hire_date: $hire_date,
+            sal: $sal,
+            comm: $comm,
+            dept_no: $dept_no,
+            _version: version
+        })-[:WORKS_IN]->(d)
+    """ + _sync_manages() + """
+        RETURN collect(e) AS created
+    }
+    RETURN status, [x IN created | """ + _values('x', EMPLOYEE_FIELDS) + """][0] AS e
+"""
+
+#BULK
+
+# Todo el lote comparte una versión
+BULK_CREATE_DEPARTMENTS = _next_version('Department') + """
+    UNWIND $rows AS row
+    CREATE (d:Department {dept_no: row.dept_no, dname: row.dname, loc: row.loc, _version: version})
+"""
+
+BULK_CREATE_EMPLOYEES = _next_version('Employee') + """
+    UNWIND $rows AS row
+    MATCH (d:Department {dept_no: row.dept_no})
+    CREATE (e:Employee {
+        emp_no: row.emp_no,
+        ename: row.ename,
+        job: row.job,
+        mgr: row.mgr,
+        hire_date: row.hire_date,
+        sal: row.sal,
+        comm: row.comm,
+        dept_no: row.dept_no,
+        _version: version
+    })
+    CREATE (e)-[:WORKS_IN]->(d)
+""" + _sync_manages()
+
+BULK_UPDATE_DEPARTMENTS = _next_version('Department') + """
+    UNWIND $rows AS row
+    MATCH (d:Department {dept_no: row.dept_no})
+    SET d.dname = row.dname, d.loc = row.loc, d._version = version
+    RETURN d.dept_no AS dept_no
+"""
+
+BULK_UPDATE_EMPLOYEES = _next_version('Employee') + """
+    UNWIND $rows AS row
+    MATCH (e:Employee {emp_no: row.emp_no})
+    MATCH (d:Department {dept_no: row.dept_no})
+    WHERE row.mgr IS NULL OR (EXISTS { MATCH (:Employee {emp_no: row.mgr}) }
+                              AND NOT EXISTS { MATCH (e)-[:MANAGES*0..]->(:Employee {emp_no: row.mgr}) })
+    WITH e, d, row, version, e.dept_no AS old_dept_no, e.mgr AS old_mgr
+    SET e.ename = row.ename, e.job = row.job, e.mgr = row.mgr, e.hire_date = row.hire_date,
+        e.sal = row.sal, e.comm = row.comm, e.dept_no = row.dept_no, e._version = version
+    WITH e, d, old_dept_no, old_mgr
+    OPTIONAL MATCH (e)-[w:WORKS_IN]->(old:Department) WHERE old <> d
+    DELETE w
+    MERGE (e)-[:WORKS_IN]->(d)
+""" + _sync_manages('old_dept_no', 'old_mgr') + """
+    RETURN e.emp_no AS emp_no, old_dept_no, e.dept_no AS dept_no, old_mgr
+"""
+
+BULK_DELETE_DEPARTMENTS = _next_version('Department') + """
+    UNWIND $dept_nos AS dept_no
+    MATCH (d:Department {dept_no: dept_no})
+    SET d._lock = true
+    REMOVE d._lock
+    WITH d, dept_no, version WHERE NOT EXISTS { (:Employee)-[:WORKS_IN]->(d) }
+    DETACH DELETE d
+    """ + _tombstone('Department', 'dept_no') + """
+    RETURN dept_no
+"""
+
+BULK_DELETE_EMPLOYEES = _next_version('Employee') + """
+    UNWIND $emp_nos AS emp_no
+    MATCH (e:Employee {emp_no: emp_no})
+    WITH e, emp_no, e.dept_no AS dept_no, e.mgr AS mgr, version
+    DETACH DELETE e
+    """ + _tombstone('Employee', 'emp_no') + """
+    RETURN emp_no, dept_no, mgr
+"""
+
+# Carga en paralelo (cargador.py): crea los departamentos que falten en la partición y los empleados
+# del lote, sin versión ni relaciones MANAGES para que los hilos no se disputen bloqueos
+LOAD_EMPLOYEES = """
+    UNWIND $rows AS row
+    MERGE (d:Department {dept_no: row.dept_no})
+    CREATE (e:Employee {
+        emp_no: row.emp_no,
+        ename: row.ename,
+        job: row.job,
+        mgr: row.mgr,
+        hire_date: row.hire_date,
+        sal: row.sal,
+        comm: row.comm,
+        dept_no: row.dept_no
+    })-[:WORKS_IN]->(d)
+"""
+
+# El mismo lote cuando se reintenta: si se perdió la confirmación de un commit que sí se hizo, CREATE
+# fallaría con la restricción de unicidad; con MERGE por emp_no el lote queda escrito una sola vez
+LOAD_EMPLOYEES_RETRY = """
+    UNWIND $rows AS row
+    MERGE (d:Department {dept_no: row.dept_no})
+    MERGE (e:Employee {emp_no: row.emp_no})
+    SET e.ename = row.ename,
+        e.job = row.job,
+        e.mgr = row.mgr,
+        e.hire_date = row.hire_date,
+        e.sal = row.sal,
+        e.comm = row.comm,
+        e.dept_no = row.dept_no
+    MERGE (e)-[:WORKS_IN]->(d)
+"""
+
+#READ
+
+READ_DEPARTMENT = "MATCH (d:Department {dept_no: $dept_no}) RETURN " + DEPARTMENT_COLUMNS
+
+READ_EMPLOYEE = """
+    MATCH (e:Employee {emp_no: $emp_no})-[:WORKS_IN]->(d:Department)
+    RETURN """ + EMPLOYEE_COLUMNS + ", d.dname AS department_name"
+
+READ_ALL_DEPARTMENTS = "MATCH (d:Department) RETURN " + DEPARTMENT_COLUMNS + " ORDER BY dept_no"
+
+READ_ALL_EMPLOYEES = "MATCH (e:Employee) RETURN " + EMPLOYEE_COLUMNS
+
+# Lecturas en streaming para exportar. El filtro IS NOT NULL permite ordenar con el índice único
+ITER_DEPARTMENTS = "MATCH (d:Department) WHERE d.dept_no IS NOT NULL RETURN " + DEPARTMENT_COLUMNS + " ORDER BY dept_no"
+
+ITER_EMPLOYEES = "MATCH (e:Employee) WHERE e.emp_no IS NOT NULL RETURN " + EMPLOYEE_COLUMNS + " ORDER BY emp_no"
+
+
+# Paginación por clave (keyset): cada página empieza justo después de la última fila de la anterior
+def departments_page_query(after):
+    where = "d.dept_no IS NOT NULL" if not after else "d.dept_no > $after_dept_no"
+    return f"MATCH (d:Department) WHERE {where} RETURN {DEPARTMENT_COLUMNS} ORDER BY d.dept_no LIMIT $limit"
+
+
+def employees_page_query(order_by, after):
+    # Si se ordena por otra clave, el cursor es (after_key, after_emp_no) para desempatar
+    if order_by == 'emp_no':
+        where = "e.emp_no IS NOT NULL" if not after else "e.emp_no > $after_emp_no"
+        order = "e.emp_no"
+    else:
+        if not after:
+            where = f"e.{order_by} IS NOT NULL"
+        else:
+            # El rango inicial sobre la clave es el que busca en el índice; el OR solo descarta las filas
+            # con la misma clave ya vistas. Con el OR delante, cada página recorría el índice desde el principio
+            where = f"e.{order_by} >= $after_key AND (e.{order_by} > $after_key OR e.emp_no > $after_emp_no)"
+        order = f"e.{order_by}, e.emp_no"
+    return f"MATCH (e:Employee) WHERE {where} RETURN {EMPLOYEE_COLUMNS} ORDER BY {order} LIMIT $limit"
+
+
+def search_employees_query(filters, after):
+    # `filters['text']` ya es una consulta de Lucene: busca con el índice de texto completo
+    where = _filter_conditions(filters)
+    where.append("e.emp_no IS NOT NULL" if not after else "e.emp_no > $after_emp_no")
+    if filters.get('text'):
+        match = "CALL db.index.fulltext.queryNodes('employee_text', $text) YIELD node AS e"
+    else:
+        match = "MATCH (e:Employee)"
+    return f"{match} WHERE {' AND '.join(where)} RETURN {EMPLOYEE_COLUMNS} ORDER BY e.emp_no LIMIT $limit"
+
+#HIERARCHY
+
+# Las sentencias con CALL { ... } IN TRANSACTIONS tienen que ir en transacciones implícitas
+MIGRATE_MANAGES_CREATE = """
+    MATCH (e:Employee) WHERE e.mgr IS NOT NULL
+    CALL {
+        WITH e
+        MATCH (m:Employee {emp_no: e.mgr})
+        MERGE (m)-[:MANAGES]->(e)
+    } IN TRANSACTIONS OF $batch_size ROWS
+"""
+
+MIGRATE_MANAGES_DELETE = """
+    MATCH (m:Employee)-[r:MANAGES]->(e:Employee)
+    WHERE e.mgr IS NULL OR e.mgr <> m.emp_no
+    CALL {
+        WITH r
+        DELETE r
+    } IN TRANSACTIONS OF $batch_size ROWS
+"""
+
+REPORTING_CHAIN = """
+    MATCH p = (e:Employee {emp_no: $emp_no})<-[:MANAGES*1..]-(m:Employee)
+    RETURN """ + _columns('m', EMPLOYEE_FIELDS) + """ ORDER BY length(p)
+"""
+
+
+def subordinates_query(max_depth):
+    # La profundidad máxima no se puede pasar como parámetro en un patrón de longitud variable
+    depth = f"1..{int(max_depth)}" if max_depth is not None else "1.."
+    return f"""
+        MATCH p = (m:Employee {{emp_no: $emp_no}})-[:MANAGES*{depth}]->(s:Employee)
+        RETURN {_values('s', EMPLOYEE_FIELDS)} AS employee, length(p) AS depth ORDER BY depth, s.emp_no
+    """
+
+
+SPAN_OF_CONTROL = """
+    MATCH (m:Employee {emp_no: $emp_no})
+    OPTIONAL MATCH (m)-[:MANAGES]->(direct:Employee)
+    WITH m, count(direct) AS direct_reports
+    OPTIONAL MATCH p = (m)-[:MANAGES*1..]->(s:Employee)
+    RETURN direct_reports, count(DISTINCT s) AS total_reports, coalesce(max(length(p)), 0) AS depth
+"""
+
+#TEAMS
+
+# Agregados de equipo materializados en cada empleado (opcionales, ver CRUD(team_aggregates=True)):
+# team_size cuenta al empleado y a todos los que tiene por debajo, team_pay suma su sal + comm y la de
+# todos ellos, y team_depth es la profundidad de su subárbol (0 si no tiene subordinados)
+TEAM_COLUMNS = _columns('e', ('emp_no',) + TEAM_FIELDS)
+
+# Recalcula desde cada emp_no hacia arriba: cada empleado de la cadena se calcula con los valores
+# guardados de sus subordinados directos, salvo el que queda por debajo en la cadena, cuyo valor se
+# acaba de calcular en la misma sentencia. Solo recorre la cadena de managers y sus hijos directos, no
+# los subárboles. Las claves se procesan en orden y cada una ve lo escrito por las anteriores, así que
+# basta con pasar primero el manager anterior de quien cambia de manager y luego al propio empleado
+REFRESH_TEAMS = """
+    UNWIND $emp_nos AS emp_no
+    CALL {
+        WITH emp_no
+        MATCH p = (:Employee {emp_no: emp_no})<-[:MANAGES*0..]-(a:Employee)
+        WITH a, length(p) AS distance, CASE WHEN length(p) = 0 THEN null ELSE nodes(p)[-2] END AS below
+        OPTIONAL MATCH (a)-[:MANAGES]->(c:Employee) WHERE below IS NULL OR c <> below
+        WITH a, distance, sum(c.team_size) AS others_size, sum(c.team_pay) AS others_pay, max(c.team_depth) AS others_depth
+        ORDER BY distance
+        WITH collect({node: a, size: others_size, pay: others_pay, depth: others_depth}) AS chain
+        WITH reduce(totals = [], link IN chain | totals + [{
+            node: link.node,
+            team_size: 1 + link.size + coalesce(last(totals).team_size, 0),
+            team_pay: coalesce(link.node.sal, 0) + coalesce(link.node.comm, 0) + link.pay + coalesce(last(totals).team_pay, 0),
+            team_depth: CASE
+                WHEN size(totals) = 0 THEN coalesce(link.depth + 1, 0)
+                WHEN link.depth > last(totals).team_depth THEN link.depth + 1
+                ELSE last(totals).team_depth + 1
+            END
+        }]) AS totals
+        UNWIND totals AS total
+        WITH total.node AS a, total
+        SET a.team_size = total.team_size, a.team_pay = total.team_pay, a.team_depth = total.team_depth
+        RETURN count(*) AS refreshed
+    }
+    RETURN sum(refreshed) AS refreshed
+"""
+
+# Reconstrucción completa, para reparar o activar los agregados sobre datos ya cargados
+REBUILD_TEAMS = """
+    MATCH (e:Employee)
+    CALL {
+        WITH e
+        MATCH p = (e)-[:MANAGES*0..]->(s:Employee)
+        WITH e, count(s) AS team_size, sum(coalesce(s.sal, 0) + coalesce(s.comm, 0)) AS team_pay, max(length(p)) AS team_depth
+        SET e.team_size = team_size, e.team_pay = team_pay, e.team_depth = team_depth
+    } IN TRANSACTIONS OF $batch_size ROWS
+"""
+
+TEAM_STATS = """
+    UNWIND $emp_nos AS emp_no
+    MATCH (e:Employee {emp_no: emp_no})
+    RETURN """ + TEAM_COLUMNS + """
+"""
+
+#UPDATE
+
+UPDATE_DEPARTMENT = _next_version('Department') + "MATCH (d:Department {dept_no: $dept_no}) SET d.dname = $new_dname, d.loc = $new_loc, d._version = version RETURN " + DEPARTMENT_COLUMNS
+
+# Devuelve también el departamento anterior para poder invalidar la caché con precisión, y el manager
+# anterior para recalcular los agregados de equipo de su cadena
+UPDATE_EMPLOYEE = (_next_version('Employee') + "MATCH (e:Employee {emp_no: $emp_no}) WITH e, e.dept_no AS old_dept_no, e.mgr AS old_mgr, version SET e.ename = $new_ename, e.job = $new_job, e.mgr = $new_mgr, e.hire_date = $new_hire_date, e.sal = $new_sal, e.comm = $new_comm, e.dept_no = $new_dept_no, e._version = version"
+                   + _sync_manages('old_dept_no', 'old_mgr') + "RETURN " + _values('e', EMPLOYEE_FIELDS) + " AS e, old_dept_no, old_mgr")
+
+# Además de las propiedades, mueve la relación WORKS_IN si cambia el departamento. No acepta como
+# manager al propio empleado ni a nadie por debajo de él, que cerraría un ciclo en MANAGES
+UPDATE_EMPLOYEE_CHECKED = _next_version('Employee') + """
+    OPTIONAL MATCH (e:Employee {emp_no: $emp_no})
+    OPTIONAL MATCH (d:Department {dept_no: $new_dept_no})
+    OPTIONAL MATCH (m:Employee {emp_no: $new_mgr})
+    WITH e, d, version, e.dept_no AS old_dept_no, e.mgr AS old_mgr, CASE
+        WHEN e IS NULL THEN 'not_found'
+        WHEN d IS NULL THEN 'missing_department'
+        WHEN $new_mgr IS NOT NULL AND m IS NULL THEN 'missing_manager'
+        WHEN m IS NOT NULL AND EXISTS { MATCH (e)-[:MANAGES*0..]->(m) } THEN 'cycle'
+        ELSE 'ok'
+    END AS status
+    CALL {
+        WITH e, d, status, version
+        WITH e, d, status, version WHERE status = 'ok'
+        SET e.ename = $new_ename, e.job = $new_job, e.mgr = $new_mgr, e.hire_date = $new_hire_date,
+            e.sal = $new_sal, e.comm = $new_comm, e.dept_no = $new_dept_no, e._version = version
+        WITH e, d
+        OPTIONAL MATCH (e)-[w:WORKS_IN]->(old:Department) WHERE old <> d
+        DELETE w
+        MERGE (e)-[:WORKS_IN]->(d)
+    """ + _sync_manages() + """
+        RETURN collect(e) AS updated
+    }
+    RETURN status, old_dept_no, old_mgr, [x IN updated | """ + _values('x', EMPLOYEE_FIELDS) + """][0] AS e
+"""
+
+#AGGREGATES
+
+DEPARTMENT_STATS = """
+    MATCH (d:Department)
+    OPTIONAL MATCH (e:Employee)-[:WORKS_IN]->(d)
+    RETURN d.dept_no AS dept_no, d.dname AS dname, count(e) AS headcount,
+           sum(e.sal) AS total_sal, avg(e.sal) AS avg_sal, min(e.sal) AS min_sal, max(e.sal) AS max_sal,
+           sum(coalesce(e.comm, 0)) AS total_comm
+    ORDER BY dept_no
+"""
+
+JOB_STATS = """
+    MATCH (e:Employee)
+    RETURN e.job AS job, count(e) AS headcount,
+           sum(e.sal) AS total_sal, avg(e.sal) AS avg_sal, min(e.sal) AS min_sal, max(e.sal) AS max_sal,
+           sum(coalesce(e.comm, 0)) AS total_comm
+    ORDER BY job
+"""
+
+
+def hire_histogram_query(group_by, interval):
+    # date() acepta tanto fechas como cadenas ISO, que es como quedaban guardadas algunas actualizaciones
+    period = "toString(date(e.hire_date).year)"
+    if interval == 'month':
+        period = "toString(date(e.hire_date).year) + '-' + right('0' + toString(date(e.hire_date).month), 2)"
+    return f"""
+        MATCH (e:Employee) WHERE e.hire_date IS NOT NULL
+        RETURN e.{group_by} AS group, {period} AS period, count(e) AS hires
+        ORDER BY group, period
+    """
+
+#CHANGES
+
+CHANGE_VERSION = "MATCH (v:ChangeVersion {label: $label}) RETURN v.version AS version, coalesce(v.reset_at, 0) AS reset_at"
+
+# Etiqueta con seguimiento de cambios -> (variable, clave, proyección)
+TRACKED_QUERIES = {
+    'Department': ('d', 'dept_no', DEPARTMENT_COLUMNS),
+    'Employee': ('e', 'emp_no', EMPLOYEE_COLUMNS),
+}
+
+
+def changed_rows_query(label):
+    var, key, columns = TRACKED_QUERIES[label]
+    return f"MATCH ({var}:{label}) WHERE {var}._version > $version RETURN {columns} ORDER BY {var}._version LIMIT $limit"
+
+
+def deleted_keys_query(label):
+    # Una clave borrada y vuelta a crear aparece solo como cambiada
+    var, key, columns = TRACKED_QUERIES[label]
+    return f"""
+        MATCH (t:Tombstone {{label: $label}}) WHERE t._version > $version
+          AND NOT EXISTS {{ MATCH (:{label} {{{key}: t.key}}) }}
+        RETURN DISTINCT t.key AS key
+    """
+
+
+MARK_RESET = """
+    MERGE (v:ChangeVersion {label: $label})
+    SET v.version = coalesce(v.version, 0) + 1
+    SET v.reset_at = v.version
+    RETURN v.version AS version
+"""
+
+RAISE_RESET_AT = """
+    MERGE (v:ChangeVersion {label: $label})
+    SET v.reset_at = CASE WHEN coalesce(v.reset_at, 0) > $up_to_version THEN v.reset_at ELSE $up_to_version END
+"""
+
+#DELETE
+
+DELETE_DEPARTMENT = _next_version('Department') + "MATCH (d:Department {dept_no: $dept_no}) DETACH DELETE d " + _tombstone('Department', '$dept_no')
+
+DELETE_EMPLOYEE = (_next_version('Employee') + "MATCH (e:Employee {emp_no: $emp_no}) WITH e, e.dept_no AS dept_no, e.mgr AS mgr, version DETACH DELETE e "
+                   + _tombstone('Employee', '$emp_no') + " RETURN dept_no, mgr")
+
+# El SET/REMOVE bloquea el departamento antes de comprobarlo: crear un WORKS_IN hacia él también
+# necesita ese bloqueo, así nadie puede añadirle un empleado entre la comprobación y el borrado
+DELETE_DEPARTMENT_IF_EMPTY = _next_version('Department') + """
+    OPTIONAL MATCH (d:Department {dept_no: $dept_no})
+    SET d._lock = true
+    REMOVE d._lock
+    WITH d, version, CASE
+        WHEN d IS NULL THEN 'not_found'
+        WHEN EXISTS { (:Employee)-[:WORKS_IN]->(d) } THEN 'has_employees'
+        ELSE 'ok'
+    END AS status
+    CALL {
+        WITH d, status, version
+        WITH d, status, version WHERE status = 'ok'
+        DETACH DELETE d
+        """ + _tombstone('Department', '$dept_no') + """
+        RETURN count(*) AS deleted
+    }
+    RETURN status
+"""
+
+# EXISTS se detiene en el primer empleado que encuentra en el índice, en lugar de contarlos todos
+DEPARTMENT_HAS_EMPLOYEES = """
+    RETURN EXISTS { MATCH (:Employee {dept_no: $dept_no}) } AS hasEmployees
+"""
+
+
+def in_batches(match, delete):
+    # Borrado masivo: `match` liga a x lo que hay que borrar; cada sentencia borra como mucho $limit
+    # filas en transacciones de $batch_size (ver CRUD._delete_in_batches)
+    return match + f"""
+        WITH x LIMIT $limit
+        CALL {{
+            WITH x
+            {delete}
+        }} IN TRANSACTIONS OF $batch_size ROWS
+    """
+
+
+DELETE_DEPARTMENT_EMPLOYEES = in_batches("MATCH (x:Employee)-[:WORKS_IN]->(:Department {dept_no: $dept_no})", 'DETACH DELETE x')
+
+PRUNE_TOMBSTONES = in_batches("MATCH (x:Tombstone {label: $label}) WHERE x._version <= $up_to_version", 'DELETE x')
+
+
+def delete_employees_where_query(filters):
+    return in_batches("MATCH (e:Employee) WHERE " + " AND ".join(_filter_conditions(filters)) + " WITH e AS x", 'DETACH DELETE x')
+
+
+# Primero las relaciones y luego los nodos; los contadores de cambios se conservan
+DELETE_ALL_RELATIONSHIPS = in_batches("MATCH ()-[x]->()", 'DELETE x')
+
+DELETE_ALL_NODES = in_batches("MATCH (x) WHERE NOT x:ChangeVersion", 'DETACH DELETE x')
+
+#REGISTRY
+
+# Parámetros de ejemplo para planificar con EXPLAIN: solo importan los tipos, no tienen que existir
+SAMPLE_DEPARTMENT = {'dept_no': 10, 'dname': 'ACCOUNTING', 'loc': 'NEW YORK'}
+SAMPLE_EMPLOYEE = {'emp_no': 7369, 'ename': 'SMITH', 'job': 'CLERK', 'mgr': 7902, 'hire_date': datetime(1980, 12, 17),
+                   'sal': 800, 'comm': 0, 'dept_no': 20}
+SAMPLE_FILTERS = {'name_prefix': 'SM', 'job': 'CLERK', 'dept_no': 20, 'min_sal': 1000, 'max_sal': 3000,
+                  'hired_from': datetime(1981, 1, 1), 'hired_to': datetime(1981, 12, 31)}
+SAMPLE_PAGE_KEYS = {'emp_no': None, 'dept_no': 20, 'job': 'CLERK'}
+
+_new = {'new_' + field: value for field, value in SAMPLE_EMPLOYEE.items() if field != 'emp_no'}
+_batch = {'batch_size': 1000, 'limit': 10000}
+
+# Nombre -> (sentencia, parámetros de ejemplo). Las variantes de una misma operación se distinguen
+# con ':' (p. ej. read_employees_page:job:after); verificar_planes.py busca primero el nombre completo
+# y después el de la operación
+QUERIES = {
+    'create_department': (CREATE_DEPARTMENT, SAMPLE_DEPARTMENT),
+    'ensure_departments': (ENSURE_DEPARTMENTS, {'dept_nos': [10, 20]}),
+    'create_employee': (CREATE_EMPLOYEE, SAMPLE_EMPLOYEE),
+    'create_employee_checked': (CREATE_EMPLOYEE_CHECKED, SAMPLE_EMPLOYEE),
+    'bulk_create_departments': (BULK_CREATE_DEPARTMENTS, {'rows': [SAMPLE_DEPARTMENT]}),
+    'bulk_create_employees': (BULK_CREATE_EMPLOYEES, {'rows': [SAMPLE_EMPLOYEE]}),
+    'bulk_update_departments': (BULK_UPDATE_DEPARTMENTS, {'rows': [SAMPLE_DEPARTMENT]}),
+    'bulk_update_employees': (BULK_UPDATE_EMPLOYEES, {'rows': [SAMPLE_EMPLOYEE]}),
+    'bulk_delete_departments': (BULK_DELETE_DEPARTMENTS, {'dept_nos': [10]}),
+    'bulk_delete_employees': (BULK_DELETE_EMPLOYEES, {'emp_nos': [7369]}),
+    'load_employees': (LOAD_EMPLOYEES, {'rows': [SAMPLE_EMPLOYEE]}),
+    'load_employees_retry': (LOAD_EMPLOYEES_RETRY, {'rows': [SAMPLE_EMPLOYEE]}),
+    'read_department': (READ_DEPARTMENT, {'dept_no': 10}),
+    'read_employee': (READ_EMPLOYEE, {'emp_no': 7369}),
+    'read_all_departments': (READ_ALL_DEPARTMENTS, {}),
+    'read_all_employees': (READ_ALL_EMPLOYEES, {}),
+    'iter_departments': (ITER_DEPARTMENTS, {}),
+    'iter_employees': (ITER_EMPLOYEES, {}),
+    'read_departments_page': (departments_page_query(False), {'limit': 200}),
+    'read_departments_page:after': (departments_page_query(True), {'after_dept_no': 10, 'limit': 200}),
+    **{f"read_employees_page:{order_by}{':after' if after else ''}": (employees_page_query(order_by, after), {
+        'after_emp_no': 7369 if after else None, 'after_key': key if after else None, 'limit': 200})
+       for order_by, key in SAMPLE_PAGE_KEYS.items() for after in (False, True)},
+    **{f"search_employees:{name}": (search_employees_query({name: value}, False), {name: value, 'limit': 200})
+       for name, value in SAMPLE_FILTERS.items()},
+    'search_employees:text': (search_employees_query({'text': 'smith~'}, False), {'text': 'smith~', 'limit': 200}),
+    'search_employees:job:after': (search_employees_query({'job': 'CLERK'}, True), {'job': 'CLERK', 'after_emp_no': 7369, 'limit': 200}),
+    'migrate_manages:create': (MIGRATE_MANAGES_CREATE, {'batch_size': 1000}),
+    'migrate_manages:delete': (MIGRATE_MANAGES_DELETE, {'batch_size': 1000}),
+    'reporting_chain': (REPORTING_CHAIN, {'emp_no': 7369}),
+    'subordinates': (subordinates_query(None), {'emp_no': 7839}),
+    'subordinates:max_depth': (subordinates_query(2), {'emp_no': 7839}),
+    'span_of_control': (SPAN_OF_CONTROL, {'emp_no': 7839}),
+    'refresh_teams': (REFRESH_TEAMS, {'emp_nos': [7902, 7369]}),
+    'rebuild_teams': (REBUILD_TEAMS, {'batch_size': 1000}),
+    'team_stats': (TEAM_STATS, {'emp_nos': [7839, 7566]}),
+    'update_department': (UPDATE_DEPARTMENT, {'dept_no': 10, 'new_dname': 'ACCOUNTING', 'new_loc': 'NEW YORK'}),
+    'update_employee': (UPDATE_EMPLOYEE, {'emp_no': 7369, **_new}),
+    'update_employee_checked': (UPDATE_EMPLOYEE_CHECKED, {'emp_no': 7369, **_new}),
+    'department_stats': (DEPARTMENT_STATS, {}),
+    'job_stats': (JOB_STATS, {}),
+    **{f"hire_histogram:{group_by}:{interval}": (hire_histogram_query(group_by, interval), {})
+       for group_by in ('dept_no', 'job') for interval in ('year', 'month')},
+    'change_version': (CHANGE_VERSION, {'label': 'Employee'}),
+    **{f"changed_rows:{label}": (changed_rows_query(label), {'version': 1, 'limit': 1001}) for label in TRACKED_QUERIES},
+    **{f"deleted_keys:{label}": (deleted_keys_query(label), {'label': label, 'version': 1}) for label in TRACKED_QUERIES},
+    'mark_reset': (MARK_RESET, {'label': 'Employee'}),
+    'raise_reset_at': (RAISE_RESET_AT, {'label': 'Employee', 'up_to_version': 1}),
+    'delete_department': (DELETE_DEPARTMENT, {'dept_no': 10}),
+    'delete_employee': (DELETE_EMPLOYEE, {'emp_no': 7369}),
+    'delete_department_if_empty': (DELETE_DEPARTMENT_IF_EMPTY, {'dept_no': 10}),
+    'department_has_employees': (DEPARTMENT_HAS_EMPLOYEES, {'dept_no': 10}),
+    'delete_department_cascade': (DELETE_DEPARTMENT_EMPLOYEES, {'dept_no': 10, **_batch}),
+    'prune_tombstones': (PRUNE_TOMBSTONES, {'label': 'Employee', 'up_to_version': 1, **_batch}),
+    **{f"delete_employees_where:{name}": (delete_employees_where_query({name: value}), {name: value, **_batch})
+       for name, value in SAMPLE_FILTERS.items()},
+    'delete_all:relationships': (DELETE_ALL_RELATIONSHIPS, _batch),
+    'delete_all:nodes': (DELETE_ALL_NODES, _batch),
+}
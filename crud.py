@@ -1,189 +1,902 @@
-from neo4j import GraphDatabase
-from datetime import datetime
+from neo4j import GraphDatabase, READ_ACCESS
+from neo4j.exceptions import ClientError, ConstraintError, Neo4jError, ServiceUnavailable, SessionExpired
+from contextlib import contextmanager
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from neo4j import ResultSummary
+from cache import MISSING, TTLCache
+from metricas import QueryMetrics, RecordingTx
+from modelos import DEPARTMENT_FIELDS, EMPLOYEE_FIELDS, TeamRow, department_row, employee_row, employee_detail_row
+from almacen import (Storage, chunks, as_row, BATCH_SIZE, PAGE_SIZE, CHANGE_LIMIT, FETCH_SIZE, EMPLOYEE_ORDER_KEYS,
+                     OK, DUPLICATE, CONFLICT, INVALID, UNAVAILABLE, FAILED)
+from consultas import (SCHEMA, PING, CREATE_DEPARTMENT, ENSURE_DEPARTMENTS, CREATE_EMPLOYEE, CREATE_EMPLOYEE_CHECKED,
+                       BULK_CREATE_DEPARTMENTS, BULK_CREATE_EMPLOYEES, BULK_UPDATE_DEPARTMENTS, BULK_UPDATE_EMPLOYEES,
+                       BULK_DELETE_DEPARTMENTS, BULK_DELETE_EMPLOYEES, READ_DEPARTMENT, READ_EMPLOYEE,
+                       READ_ALL_DEPARTMENTS, READ_ALL_EMPLOYEES, ITER_DEPARTMENTS, ITER_EMPLOYEES,
+                       MIGRATE_MANAGES_CREATE, MIGRATE_MANAGES_DELETE, REPORTING_CHAIN, SPAN_OF_CONTROL,
+                       REFRESH_TEAMS, REBUILD_TEAMS, TEAM_STATS,
+                       UPDATE_DEPARTMENT, UPDATE_EMPLOYEE, UPDATE_EMPLOYEE_CHECKED, DEPARTMENT_STATS, JOB_STATS,
+                       CHANGE_VERSION, MARK_RESET, RAISE_RESET_AT, DELETE_DEPARTMENT, DELETE_EMPLOYEE,
+                       DELETE_DEPARTMENT_IF_EMPTY, DEPARTMENT_HAS_EMPLOYEES, DELETE_DEPARTMENT_EMPLOYEES,
+                       PRUNE_TOMBSTONES, DELETE_ALL_RELATIONSHIPS, DELETE_ALL_NODES, _filter_conditions,
+                       departments_page_query, employees_page_query, search_employees_query, subordinates_query,
+                       hire_histogram_query, changed_rows_query, deleted_keys_query, delete_employees_where_query)
 
-class CRUD:
+# Lotes que borra cada sentencia de los borrados masivos; entre sentencia y sentencia se informa del progreso
+DELETE_ROUND_BATCHES = 10
+
+# Conexiones que abre warm_up(); con la interfaz, tantas como hilos del BackgroundRunner
+WARM_UP_CONNECTIONS = 4
+
+# Caracteres con significado en la sintaxis de consulta de Lucene (índices de texto completo)
+LUCENE_SPECIAL = set('+-&|!(){}[]^"~*?:\\/')
+
+# Etiquetas con seguimiento de cambios (ver consultas._next_version y changes_since) -> conversión de la fila.
+# changes_since(label, version) devuelve lo escrito después de `version`. Los borrados masivos no dejan
+# lápidas sino que fijan reset_at, y los clientes con una versión anterior recargan
+TRACKED = {
+    'Department': department_row,
+    'Employee': employee_row,
+}
+
+
+def _fuzzy_query(text):
+    # Cada palabra se escapa y se busca de forma aproximada; todas tienen que aparecer.
+    # En minúsculas para que AND/OR/NOT escritos por el usuario no se lean como operadores
+    terms = [''.join('\\' + char if char in LUCENE_SPECIAL else char for char in word.lower()) for word in text.split()]
+    return ' AND '.join(term + '~' for term in terms)
+
+
+def _row_count(value):
+    if value is None or isinstance(value, ResultSummary):
+        return 0
+    return len(value) if isinstance(value, list) else 1
+
+
+def _plan_total(plan, key):
+    # Suma un valor (p. ej. dbHits) en todo el árbol del plan
+    if not plan:
+        return 0
+    return plan.get(key, 0) + sum(_plan_total(child, key) for child in plan.get('children', []))
+
+
+def _counters(summary):
+    counters = summary.counters
+    return {
+        'nodes_created': counters.nodes_created,
+        'relationships_created': counters.relationships_created,
+        'properties_set': counters.properties_set,
+    }
+
+class CRUD(Storage):
+    write_errors = (Neo4jError,)
 
 #CONNECT
 
-    def __init__(self, uri, user, password):
-        self._driver = GraphDatabase.driver(uri, auth=(user, password))
+    # Crear el driver no abre conexiones: la primera se abre con la primera consulta o con warm_up()
+    def __init__(self, uri, user, password, cache_size=0, cache_ttl=30.0, instrument=False, slow_query_ms=None,
+                 max_connection_pool_size=100, connection_acquisition_timeout=60.0, fetch_size=FETCH_SIZE,
+                 keep_alive=True, liveness_check_timeout=None, team_aggregates=False):
+        self._driver = GraphDatabase.driver(uri, auth=(user, password),
+                                            max_connection_pool_size=max_connection_pool_size,
+                                            connection_acquisition_timeout=connection_acquisition_timeout,
+                                            fetch_size=fetch_size,
+                                            keep_alive=keep_alive,
+                                            liveness_check_timeout=liveness_check_timeout)
+        self._connection_acquisition_timeout = connection_acquisition_timeout
+        # Caché opcional para las búsquedas por clave; cache_size=0 la desactiva
+        self._cache = TTLCache(cache_size, cache_ttl) if cache_size else None
+        # Métricas por método; fijar un umbral de consultas lentas también las activa
+        self._metrics = QueryMetrics(slow_query_ms) if instrument or slow_query_ms is not None else None
+        # Agregados de equipo (team_size, team_pay, team_depth) mantenidos en cada escritura de empleados
+        self.team_aggregates = team_aggregates
 
     def close(self):
         self._driver.close()
 
+    def error_kind(self, error):
+        if isinstance(error, ConstraintError):
+            return CONFLICT
+        if isinstance(error, (ServiceUnavailable, SessionExpired)):
+            return UNAVAILABLE
+        if isinstance(error, ClientError):
+            return INVALID
+        if isinstance(error, Neo4jError):
+            return FAILED
+        return super().error_kind(error)
+
+    def ping(self):
+        # Una sola consulta por una conexión del pool, en milisegundos. Para comprobaciones frecuentes
+        # (GET /health); warm_up es para el arranque, abre un hilo por conexión
+        started = time.perf_counter()
+        with self._driver.session() as session:
+            session.run(PING).consume()
+        return (time.perf_counter() - started) * 1000
+
+    def warm_up(self, connections=WARM_UP_CONNECTIONS):
+        # Comprueba la conexión y deja `connections` conexiones abiertas en el pool, para que las primeras
+        # consultas no paguen el establecimiento (TCP, TLS, autenticación). Bloquea: llamarla en segundo plano
+        started = time.perf_counter()
+        self._driver.verify_connectivity()
+        connected = time.perf_counter()
+        # Cada hilo retiene su conexión hasta que todos tienen la suya, así el pool no reutiliza la misma
+        barrier = threading.Barrier(connections)
+
+        def open_connection():
+            with self._driver.session() as session:
+                result = session.run(PING)
+                barrier.wait(self._connection_acquisition_timeout)
+                result.consume()
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            for future in [executor.submit(open_connection) for _ in range(connections)]:
+                future.result()
+        return {
+            'connectivity_ms': (connected - started) * 1000,
+            'total_ms': (time.perf_counter() - started) * 1000,
+            'connections': connections,
+        }
+
+    def ensure_schema(self):
+        # Crea las restricciones e índices que falten; las sentencias de esquema van en transacciones propias
+        report = {'created': [], 'existing': []}
+        for name, statement in SCHEMA:
+            counters = self._run('ensure_schema', statement).counters
+            if counters.constraints_added or counters.indexes_added:
+                report['created'].append(name)
+            else:
+                report['existing'].append(name)
+        return report
+
+#INSTRUMENTATION
+
+    # Todas las consultas pasan por _read/_write/_run, que con las métricas activas miden el tiempo de
+    # pared y recogen el ResultSummary de cada sentencia (tiempos del servidor y contadores)
+    def _read(self, work, *args, session=None):
+        return self._execute('execute_read', work, args, session)
+
+    def _write(self, work, *args, session=None):
+        return self._execute('execute_write', work, args, session)
+
+    def _execute(self, access, work, args, session):
+        if session is None:
+            with self._driver.session() as session:
+                return self._execute(access, work, args, session)
+        if self._metrics is None:
+            return getattr(session, access)(work, *args)
+        summaries = []
+
+        def instrumented(tx, *args):
+            recording = RecordingTx(tx)
+            value = work(recording, *args)
+            # Si el driver reintenta la transacción, solo cuentan los resúmenes del último intento
+            summaries[:] = [result.consume() for result in recording.results]
+            return value
+
+        return self._measure(work.__name__.lstrip('_'), lambda: getattr(session, access)(instrumented, *args), summaries)
+
+    def _run(self, name, query, **parameters):
+        # Sentencias en transacción implícita (esquema, CALL { ... } IN TRANSACTIONS)
+        summaries = []
+
+        def run():
+            with self._driver.session() as session:
+                summary = session.run(query, **parameters).consume()
+            summaries.append(summary)
+            return summary
+
+        if self._metrics is None:
+            return run()
+        return self._measure(name, run, summaries)
+
+    def _measure(self, name, call, summaries):
+        started = time.perf_counter()
+        try:
+            value = call()
+        except Exception:
+            self._metrics.record_error(name, (time.perf_counter() - started) * 1000)
+            raise
+        self._metrics.record(name, (time.perf_counter() - started) * 1000, summaries, _row_count(value))
+        return value
+
+    def metrics(self):
+        return self._metrics.snapshot() if self._metrics else None
+
+    def reset_metrics(self):
+        if self._metrics:
+            self._metrics.reset()
+
+    def profile(self, query, **parameters):
+        # Ejecuta la sentencia con PROFILE (¡las escrituras se aplican!) y devuelve el plan con db hits
+        with self._driver.session() as session:
+            result = session.run("PROFILE " + query, **parameters)
+            records = [record.data() for record in result]
+            summary = result.consume()
+        return {
+            'records': records,
+            'plan': summary.profile,
+            'db_hits': _plan_total(summary.profile, 'dbHits'),
+            'result_available_after_ms': summary.result_available_after,
+            'result_consumed_after_ms': summary.result_consumed_after,
+        }
+
+    def explain(self, query, **parameters):
+        # Plan estimado sin ejecutar la sentencia
+        with self._driver.session() as session:
+            summary = session.run("EXPLAIN " + query, **parameters).consume()
+        return summary.plan
+
+#CACHE
+
+    def cache_stats(self):
+        return self._cache.stats() if self._cache else None
+
+    def clear_cache(self):
+        # Para cuando se escribe sin pasar por el CRUD (p. ej. cargador.py)
+        if self._cache:
+            self._cache.clear()
+
+    def _cached(self, key, load, *args):
+        if self._cache is None:
+            return load(*args)
+        value = self._cache.get(key)
+        if value is MISSING:
+            generation = self._cache.generation()
+            value = load(*args)
+            self._cache.put(key, value, generation)
+        return value
+
+    def _invalidate(self, *keys):
+        if self._cache:
+            self._cache.invalidate(*keys)
+
+    def _invalidate_department_employees(self, dept_no):
+        # read_employee incluye el nombre del departamento, así que sus entradas dependen de él
+        if self._cache:
+            self._cache.invalidate_where(lambda key, value: key[0] == 'employee' and value is not None and value.dept_no == dept_no)
+
+#TRANSACTION
+
+    # Sesión propia del pool para quien reparte el trabajo entre hilos: las sesiones no se pueden
+    # compartir entre hilos, así que cada uno abre la suya (ver cargador.py)
+    def session(self, **config):
+        return self._driver.session(**config)
+
+    # Unidad de trabajo: varias operaciones en una sola sesión y una sola transacción explícita.
+    # Si el bloque lanza una excepción se hace rollback; si no, commit al salir
+    @contextmanager
+    def transaction(self):
+        with self._driver.session() as session:
+            tx = session.begin_transaction()
+            uow = UnitOfWork(tx, self.team_aggregates)
+            try:
+                yield uow
+            except BaseException:
+                if not tx.closed():
+                    tx.rollback()
+                raise
+            if not tx.closed():
+                uow.commit()
+        if uow.committed:
+            self._apply_invalidations(uow)
+
+    # Igual que transaction(), pero la función se ejecuta como función de transacción gestionada:
+    # el driver la reintenta entera ante errores transitorios (deadlocks, cambio de líder...)
+    def run_in_transaction(self, work, *args):
+        attempts = []
+
+        def unit_of_work(tx):
+            uow = UnitOfWork(tx, self.team_aggregates)
+            attempts.append(uow)
+            return work(uow, *args)
+
+        result = self._write(unit_of_work)
+        self._apply_invalidations(attempts[-1])
+        return result
+
+    def _apply_invalidations(self, uow):
+        self._invalidate(*uow.invalidated_keys)
+        for dept_no in uow.invalidated_departments:
+            self._invalidate_department_employees(dept_no)
+
 #CREATE
 
+    # Las escrituras devuelven la fila resultante para que la interfaz pueda actualizarse sin releer todo
     def create_department(self, dept_no, dname, loc):
-        with self._driver.session() as session:
-            session.execute_write(self._create_department, dept_no, dname, loc)
+        department = self._write(self._create_department, dept_no, dname, loc)
+        self._invalidate(('department', dept_no), ('has_employees', dept_no))
+        return department
 
     @staticmethod
     def _create_department(tx, dept_no, dname, loc):
-        tx.run("CREATE (d:Department {dept_no: $dept_no, dname: $dname, loc: $loc})", dept_no=dept_no, dname=dname, loc=loc)
+        result = tx.run(CREATE_DEPARTMENT, dept_no=dept_no, dname=dname, loc=loc)
+        return department_row(result.single().values())
 
     def create_employee(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
-        with self._driver.session() as session:
-            session.execute_write(self._create_employee, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no)
+        employee = self._write(self._create_employee, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no, self.team_aggregates)
+        self._invalidate(('employee', emp_no), ('department', dept_no), ('has_employees', dept_no))
+        return employee
 
     @staticmethod
-    def _create_employee(tx, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
+    def _create_employee(tx, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no, teams=False):
         # Verifica si el departamento existe antes de crear el empleado
-        tx.run("""
-            MERGE (d:Department {dept_no: $dept_no})
-        """, dept_no=dept_no)
+        CRUD._ensure_departments(tx, [dept_no])
 
         # Crea el empleado y establece la relación con el departamento existente
-        tx.run("""
-            MATCH (d:Department {dept_no: $dept_no})
-            CREATE (e:Employee {
-                emp_no: $emp_no, 
-                ename: $ename, 
-                job: $job, 
-                mgr: $mgr, 
-                hire_date: $hire_date, 
-                sal: $sal, 
-                comm: $comm, 
-                dept_no: $dept_no
-            })
-            MERGE (e)-[:WORKS_IN]->(d)
-        """, emp_no=emp_no, ename=ename, job=job, mgr=mgr, hire_date=hire_date, sal=sal, comm=comm, dept_no=dept_no)
+        result = tx.run(CREATE_EMPLOYEE, emp_no=emp_no, ename=ename, job=job, mgr=mgr, hire_date=hire_date, sal=sal, comm=comm, dept_no=dept_no)
+        employee = employee_row(result.single().values())
+        if teams:
+            CRUD._refresh_teams(tx, [emp_no])
+        return employee
+
+    @staticmethod
+    def _ensure_departments(tx, dept_nos):
+        tx.run(ENSURE_DEPARTMENTS, dept_nos=list(set(dept_nos))).consume()
+
+    # Variantes validadas: comprueban manager y departamento y escriben en una sola sentencia y transacción,
+    # sin la ventana entre comprobación y escritura de hacerlo en varias llamadas
+    def create_employee_checked(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
+        try:
+            result = self._write(self._create_employee_checked, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no, self.team_aggregates)
+        except ConstraintError:
+            # Otro cliente creó el mismo emp_no entre medias; lo detecta la restricción de unicidad
+            return {'status': DUPLICATE, 'employee': None}
+        if result['status'] == OK:
+            self._invalidate(('employee', emp_no), ('has_employees', dept_no))
+        return result
+
+    @staticmethod
+    def _create_employee_checked(tx, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no, teams=False):
+        result = tx.run(CREATE_EMPLOYEE_CHECKED, emp_no=emp_no, ename=ename, job=job, mgr=mgr, hire_date=hire_date, sal=sal, comm=comm, dept_no=dept_no)
+        record = result.single()
+        if teams and record['status'] == OK:
+            CRUD._refresh_teams(tx, [emp_no])
+        return {'status': record['status'], 'employee': employee_row(record['e'])}
+
+#BULK
+
+    def bulk_create_departments(self, rows, batch_size=BATCH_SIZE):
+        # Cada lote se escribe con un único UNWIND dentro de una sola transacción
+        results = []
+        with self._driver.session() as session:
+            for batch_no, chunk in enumerate(chunks(rows, batch_size)):
+                batch = [as_row(row, DEPARTMENT_FIELDS) for row in chunk]
+                counters = self._write(self._bulk_create_departments, batch, session=session)
+                self._invalidate(*[(kind, row['dept_no']) for row in batch for kind in ('department', 'has_employees')])
+                results.append({'batch': batch_no, 'rows': len(batch), **counters})
+        return results
+
+    @staticmethod
+    def _bulk_create_departments(tx, rows):
+        # Todo el lote comparte una versión
+        result = tx.run(BULK_CREATE_DEPARTMENTS, rows=rows)
+        return _counters(result.consume())
+
+    def bulk_create_employees(self, rows, batch_size=BATCH_SIZE):
+        results = []
+        with self._driver.session() as session:
+            for batch_no, chunk in enumerate(chunks(rows, batch_size)):
+                batch = [as_row(row, EMPLOYEE_FIELDS) for row in chunk]
+                counters = self._write(self._bulk_create_employees, batch, self.team_aggregates, session=session)
+                self._invalidate(*[('employee', row['emp_no']) for row in batch],
+                                 *[(kind, row['dept_no']) for row in batch for kind in ('department', 'has_employees')])
+                results.append({'batch': batch_no, 'rows': len(batch), **counters})
+        return results
+
+    @staticmethod
+    def _bulk_create_employees(tx, rows, teams=False):
+        # Igual que _create_employee pero para un lote completo en una sola sentencia
+        CRUD._ensure_departments(tx, [row['dept_no'] for row in rows])
+        result = tx.run(BULK_CREATE_EMPLOYEES, rows=rows)
+        counters = _counters(result.consume())
+        if teams:
+            CRUD._refresh_teams(tx, [row['emp_no'] for row in rows])
+        return counters
+
+    # Actualizaciones y borrados por lotes: devuelven las claves afectadas, así quien llama sabe qué
+    # filas no existían (o, en los departamentos, cuáles no se borraron por tener empleados)
+    def bulk_update_departments(self, rows, batch_size=BATCH_SIZE):
+        updated = []
+        with self._driver.session() as session:
+            for chunk in chunks(rows, batch_size):
+                batch = [as_row(row, DEPARTMENT_FIELDS) for row in chunk]
+                keys = self._write(self._bulk_update_departments, batch, session=session)
+                self._invalidate(*[('department', dept_no) for dept_no in keys])
+                for dept_no in keys:
+                    self._invalidate_department_employees(dept_no)
+                updated.extend(keys)
+        return updated
+
+    @staticmethod
+    def _bulk_update_departments(tx, rows):
+        result = tx.run(BULK_UPDATE_DEPARTMENTS, rows=rows)
+        return [record['dept_no'] for record in result]
+
+    def bulk_update_employees(self, rows, batch_size=BATCH_SIZE):
+        # Como update_employee_checked: no se actualizan las filas cuyo manager o departamento no existen,
+        # ni las que pondrían como manager al propio empleado o a uno de sus subordinados
+        updated = []
+        with self._driver.session() as session:
+            for chunk in chunks(rows, batch_size):
+                batch = [as_row(row, EMPLOYEE_FIELDS) for row in chunk]
+                changes = self._write(self._bulk_update_employees, batch, self.team_aggregates, session=session)
+                self._invalidate(*[key for emp_no, old_dept_no, dept_no in changes
+                                   for key in (('employee', emp_no), ('has_employees', old_dept_no), ('has_employees', dept_no))])
+                updated.extend(emp_no for emp_no, _, _ in changes)
+        return updated
+
+    @staticmethod
+    def _bulk_update_employees(tx, rows, teams=False):
+        records = list(tx.run(BULK_UPDATE_EMPLOYEES, rows=rows))
+        if teams:
+            # Primero las cadenas de los managers anteriores y después las de los empleados actualizados
+            CRUD._refresh_teams(tx, [record['old_mgr'] for record in records] + [record['emp_no'] for record in records])
+        return [(record['emp_no'], record['old_dept_no'], record['dept_no']) for record in records]
+
+    def bulk_delete_departments(self, dept_nos, batch_size=BATCH_SIZE):
+        # Solo borra los departamentos sin empleados, comprobándolo como delete_department_if_empty
+        deleted = []
+        with self._driver.session() as session:
+            for batch in chunks(dept_nos, batch_size):
+                keys = self._write(self._bulk_delete_departments, batch, session=session)
+                self._invalidate(*[(kind, dept_no) for dept_no in keys for kind in ('department', 'has_employees')])
+                deleted.extend(keys)
+        return deleted
+
+    @staticmethod
+    def _bulk_delete_departments(tx, dept_nos):
+        result = tx.run(BULK_DELETE_DEPARTMENTS, dept_nos=dept_nos)
+        return [record['dept_no'] for record in result]
+
+    def bulk_delete_employees(self, emp_nos, batch_size=BATCH_SIZE):
+        deleted = []
+        with self._driver.session() as session:
+            for batch in chunks(emp_nos, batch_size):
+                changes = self._write(self._bulk_delete_employees, batch, self.team_aggregates, session=session)
+                self._invalidate(*[key for emp_no, dept_no in changes for key in (('employee', emp_no), ('has_employees', dept_no))])
+                deleted.extend(emp_no for emp_no, _ in changes)
+        return deleted
+
+    @staticmethod
+    def _bulk_delete_employees(tx, emp_nos, teams=False):
+        records = list(tx.run(BULK_DELETE_EMPLOYEES, emp_nos=emp_nos))
+        if teams:
+            CRUD._refresh_teams(tx, [record['mgr'] for record in records])
+        return [(record['emp_no'], record['dept_no']) for record in records]
 
 
 #READ
 
     def read_department(self, dept_no):
-        with self._driver.session() as session:
-            result = session.execute_read(self._read_department, dept_no)
-            return result
+        return self._cached(('department', dept_no), self._read, self._read_department, dept_no)
 
     @staticmethod
     def _read_department(tx, dept_no):
-        result = tx.run("MATCH (d:Department {dept_no: $dept_no}) RETURN d", dept_no=dept_no)
+        result = tx.run(READ_DEPARTMENT, dept_no=dept_no)
         record = result.single()
         if record:
-            return record['d']
+            return department_row(record.values())
         else:
             return None
 
     def read_employee(self, emp_no):
-        with self._driver.session() as session:
-            result = session.execute_read(self._read_employee, emp_no)
-            return result
+        return self._cached(('employee', emp_no), self._read, self._read_employee, emp_no)
 
     @staticmethod
     def _read_employee(tx, emp_no):
-        result = tx.run("""
-            MATCH (e:Employee {emp_no: $emp_no})-[:WORKS_IN]->(d:Department)
-            RETURN e, d
-        """, emp_no=emp_no)
+        result = tx.run(READ_EMPLOYEE, emp_no=emp_no)
         record = result.single()
         if record:
-            employee_node = record['e']
-            department_node = record['d']
-
-            # Crear un nuevo diccionario con la información del empleado y su departamento
-            employee = {
-                'emp_no': employee_node['emp_no'],
-                'ename': employee_node['ename'],
-                'job': employee_node['job'],
-                'mgr': employee_node['mgr'],
-                'hire_date': employee_node['hire_date'].strftime('%Y-%m-%d') if employee_node.get('hire_date') else None,
-                'sal': employee_node['sal'],
-                'comm': employee_node['comm'],
-                'dept_no': department_node['dept_no'],
-                'department_name': department_node['dname']
-            }
-            return employee
+            return employee_detail_row(record.values())
         else:
             return None
 
     
-    def read_all_departments(self):
-        with self._driver.session() as session:
-            result = session.execute_read(self._read_all_departments)
-            return result
+    # Las lecturas de listas devuelven DepartmentRow/EmployeeRow; con as_tuples=True, tuplas simples
+    # en el mismo orden de campos para quien solo las va a recorrer
+    def read_all_departments(self, as_tuples=False):
+        return self._read(self._read_all_departments, as_tuples)
 
     @staticmethod
-    def _read_all_departments(tx):
-        result = tx.run("MATCH (d:Department) RETURN d ORDER BY d.dept_no")
-        return [record['d'] for record in result]
+    def _read_all_departments(tx, as_tuples=False):
+        result = tx.run(READ_ALL_DEPARTMENTS)
+        return [department_row(record.values(), as_tuples) for record in result]
 
-    def read_all_employees(self):
-        with self._driver.session() as session:
-            result = session.execute_read(self._read_all_employees)
-            return result
+    def read_all_employees(self, as_tuples=False):
+        return self._read(self._read_all_employees, as_tuples)
+
+    @staticmethod
+    def _read_all_employees(tx, as_tuples=False):
+        result = tx.run(READ_ALL_EMPLOYEES)
+        return [employee_row(record.values(), as_tuples) for record in result]
+
+    # Paginación por clave (keyset): cada página empieza justo después de la última fila de la anterior,
+    # así el coste no crece con la posición como con SKIP
+    def read_departments_page(self, after_dept_no=None, limit=PAGE_SIZE, as_tuples=False):
+        return self._read(self._read_departments_page, after_dept_no, limit, as_tuples)
+
+    @staticmethod
+    def _read_departments_page(tx, after_dept_no, limit, as_tuples=False):
+        result = tx.run(departments_page_query(after_dept_no is not None), after_dept_no=after_dept_no, limit=limit)
+        return [department_row(record.values(), as_tuples) for record in result]
+
+    def read_employees_page(self, after_emp_no=None, limit=PAGE_SIZE, order_by='emp_no', after_key=None, as_tuples=False):
+        # Si se ordena por otra clave, el cursor es (after_key, after_emp_no) para desempatar
+        if order_by not in EMPLOYEE_ORDER_KEYS:
+            raise ValueError(f"No se puede paginar por {order_by}")
+        return self._read(self._read_employees_page, after_emp_no, limit, order_by, after_key, as_tuples)
+
+    @staticmethod
+    def _read_employees_page(tx, after_emp_no, limit, order_by, after_key, as_tuples=False):
+        result = tx.run(employees_page_query(order_by, after_emp_no is not None), after_emp_no=after_emp_no, after_key=after_key, limit=limit)
+        return [employee_row(record.values(), as_tuples) for record in result]
+
+    def search_employees(self, name_prefix=None, job=None, dept_no=None, min_sal=None, max_sal=None,
+                         hired_from=None, hired_to=None, text=None, after_emp_no=None, limit=PAGE_SIZE):
+        # Filtros combinados en la base de datos, paginados por emp_no como read_employees_page.
+        # `text` busca de forma aproximada en ename y job con el índice de texto completo
+        filters = {'name_prefix': name_prefix, 'job': job, 'dept_no': dept_no, 'min_sal': min_sal, 'max_sal': max_sal,
+                   'hired_from': hired_from, 'hired_to': hired_to, 'text': _fuzzy_query(text) if text else None}
+        return self._read(self._search_employees, filters, after_emp_no, limit)
+
+    @staticmethod
+    def _search_employees(tx, filters, after_emp_no, limit):
+        result = tx.run(search_employees_query(filters, after_emp_no is not None), filters, after_emp_no=after_emp_no, limit=limit)
+        return [employee_row(record.values()) for record in result]
+
+    # Lecturas en streaming para exportar: el driver trae los registros de fetch_size en fetch_size
+    # a medida que se consumen, así la memoria no depende del número de filas. La sesión queda abierta
+    # hasta agotar (o cerrar) el generador
+    def iter_departments(self, fetch_size=FETCH_SIZE, as_tuples=False):
+        return self._iter(ITER_DEPARTMENTS, department_row, fetch_size, as_tuples)
+
+    def iter_employees(self, fetch_size=FETCH_SIZE, as_tuples=False):
+        return self._iter(ITER_EMPLOYEES, employee_row, fetch_size, as_tuples)
+
+    def _iter(self, query, row, fetch_size, as_tuples):
+        with self._driver.session(default_access_mode=READ_ACCESS, fetch_size=fetch_size) as session:
+            for record in session.run(query):
+                yield row(record.values(), as_tuples)
+
+#HIERARCHY
+
+    # Las relaciones (:Employee)-[:MANAGES]->(:Employee) reflejan la propiedad mgr y se mantienen en cada
+    # escritura; migrate_manages() las crea para datos cargados antes de existir
+    def migrate_manages(self, batch_size=BATCH_SIZE):
+        # Las sentencias con CALL { ... } IN TRANSACTIONS tienen que ir en transacciones implícitas
+        created = self._run('migrate_manages', MIGRATE_MANAGES_CREATE, batch_size=batch_size).counters.relationships_created
+        deleted = self._run('migrate_manages', MIGRATE_MANAGES_DELETE, batch_size=batch_size).counters.relationships_deleted
+        if self.team_aggregates:
+            self.rebuild_team_aggregates(batch_size)
+        return {'relationships_created': created, 'relationships_deleted': deleted}
+
+    def reporting_chain(self, emp_no):
+        # Managers por encima del empleado, del directo hacia arriba
+        return self._read(self._reporting_chain, emp_no)
+
+    @staticmethod
+    def _reporting_chain(tx, emp_no):
+        result = tx.run(REPORTING_CHAIN, emp_no=emp_no)
+        return [employee_row(record.values()) for record in result]
+
+    def subordinates(self, emp_no, max_depth=None):
+        return self._read(self._subordinates, emp_no, max_depth)
+
+    @staticmethod
+    def _subordinates(tx, emp_no, max_depth):
+        result = tx.run(subordinates_query(max_depth), emp_no=emp_no)
+        return [{'employee': employee_row(record['employee']), 'depth': record['depth']} for record in result]
+
+    def span_of_control(self, emp_no):
+        return self._read(self._span_of_control, emp_no)
+
+    @staticmethod
+    def _span_of_control(tx, emp_no):
+        result = tx.run(SPAN_OF_CONTROL, emp_no=emp_no)
+        record = result.single()
+        if record:
+            return {'direct_reports': record['direct_reports'], 'total_reports': record['total_reports'], 'depth': record['depth']}
+        else:
+            return None
+
+#TEAMS
+
+    # Agregados de equipo materializados (ver consultas.REFRESH_TEAMS): con team_aggregates=True cada
+    # escritura de empleados recalcula en su misma transacción la cadena de managers afectada, y leer
+    # los totales de un manager es una búsqueda por clave en lugar de recorrer su subárbol
+    def team_stats(self, emp_nos):
+        # {emp_no: TeamRow}; sin los agregados activados (o sin reconstruir) los valores son None
+        return self._read(self._team_stats, list(emp_nos))
+
+    @staticmethod
+    def _team_stats(tx, emp_nos):
+        result = tx.run(TEAM_STATS, emp_nos=emp_nos)
+        return {record['emp_no']: TeamRow(*record.values()[1:]) for record in result}
+
+    def rebuild_team_aggregates(self, batch_size=BATCH_SIZE):
+        # Recalcula todos los empleados desde sus subárboles; para reparar o al activar los agregados
+        counters = self._run('rebuild_team_aggregates', REBUILD_TEAMS, batch_size=batch_size).counters
+        return {'properties_set': counters.properties_set}
 
     @staticmethod
-    def _read_all_employees(tx):
-        result = tx.run("MATCH (e:Employee) RETURN e")
-        return [record['e'] for record in result]
+    def _refresh_teams(tx, emp_nos):
+        # Sin claves repetidas pero en el mismo orden: cada cadena se recalcula sobre la anterior
+        emp_nos = list(dict.fromkeys(emp_no for emp_no in emp_nos if emp_no is not None))
+        if emp_nos:
+            tx.run(REFRESH_TEAMS, emp_nos=emp_nos).consume()
 
 #UPDATE
     def update_department(self, dept_no, new_dname, new_loc):
-        with self._driver.session() as session:
-            session.execute_write(self._update_department, dept_no, new_dname, new_loc)
+        department = self._write(self._update_department, dept_no, new_dname, new_loc)
+        self._invalidate(('department', dept_no))
+        self._invalidate_department_employees(dept_no)
+        return department
 
     @staticmethod
     def _update_department(tx, dept_no, new_dname, new_loc):
-        tx.run("MATCH (d:Department {dept_no: $dept_no}) SET d.dname = $new_dname, d.loc = $new_loc", dept_no=dept_no, new_dname=new_dname, new_loc=new_loc)
+        result = tx.run(UPDATE_DEPARTMENT, dept_no=dept_no, new_dname=new_dname, new_loc=new_loc)
+        record = result.single()
+        return department_row(record.values()) if record else None
 
     def update_employee(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
-        with self._driver.session() as session:
-            session.execute_write(self._update_employee, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no)
+        employee, old_dept_no = self._write(self._update_employee, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no, self.team_aggregates)
+        self._invalidate(('employee', emp_no), ('has_employees', old_dept_no), ('has_employees', new_dept_no))
+        return employee
+
+    @staticmethod
+    def _update_employee(tx, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no, teams=False):
+        # Devuelve también el departamento anterior para poder invalidar la caché con precisión
+        result = tx.run(UPDATE_EMPLOYEE, emp_no=emp_no, new_ename=new_ename, new_job=new_job, new_mgr=new_mgr, new_hire_date=new_hire_date, new_sal=new_sal, new_comm=new_comm, new_dept_no=new_dept_no)
+        record = result.single()
+        if record:
+            if teams:
+                CRUD._refresh_teams(tx, [record['old_mgr'] if record['old_mgr'] != new_mgr else None, emp_no])
+            return employee_row(record['e']), record['old_dept_no']
+        return None, None
+
+    def update_employee_checked(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
+        result, old_dept_no = self._write(self._update_employee_checked, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no, self.team_aggregates)
+        if result['status'] == OK:
+            self._invalidate(('employee', emp_no), ('has_employees', old_dept_no), ('has_employees', new_dept_no))
+        return result
+
+    @staticmethod
+    def _update_employee_checked(tx, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no, teams=False):
+        # Además de las propiedades, mueve la relación WORKS_IN si cambia el departamento
+        result = tx.run(UPDATE_EMPLOYEE_CHECKED, emp_no=emp_no, new_ename=new_ename, new_job=new_job, new_mgr=new_mgr, new_hire_date=new_hire_date, new_sal=new_sal, new_comm=new_comm, new_dept_no=new_dept_no)
+        record = result.single()
+        if teams and record['status'] == OK:
+            CRUD._refresh_teams(tx, [record['old_mgr'] if record['old_mgr'] != new_mgr else None, emp_no])
+        return {'status': record['status'], 'employee': employee_row(record['e'])}, record['old_dept_no']
+
+#AGGREGATES
+
+    # Agregados calculados en la base de datos: solo viajan las filas de resultado, no los empleados
+    def department_stats(self):
+        return self._read(self._department_stats)
+
+    @staticmethod
+    def _department_stats(tx):
+        result = tx.run(DEPARTMENT_STATS)
+        return [record.data() for record in result]
+
+    def job_stats(self):
+        return self._read(self._job_stats)
+
+    @staticmethod
+    def _job_stats(tx):
+        result = tx.run(JOB_STATS)
+        return [record.data() for record in result]
+
+    def hire_histogram(self, group_by='dept_no', interval='year'):
+        # Contrataciones por grupo (dept_no o job) y año o mes
+        if group_by not in ('dept_no', 'job'):
+            raise ValueError(f"No se puede agrupar por {group_by}")
+        if interval not in ('year', 'month'):
+            raise ValueError(f"Intervalo no válido: {interval}")
+        return self._read(self._hire_histogram, group_by, interval)
 
     @staticmethod
-    def _update_employee(tx, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
-        tx.run("MATCH (e:Employee {emp_no: $emp_no}) SET e.ename = $new_ename, e.job = $new_job, e.mgr = $new_mgr, e.hire_date = $new_hire_date, e.sal = $new_sal, e.comm = $new_comm, e.dept_no = $new_dept_no", emp_no=emp_no, new_ename=new_ename, new_job=new_job, new_mgr=new_mgr, new_hire_date=new_hire_date, new_sal=new_sal, new_comm=new_comm, new_dept_no=new_dept_no)
+    def _hire_histogram(tx, group_by, interval):
+        result = tx.run(hire_histogram_query(group_by, interval))
+        return [record.data() for record in result]
+
+#CHANGES
+
+    def changes_since(self, label, version=None, limit=CHANGE_LIMIT):
+        # {'version', 'reset', 'changed', 'deleted'}: filas escritas y claves borradas después de `version`.
+        # Con reset=True el cliente tiene que recargar (primera llamada, borrado masivo o demasiados cambios)
+        if label not in TRACKED:
+            raise ValueError(f"Etiqueta sin seguimiento de cambios: {label}")
+        changes = self._read(self._changes_since, label, version, limit)
+        self._invalidate_changes(label, changes)
+        return changes
+
+    def _invalidate_changes(self, label, changes):
+        # Lo que han escrito otros clientes tampoco puede seguir en la caché: si no, un formulario
+        # rellenado con read_employee/read_department devolvería al guardar los valores anteriores
+        if not self._cache:
+            return
+        if changes['reset']:
+            self._cache.clear()
+            return
+        if label == 'Department':
+            dept_nos = [department.dept_no for department in changes['changed']] + changes['deleted']
+            self._invalidate(*[(kind, dept_no) for dept_no in dept_nos for kind in ('department', 'has_employees')])
+            for dept_no in dept_nos:
+                self._invalidate_department_employees(dept_no)
+            return
+        emp_nos = {employee.emp_no for employee in changes['changed']} | set(changes['deleted'])
+        if emp_nos:
+            # El departamento anterior de un empleado movido o borrado no se conoce, así que se descartan
+            # todas las comprobaciones de departamento con empleados (solo son booleanos)
+            self._cache.invalidate_where(lambda key, value: (key[0] == 'employee' and key[1] in emp_nos) or key[0] == 'has_employees')
+
+    @staticmethod
+    def _changes_since(tx, label, version, limit):
+        row = TRACKED[label]
+        record = tx.run(CHANGE_VERSION, label=label).single()
+        current, reset_at = (record['version'], record['reset_at']) if record else (0, 0)
+        changes = {'version': current, 'reset': False, 'changed': [], 'deleted': []}
+        if version is None or version < reset_at or version > current:
+            changes['reset'] = True
+            return changes
+        if version == current:
+            return changes  # Lo habitual: una sola búsqueda por índice
+        result = tx.run(changed_rows_query(label), version=version, limit=limit + 1)
+        changed = [row(record.values()) for record in result]
+        if len(changed) > limit:
+            changes['reset'] = True
+            return changes
+        changes['changed'] = changed
+        # Una clave borrada y vuelta a crear aparece solo como cambiada
+        result = tx.run(deleted_keys_query(label), label=label, version=version)
+        changes['deleted'] = [record['key'] for record in result]
+        return changes
+
+    def mark_reset(self, label):
+        # Para escrituras que no llevan versión (borrados y cargas masivas): los clientes recargan.
+        # Ningún cliente vuelve a leer las lápidas anteriores al reinicio, así que se borran aquí
+        version = self._write(self._mark_reset, label)
+        self._delete_in_batches('prune_tombstones', PRUNE_TOMBSTONES, 'nodes_deleted', BATCH_SIZE, None,
+                                label=label, up_to_version=version)
+        return version
+
+    @staticmethod
+    def _mark_reset(tx, label):
+        result = tx.run(MARK_RESET, label=label)
+        return result.single()['version']
+
+    def prune_tombstones(self, label, up_to_version, batch_size=BATCH_SIZE):
+        # Borra las lápidas hasta `up_to_version`; los clientes más antiguos ya no pueden ver esos
+        # borrados, así que a partir de ahí se les pide recargar (POST /changes/<label>/prune del servicio)
+        if label not in TRACKED:
+            raise ValueError(f"Etiqueta sin seguimiento de cambios: {label}")
+        report = self._delete_in_batches('prune_tombstones', PRUNE_TOMBSTONES, 'nodes_deleted', batch_size, None,
+                                         label=label, up_to_version=up_to_version)
+        self._run('prune_tombstones', RAISE_RESET_AT, label=label, up_to_version=up_to_version)
+        return report
 
 #DELETE
+    # Los borrados devuelven si existía el nodo
     def delete_department(self, dept_no):
-        with self._driver.session() as session:
-            session.execute_write(self._delete_department, dept_no)
+        deleted = self._write(self._delete_department, dept_no)
+        self._invalidate(('department', dept_no), ('has_employees', dept_no))
+        self._invalidate_department_employees(dept_no)
+        return deleted
 
     @staticmethod
     def _delete_department(tx, dept_no):
-        tx.run("MATCH (d:Department {dept_no: $dept_no}) DETACH DELETE d", dept_no=dept_no)
+        result = tx.run(DELETE_DEPARTMENT, dept_no=dept_no)
+        return result.consume().counters.nodes_deleted > 0
 
     def delete_employee(self, emp_no):
-        with self._driver.session() as session:
-            session.execute_write(self._delete_employee, emp_no)
+        deleted, dept_no = self._write(self._delete_employee, emp_no, self.team_aggregates)
+        self._invalidate(('employee', emp_no), ('has_employees', dept_no))
+        return deleted
 
     @staticmethod
-    def _delete_employee(tx, emp_no):
-        tx.run("MATCH (e:Employee {emp_no: $emp_no}) DETACH DELETE e", emp_no=emp_no)
+    def _delete_employee(tx, emp_no, teams=False):
+        result = tx.run(DELETE_EMPLOYEE, emp_no=emp_no)
+        record = result.single()
+        if record:
+            if teams:
+                CRUD._refresh_teams(tx, [record['mgr']])
+            return True, record['dept_no']
+        return False, None
 
 
+    def delete_department_if_empty(self, dept_no):
+        # Comprobación y borrado en una sola sentencia; devuelve OK, HAS_EMPLOYEES o NOT_FOUND
+        status = self._write(self._delete_department_if_empty, dept_no)
+        if status == OK:
+            self._invalidate(('department', dept_no), ('has_employees', dept_no))
+        return status
+
+    @staticmethod
+    def _delete_department_if_empty(tx, dept_no):
+        result = tx.run(DELETE_DEPARTMENT_IF_EMPTY, dept_no=dept_no)
+        return result.single()['status']
+
+    # Borrados masivos: cada sentencia borra como mucho DELETE_ROUND_BATCHES lotes con
+    # CALL { ... } IN TRANSACTIONS, de modo que ninguna transacción pasa de batch_size filas,
+    # y entre sentencia y sentencia se llama a progress con los totales acumulados
+    def delete_department_cascade(self, dept_no, batch_size=BATCH_SIZE, progress=None):
+        report = self._delete_in_batches('delete_department_cascade', DELETE_DEPARTMENT_EMPLOYEES, 'nodes_deleted', batch_size, progress, dept_no=dept_no)
+        report['department_deleted'] = self._write(self._delete_department, dept_no)
+        if self.team_aggregates:
+            # Los empleados borrados pueden estar en cualquier parte de la jerarquía
+            self.rebuild_team_aggregates(batch_size)
+        self.mark_reset('Employee')
+        self._invalidate(('department', dept_no), ('has_employees', dept_no))
+        self._invalidate_department_employees(dept_no)
+        return report
+
+    def delete_employees_where(self, name_prefix=None, job=None, dept_no=None, min_sal=None, max_sal=None,
+                               hired_from=None, hired_to=None, batch_size=BATCH_SIZE, progress=None):
+        # Mismos filtros que search_employees (sin el de texto); sin ninguno se usaría delete_all
+        filters = {'name_prefix': name_prefix, 'job': job, 'dept_no': dept_no, 'min_sal': min_sal, 'max_sal': max_sal,
+                   'hired_from': hired_from, 'hired_to': hired_to}
+        if not _filter_conditions(filters):
+            raise ValueError("delete_employees_where necesita al menos un filtro")
+        report = self._delete_in_batches('delete_employees_where', delete_employees_where_query(filters), 'nodes_deleted', batch_size, progress, **filters)
+        if self.team_aggregates:
+            self.rebuild_team_aggregates(batch_size)
+        self.mark_reset('Employee')
+        if self._cache:
+            # No se sabe qué claves se han borrado sin leerlas: se descartan todas las de empleados
+            self._cache.invalidate_where(lambda key, value: key[0] in ('employee', 'has_employees'))
+        return report
+
+    def _delete_in_batches(self, name, query, counter, batch_size, progress, **parameters):
+        # `query` viene de consultas.in_batches; se repite hasta que una sentencia borra menos de lo que podía
+        limit = batch_size * DELETE_ROUND_BATCHES
+        report = {'nodes_deleted': 0, 'relationships_deleted': 0}
+        while True:
+            counters = self._run(name, query, limit=limit, batch_size=batch_size, **parameters).counters
+            report['nodes_deleted'] += counters.nodes_deleted
+            report['relationships_deleted'] += counters.relationships_deleted
+            if progress:
+                progress(dict(report))
+            if getattr(counters, counter) < limit:
+                return report
+
     def department_has_employees(self, dept_no):
-        with self._driver.session() as session:
-            result = session.execute_read(self._department_has_employees, dept_no)
-            return result
+        return self._cached(('has_employees', dept_no), self._load_department_has_employees, dept_no)
+
+    def _load_department_has_employees(self, dept_no):
+        return self._read(self._department_has_employees, dept_no)
 
     @staticmethod
     def _department_has_employees(tx, dept_no):
-        result = tx.run("""
-            MATCH (e:Employee {dept_no: $dept_no})
-            RETURN COUNT(e) > 0 AS hasEmployees
-        """, dept_no=dept_no)
+        result = tx.run(DEPARTMENT_HAS_EMPLOYEES, dept_no=dept_no)
         return result.single()[0]
 
 #ALL
 
-    def delete_all(self):
-            query = """
-            MATCH (n)
-            DETACH DELETE n
-            """
-            with self._driver.session() as session:
-                session.run(query)
-            print("Todos los nodos han sido borrados.")	
+    def delete_all(self, batch_size=BATCH_SIZE, progress=None):
+            # Primero las relaciones y luego los nodos, para que ningún lote arrastre un nodo con
+            # muchas relaciones (un departamento grande) a una sola transacción. Los contadores de
+            # cambios se conservan para que los clientes sepan que tienen que recargar
+            report = self._delete_in_batches('delete_all', DELETE_ALL_RELATIONSHIPS, 'relationships_deleted', batch_size, progress)
+            nodes = self._delete_in_batches('delete_all', DELETE_ALL_NODES, 'nodes_deleted', batch_size, progress)
+            report['nodes_deleted'] += nodes['nodes_deleted']
+            report['relationships_deleted'] += nodes['relationships_deleted']
+            for label in TRACKED:
+                self.mark_reset(label)
+            if self._cache:
+                self._cache.clear()
+            print("Todos los nodos han sido borrados.")
+            return report
 
     def see_all_D(self):
         all_departments = crud.read_all_departments()
         print("\nTodos los departamentos:")
         for department in all_departments:
-            print("Department ID:", department.element_id)
+            print("Department ID:", department.dept_no)
             print("Properties:")
-            for key, value in department.items():
+            for key, value in department._asdict().items():
                 print(f"  {key}: {value}")
             print()
 
@@ -191,32 +904,126 @@ class CRUD:
         all_employees = crud.read_all_employees()
         print("\nTodos los empleados:")
         for employee in all_employees:
-            print("Employee ID:", employee.element_id)
+            print("Employee ID:", employee.emp_no)
             print("Properties:")
-            for key, value in employee.items():
+            for key, value in employee._asdict().items():
                 print(f"  {key}: {value}")
             print()
 
-#SCOTT
-
-    def insert_scott_D(self):
-        crud.create_department(10, 'ACCOUNTING', 'NEW YORK')
-        crud.create_department(20, 'RESEARCH', 'DALLAS')
-        crud.create_department(30, 'SALES', 'CHICAGO')
-        crud.create_department(40, 'OPERATIONS', 'BOSTON')  
-
-    def insert_scott_E(self):
-        crud.create_employee(7369, 'SMITH', 'CLERK', 7902, datetime(1980, 12, 17), 800, None, 20)
-        crud.create_employee(7499, 'ALLEN', 'SALESMAN', 7698, datetime(1981, 2, 20), 1600, 300, 30)
-        crud.create_employee(7521, 'WARD', 'SALESMAN', 7698, datetime(1981, 2, 22), 1250, 500, 30)
-        crud.create_employee(7566, 'JONES', 'MANAGER', 7839, datetime(1981, 4, 2), 2975, None, 20)
-        crud.create_employee(7654, 'MARTIN', 'SALESMAN', 7698, datetime(1981, 9, 28), 1250, 1400, 30)
-        crud.create_employee(7698, 'BLAKE', 'MANAGER', 7839, datetime(1981, 5, 1), 2850, None, 30)
-        crud.create_employee(7782, 'CLARK', 'MANAGER', 7839, datetime(1981, 6, 9), 2450, None, 10)
-        crud.create_employee(7788, 'SCOTT', 'ANALYST', 7566, datetime(1987, 7, 13), 3000, None, 20)
-        crud.create_employee(7839, 'KING', 'PRESIDENT', None, datetime(1981, 11, 17), 5000, None, 10)
-        crud.create_employee(7844, 'TURNER', 'SALESMAN', 7698, datetime(1981, 9, 8), 1500, 0, 30)
-        crud.create_employee(7876, 'ADAMS', 'CLERK', 7788, datetime(1987, 7, 13), 1100, None, 20)
-        crud.create_employee(7900, 'JAMES', 'CLERK', 7698, datetime(1981, 12, 3), 950, None, 30)
-        crud.create_employee(7902, 'FORD', 'ANALYST', 7566, datetime(1981, 12, 3), 3000, None, 20)
-        crud.create_employee(7934, 'MILLER', 'CLERK', 7782, datetime(1982, 1, 23), 1300, None, 10)
\ No newline at end of file
+
+class UnitOfWork:
+    # Operaciones del CRUD sobre una transacción ya abierta (ver CRUD.transaction y CRUD.run_in_transaction).
+    # Las lecturas no pasan por la caché y las invalidaciones se aplican solo tras el commit
+    def __init__(self, tx, teams=False):
+        self._tx = tx
+        self._teams = teams
+        self.committed = False
+        self.invalidated_keys = set()
+        self.invalidated_departments = set()
+
+    def commit(self):
+        self._tx.commit()
+        self.committed = True
+
+    def rollback(self):
+        self._tx.rollback()
+        self.invalidated_keys.clear()
+        self.invalidated_departments.clear()
+
+    def _touch(self, *keys):
+        self.invalidated_keys.update(keys)
+
+#CREATE
+
+    def create_department(self, dept_no, dname, loc):
+        self._touch(('department', dept_no), ('has_employees', dept_no))
+        return CRUD._create_department(self._tx, dept_no, dname, loc)
+
+    def create_employee(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
+        self._touch(('employee', emp_no), ('department', dept_no), ('has_employees', dept_no))
+        return CRUD._create_employee(self._tx, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no, self._teams)
+
+    def create_employee_checked(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
+        result = CRUD._create_employee_checked(self._tx, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no, self._teams)
+        if result['status'] == OK:
+            self._touch(('employee', emp_no), ('has_employees', dept_no))
+        return result
+
+#READ
+
+    def read_department(self, dept_no):
+        return CRUD._read_department(self._tx, dept_no)
+
+    def read_employee(self, emp_no):
+        return CRUD._read_employee(self._tx, emp_no)
+
+    def read_all_departments(self, as_tuples=False):
+        return CRUD._read_all_departments(self._tx, as_tuples)
+
+    def read_all_employees(self, as_tuples=False):
+        return CRUD._read_all_employees(self._tx, as_tuples)
+
+    def read_departments_page(self, after_dept_no=None, limit=PAGE_SIZE, as_tuples=False):
+        return CRUD._read_departments_page(self._tx, after_dept_no, limit, as_tuples)
+
+    def read_employees_page(self, after_emp_no=None, limit=PAGE_SIZE, order_by='emp_no', after_key=None, as_tuples=False):
+        if order_by not in EMPLOYEE_ORDER_KEYS:
+            raise ValueError(f"No se puede paginar por {order_by}")
+        return CRUD._read_employees_page(self._tx, after_emp_no, limit, order_by, after_key, as_tuples)
+
+    def search_employees(self, name_prefix=None, job=None, dept_no=None, min_sal=None, max_sal=None,
+                         hired_from=None, hired_to=None, text=None, after_emp_no=None, limit=PAGE_SIZE):
+        filters = {'name_prefix': name_prefix, 'job': job, 'dept_no': dept_no, 'min_sal': min_sal, 'max_sal': max_sal,
+                   'hired_from': hired_from, 'hired_to': hired_to, 'text': _fuzzy_query(text) if text else None}
+        return CRUD._search_employees(self._tx, filters, after_emp_no, limit)
+
+    def department_has_employees(self, dept_no):
+        return CRUD._department_has_employees(self._tx, dept_no)
+
+    def reporting_chain(self, emp_no):
+        return CRUD._reporting_chain(self._tx, emp_no)
+
+    def subordinates(self, emp_no, max_depth=None):
+        return CRUD._subordinates(self._tx, emp_no, max_depth)
+
+    def span_of_control(self, emp_no):
+        return CRUD._span_of_control(self._tx, emp_no)
+
+    def team_stats(self, emp_nos):
+        return CRUD._team_stats(self._tx, list(emp_nos))
+
+#UPDATE
+
+    def update_department(self, dept_no, new_dname, new_loc):
+        self._touch(('department', dept_no))
+        self.invalidated_departments.add(dept_no)
+        return CRUD._update_department(self._tx, dept_no, new_dname, new_loc)
+
+    def update_employee(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
+        employee, old_dept_no = CRUD._update_employee(self._tx, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no, self._teams)
+        self._touch(('employee', emp_no), ('has_employees', old_dept_no), ('has_employees', new_dept_no))
+        return employee
+
+    def update_employee_checked(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
+        result, old_dept_no = CRUD._update_employee_checked(self._tx, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no, self._teams)
+        if result['status'] == OK:
+            self._touch(('employee', emp_no), ('has_employees', old_dept_no), ('has_employees', new_dept_no))
+        return result
+
+#DELETE
+
+    def delete_department(self, dept_no):
+        self._touch(('department', dept_no), ('has_employees', dept_no))
+        self.invalidated_departments.add(dept_no)
+        return CRUD._delete_department(self._tx, dept_no)
+
+    def delete_employee(self, emp_no):
+        deleted, dept_no = CRUD._delete_employee(self._tx, emp_no, self._teams)
+        self._touch(('employee', emp_no), ('has_employees', dept_no))
+        return deleted
+
+    def delete_department_if_empty(self, dept_no):
+        status = CRUD._delete_department_if_empty(self._tx, dept_no)
+        if status == OK:
+            self._touch(('department', dept_no), ('has_employees', dept_no))
+        return status
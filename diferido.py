@@ -0,0 +1,199 @@
+import threading
+import time
+from almacen import BATCH_SIZE, chunks
+from modelos import DEPARTMENT_FIELDS, EMPLOYEE_FIELDS
+
+# Escritura diferida (write-behind) delante del CRUD: las altas, cambios y bajas hechas desde la
+# interfaz se guardan por clave (etiqueta, dept_no/emp_no) y varias escrituras sobre la misma fila se
+# combinan en una sola. Un hilo las vuelca en lotes (bulk_* del CRUD, una transacción por lote) al
+# llegar a max_pending operaciones, a los flush_interval segundos de la primera pendiente o al cerrar.
+# Si un lote falla se reintenta fila a fila solo ese lote (los anteriores ya se confirmaron), y cada volcado informa de las filas escritas y del error
+# de cada una de las que no se pudieron escribir
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+REPLACE = 'replace'  # borrado seguido de un alta con la misma clave
+
+FIELDS = {'Department': DEPARTMENT_FIELDS, 'Employee': EMPLOYEE_FIELDS}
+
+# (operación pendiente, operación nueva) -> operación que queda; None descarta las dos.
+# Las combinaciones que no aparecen se quedan con la nueva
+COALESCE = {
+    (CREATE, UPDATE): CREATE,
+    (CREATE, DELETE): None,
+    (REPLACE, UPDATE): REPLACE,
+    (REPLACE, DELETE): DELETE,
+    (DELETE, CREATE): REPLACE,
+    (DELETE, UPDATE): DELETE,
+}
+
+# Orden de volcado: primero las bajas (de empleados antes que de departamentos, que solo se borran
+# vacíos), luego altas y cambios de departamentos y por último los de empleados, que dependen de ellos.
+# (etiqueta, operaciones, método del CRUD, error si la fila no se escribió; None si no puede faltar)
+STEPS = (
+    ('Employee', (DELETE, REPLACE), 'bulk_delete_employees', "El empleado no existe"),
+    ('Department', (DELETE, REPLACE), 'bulk_delete_departments', "El departamento no existe o tiene empleados"),
+    ('Department', (CREATE, REPLACE), 'bulk_create_departments', None),
+    ('Department', (UPDATE,), 'bulk_update_departments', "El departamento no existe"),
+    ('Employee', (CREATE, REPLACE), 'bulk_create_employees', None),
+    ('Employee', (UPDATE,), 'bulk_update_employees', "El empleado, su manager o su departamento no existen, o el manager está por debajo del empleado"),
+)
+
+
+def _message(error):
+    return getattr(error, 'message', None) or str(error)
+
+
+class WriteBehindBuffer:
+    def __init__(self, crud, max_pending=100, flush_interval=2.0, batch_size=BATCH_SIZE, on_flushed=None, on_pending=None):
+        self.crud = crud
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.on_flushed = on_flushed  # on_flushed(informe) tras cada volcado, desde el hilo de volcado
+        self.on_pending = on_pending  # on_pending(número de operaciones sin confirmar) al cambiar
+
+        self._pending = {}  # (etiqueta, clave) -> (operación, fila)
+        self._in_flight = {}  # lo que se está volcando ahora mismo
+        self._due = None  # instante (monotonic) en que hay que volcar lo pendiente
+        self._closed = False
+        self._changed = threading.Condition()
+        self._flushing = threading.Lock()  # un solo volcado a la vez
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+#QUEUE
+
+    def create_department(self, dept_no, dname, loc):
+        self._enqueue('Department', CREATE, (dept_no, dname, loc))
+
+    def update_department(self, dept_no, new_dname, new_loc):
+        self._enqueue('Department', UPDATE, (dept_no, new_dname, new_loc))
+
+    def delete_department(self, dept_no):
+        self._enqueue('Department', DELETE, (dept_no,))
+
+    def create_employee(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
+        self._enqueue('Employee', CREATE, (emp_no, ename, job, mgr, hire_date, sal, comm, dept_no))
+
+    def update_employee(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
+        self._enqueue('Employee', UPDATE, (emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no))
+
+    def delete_employee(self, emp_no):
+        self._enqueue('Employee', DELETE, (emp_no,))
+
+    def _enqueue(self, label, operation, values):
+        row = dict(zip(FIELDS[label], values))
+        key = (label, values[0])
+        with self._changed:
+            if self._closed:
+                raise RuntimeError("La escritura diferida ya está cerrada")
+            previous = self._pending.get(key)
+            if previous is not None:
+                if (previous[0], operation) == (DELETE, UPDATE):
+                    row = previous[1]
+                operation = COALESCE.get((previous[0], operation), operation)
+            if operation is None:
+                del self._pending[key]
+            else:
+                self._pending[key] = (operation, row)
+            if self._due is None:
+                self._due = time.monotonic() + self.flush_interval
+            self._changed.notify()
+            count = len(self._pending) + len(self._in_flight)
+        if self.on_pending:
+            self.on_pending(count)
+
+#STATE
+
+    def pending_count(self):
+        with self._changed:
+            return len(self._pending) + len(self._in_flight)
+
+    def pending(self, label, key):
+        # (operación, fila como diccionario) aún sin confirmar para esa clave, o None
+        with self._changed:
+            return self._pending.get((label, key)) or self._in_flight.get((label, key))
+
+    def is_pending(self, label, key):
+        return self.pending(label, key) is not None
+
+#FLUSH
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._closed and not self._should_flush():
+                    self._changed.wait(None if self._due is None else max(0.0, self._due - time.monotonic()))
+                if self._closed:
+                    return
+            self.flush()
+
+    def _should_flush(self):
+        if not self._pending:
+            return False
+        return len(self._pending) >= self.max_pending or time.monotonic() >= self._due
+
+    def flush(self):
+        # Vuelca lo pendiente ahora y devuelve el informe {'written': [(etiqueta, clave)], 'errors': {(etiqueta, clave): mensaje}}
+        with self._flushing:
+            with self._changed:
+                batch, self._pending, self._due = self._pending, {}, None
+                self._in_flight = batch
+            report = {'written': [], 'errors': {}}
+            if not batch:
+                return report
+            try:
+                for label, operations, method, missing in STEPS:
+                    entries = [(key, operation, row) for key, (operation, row) in batch.items()
+                               if key[0] == label and operation in operations]
+                    if entries:
+                        self._apply(method, missing, entries, report['errors'])
+            finally:
+                with self._changed:
+                    self._in_flight = {}
+                    count = len(self._pending)
+            report['written'] = [key for key in batch if key not in report['errors']]
+        if self.on_pending:
+            self.on_pending(count)
+        if self.on_flushed:
+            self.on_flushed(report)
+        return report
+
+    def _apply(self, method, missing, entries, errors):
+        # Cada trozo de batch_size filas es una llamada al CRUD y una transacción: si uno falla, los
+        # anteriores ya están confirmados y solo ese se repite fila a fila para quedarse con el error de
+        # las que fallan. Cualquier error cuenta (también perder la conexión): lo volcado no vuelve a la cola
+        written = set()
+        for chunk in chunks(entries, self.batch_size):
+            try:
+                written |= self._write(method, chunk)
+            except Exception:
+                for entry in chunk:
+                    try:
+                        written |= self._write(method, [entry])
+                    except Exception as error:
+                        errors[entry[0]] = _message(error)
+        for key, operation, row in entries:
+            # En un REPLACE no importa que la fila ya no existiera al borrarla
+            if missing and operation != REPLACE and key[1] not in written and key not in errors:
+                errors[key] = missing
+
+    def _write(self, method, entries):
+        # Claves escritas; las altas no las devuelven, si no fallan se escribieron todas
+        if method.startswith('bulk_delete'):
+            result = getattr(self.crud, method)([key[1] for key, _, _ in entries], self.batch_size)
+        else:
+            result = getattr(self.crud, method)([row for _, _, row in entries], self.batch_size)
+        if method.startswith('bulk_create'):
+            return {key[1] for key, _, _ in entries}
+        return set(result)
+
+    def close(self):
+        # Para el hilo y vuelca lo que quede; devuelve el informe de ese último volcado
+        with self._changed:
+            self._closed = True
+            self._changed.notify()
+        self._thread.join()
+        return self.flush()
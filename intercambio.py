@@ -0,0 +1,299 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import date, datetime
+from almacen import BATCH_SIZE, FETCH_SIZE
+from config import load_config
+from memoria import MemoryCRUD
+from modelos import DEPARTMENT_FIELDS, EMPLOYEE_FIELDS
+
+# Importación y exportación de departamentos y empleados en CSV o JSONL (un objeto JSON por línea).
+# Todo se procesa en streaming: la exportación lee con fetch_size y la importación escribe lotes
+# de batch_size filas, así ficheros de varios GB no se cargan nunca enteros en memoria.
+# La importación guarda un punto de control tras cada lote para poder reanudarse, y las filas que
+# no se pueden convertir o escribir van a un informe de errores en JSONL con su número de línea.
+
+FORMATS = ('csv', 'jsonl')
+
+# Cada cuántas filas se avisa del progreso al exportar
+PROGRESS_EVERY = 10000
+
+
+def format_of(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt == 'json':
+        fmt = 'jsonl'
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt}")
+    return fmt
+
+
+def _serialize(value):
+    # Las filas ya traen las fechas como objetos de Python; se escriben en ISO 8601
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+#EXPORT
+
+def export_departments(crud, path, fmt=None, fetch_size=FETCH_SIZE, progress=None):
+    return _export(crud.iter_departments(fetch_size, as_tuples=True), DEPARTMENT_FIELDS, path, format_of(path, fmt), progress)
+
+
+def export_employees(crud, path, fmt=None, fetch_size=FETCH_SIZE, progress=None):
+    return _export(crud.iter_employees(fetch_size, as_tuples=True), EMPLOYEE_FIELDS, path, format_of(path, fmt), progress)
+
+
+def _export(rows, fields, path, fmt, progress):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        if fmt == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(fields)
+            write = lambda row: writer.writerow(['' if value is None else _serialize(value) for value in row])
+        else:
+            write = lambda row: file.write(json.dumps(dict(zip(fields, map(_serialize, row))), ensure_ascii=False) + '\n')
+        for row in rows:
+            write(row)
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress({'rows': count})
+    if progress:
+        progress({'rows': count})
+    return count
+
+
+#IMPORT
+
+def _optional(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _int(value):
+    value = _optional(value)
+    return None if value is None else int(value)
+
+
+def _number(value):
+    value = _optional(value)
+    if value is None or isinstance(value, (int, float)):
+        return value
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _datetime(value):
+    value = _optional(value)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, "%d/%m/%Y")
+
+
+def parse_department(raw):
+    dept_no = _int(raw.get('dept_no'))
+    if dept_no is None:
+        raise ValueError("Falta dept_no")
+    return (dept_no, _optional(raw.get('dname')), _optional(raw.get('loc')))
+
+
+def parse_employee(raw):
+    emp_no = _int(raw.get('emp_no'))
+    dept_no = _int(raw.get('dept_no'))
+    if emp_no is None or dept_no is None:
+        raise ValueError("Faltan emp_no o dept_no")
+    return (emp_no, _optional(raw.get('ename')), _optional(raw.get('job')), _int(raw.get('mgr')),
+            _datetime(raw.get('hire_date')), _number(raw.get('sal')), _number(raw.get('comm')), dept_no)
+
+
+class _Source:
+    # Lee el fichero en binario línea a línea para poder informar de los bytes leídos
+    def __init__(self, path):
+        self.path = path
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+
+    def lines(self, file):
+        for line in file:
+            self.bytes_read += len(line)
+            yield line.decode('utf-8-sig' if self.bytes_read == len(line) else 'utf-8')
+
+    def rows(self, fmt):
+        # Genera (número de línea, diccionario o excepción si la línea no se puede leer)
+        with open(self.path, 'rb') as file:
+            if fmt == 'csv':
+                reader = csv.DictReader(self.lines(file))
+                while True:
+                    try:
+                        raw = next(reader)
+                    except StopIteration:
+                        return
+                    except csv.Error as error:
+                        yield reader.line_num, error
+                        continue
+                    yield reader.line_num, raw
+            else:
+                for line_no, line in enumerate(self.lines(file), 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield line_no, json.loads(line)
+                    except ValueError as error:
+                        yield line_no, error
+
+
+def import_departments(crud, path, fmt=None, batch_size=BATCH_SIZE, progress=None, checkpoint=None, errors=None):
+    return _import(crud, crud.bulk_create_departments, parse_department, path, format_of(path, fmt), batch_size, progress, checkpoint, errors)
+
+
+def import_employees(crud, path, fmt=None, batch_size=BATCH_SIZE, progress=None, checkpoint=None, errors=None):
+    return _import(crud, crud.bulk_create_employees, parse_employee, path, format_of(path, fmt), batch_size, progress, checkpoint, errors)
+
+
+def _load_checkpoint(checkpoint, path):
+    # Filas del fichero ya procesadas en una ejecución anterior (0 si no hay punto de control válido)
+    if not checkpoint or not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint) as file:
+        state = json.load(file)
+    if state.get('path') != os.path.abspath(path) or state.get('size') != os.path.getsize(path):
+        return 0
+    return state['rows']
+
+
+def _save_checkpoint(checkpoint, path, rows):
+    # Se escribe en un temporal y se renombra para no dejar nunca un punto de control a medias
+    temporary = checkpoint + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump({'path': os.path.abspath(path), 'size': os.path.getsize(path), 'rows': rows}, file)
+    os.replace(temporary, checkpoint)
+
+
+def _import(crud, bulk_create, parse, path, fmt, batch_size, progress, checkpoint, errors):
+    source = _Source(path)
+    resume_from = _load_checkpoint(checkpoint, path)
+    report = {'rows': 0, 'imported': 0, 'errors': 0, 'skipped': resume_from}
+    error_file = open(errors, 'a' if resume_from else 'w', encoding='utf-8') if errors else None
+
+    def record_error(line_no, raw, error):
+        report['errors'] += 1
+        if error_file:
+            error_file.write(json.dumps({'line': line_no, 'error': str(error), 'row': raw}, ensure_ascii=False, default=str) + '\n')
+
+    def write(batch):
+        # Si el lote falla (p. ej. una clave duplicada) se reintenta fila a fila para aislar las erróneas
+        try:
+            bulk_create([row for _, _, row in batch], batch_size)
+            report['imported'] += len(batch)
+        except crud.write_errors:
+            for line_no, raw, row in batch:
+                try:
+                    bulk_create([row], batch_size)
+                    report['imported'] += 1
+                except crud.write_errors as error:
+                    record_error(line_no, raw, error)
+
+    def flush(batch):
+        if batch:
+            write(batch)
+            batch.clear()
+        if checkpoint:
+            _save_checkpoint(checkpoint, path, report['rows'])
+        if error_file:
+            error_file.flush()
+        if progress:
+            progress({'rows': report['rows'], 'bytes': source.bytes_read, 'total_bytes': source.total_bytes})
+
+    try:
+        batch = []
+        for line_no, raw in source.rows(fmt):
+            report['rows'] += 1
+            if report['rows'] <= resume_from:
+                continue
+            if isinstance(raw, Exception):
+                record_error(line_no, None, raw)
+                continue
+            try:
+                batch.append((line_no, raw, parse(raw)))
+            except (ValueError, TypeError, AttributeError) as error:
+                record_error(line_no, raw, error)
+                continue
+            if len(batch) >= batch_size:
+                flush(batch)
+        flush(batch)
+    finally:
+        if error_file:
+            error_file.close()
+    # Terminado: el punto de control ya no hace falta
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return report
+
+
+#CLI
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa o exporta departamentos y empleados en CSV o JSONL")
+    parser.add_argument('--config', help="fichero de configuración (por defecto, CRUD_CONFIG o crud.ini)")
+    parser.add_argument('--uri', help="por defecto, el de la configuración")
+    parser.add_argument('--user', help="por defecto, el de la configuración")
+    parser.add_argument('--password', help="por defecto, la de la configuración")
+    parser.add_argument('--snapshot', help="usa el almacén en memoria guardado en este fichero en lugar de Neo4j")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="exporta una etiqueta a un fichero")
+    export.add_argument('label', choices=['departments', 'employees'])
+    export.add_argument('path')
+    export.add_argument('--format', choices=FORMATS, help="por defecto, según la extensión del fichero")
+    export.add_argument('--fetch-size', type=int, default=FETCH_SIZE)
+
+    load = commands.add_parser('import', help="importa un fichero a una etiqueta")
+    load.add_argument('label', choices=['departments', 'employees'])
+    load.add_argument('path')
+    load.add_argument('--format', choices=FORMATS, help="por defecto, según la extensión del fichero")
+    load.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    load.add_argument('--checkpoint', help="punto de control para reanudar (por defecto, <path>.checkpoint)")
+    load.add_argument('--errors', help="informe de filas erróneas (por defecto, <path>.errors.jsonl)")
+    args = parser.parse_args(argv)
+
+    def show(state):
+        if 'total_bytes' in state and state['total_bytes']:
+            print(f"\r{state['rows']} filas ({100 * state['bytes'] / state['total_bytes']:.1f}%)", end='', file=sys.stderr)
+        else:
+            print(f"\r{state['rows']} filas", end='', file=sys.stderr)
+
+    if args.snapshot:
+        crud = MemoryCRUD(args.snapshot)
+    else:
+        # El driver de Neo4j solo se importa si se usa
+        from crud import CRUD
+        config = load_config(args.config)
+        config.update({name: getattr(args, name) for name in ('uri', 'user', 'password') if getattr(args, name) is not None})
+        crud = CRUD(**config)
+    try:
+        if args.command == 'export':
+            export_rows = export_departments if args.label == 'departments' else export_employees
+            count = export_rows(crud, args.path, args.format, args.fetch_size, show)
+            print(f"\nExportadas {count} filas a {args.path}", file=sys.stderr)
+        else:
+            import_rows = import_departments if args.label == 'departments' else import_employees
+            report = import_rows(crud, args.path, args.format, args.batch_size, show,
+                                 args.checkpoint or args.path + '.checkpoint', args.errors or args.path + '.errors.jsonl')
+            print(file=sys.stderr)
+            print(json.dumps(report))
+            return 1 if report['errors'] else 0
+    finally:
+        crud.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,469 @@
+import bisect
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-from crud import CRUD
+from tkinter import filedialog
+from almacen import PAGE_SIZE, OK, MISSING_MANAGER, MISSING_DEPARTMENT, CYCLE, DUPLICATE, HAS_EMPLOYEES
+from modelos import DepartmentRow, EmployeeRow, EmployeeTeamRow, TeamRow, EMPLOYEE_FIELDS
+from tareas import BackgroundRunner
+from diferido import DELETE
+import intercambio
+
+# Espera tras la última pulsación antes de lanzar la búsqueda
+SEARCH_DELAY_MS = 300
+
+# Intervalo de consulta de cambios hechos por otros clientes
+CHANGE_POLL_MS = 2000
+
+
+def display_date(value):
+    return value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else value
+
+
+def overlay_pending(buffer, label, rows, id_of):
+    # Aplica a las filas leídas las escrituras diferidas que aún no se han volcado (se llama en segundo plano)
+    if buffer is None:
+        return rows
+    shown = []
+    for row in rows:
+        pending = buffer.pending(label, id_of(row))
+        if pending is None:
+            shown.append(row)
+        elif pending[0] != DELETE:
+            shown.append(row._replace(**pending[1]))
+    return shown
+
+
+class PagedTree:
+    # Mantiene en el Treeview solo una ventana de páginas y pide más a medida que se desplaza.
+    # Guarda un mapa clave -> item para aplicar solo los cambios en lugar de borrar y reinsertar todo
+    def __init__(self, tree, scrollbar, runner, fetch_page, id_of, key_of, values_of, page_size=PAGE_SIZE, max_pages=3, tags_of=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.runner = runner
+        self.fetch_page = fetch_page  # fetch_page(after, limit) -> filas, se ejecuta en segundo plano
+        self.id_of = id_of  # clave de la fila (emp_no / dept_no)
+        self.key_of = key_of  # cursor de una fila para pedir la página siguiente (None si queda fuera del orden)
+        self.values_of = values_of
+        self.tags_of = tags_of or (lambda row_id: ())  # etiquetas de estilo del item según la clave
+        self.page_size = page_size
+        self.max_pages = max_pages
+
+        self.pages = []  # [cursor anterior, ids de los items, cursor de la última fila]
+        self.previous = []  # cursores de las páginas descartadas por arriba
+        self.items = {}  # clave -> id del item
+        self.rows = {}  # id del item -> (clave, cursor, valores)
+        self.exhausted = False
+        self.loaded = False  # ya llegó la primera página
+        self._loaded_callbacks = []
+        self._busy = False
+        self._scheduled = False
+
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.configure(command=self.tree.yview)
+
+    def reset(self):
+        # Una recarga deja obsoleta cualquier página que todavía se esté pidiendo
+        self.tree.delete(*self.tree.get_children())
+        self.pages = []
+        self.previous = []
+        self.items = {}
+        self.rows = {}
+        self.exhausted = False
+        self._request(None, self.page_size, lambda rows: self._show_next(None, rows))
+
+    def refresh(self):
+        # Vuelve a pedir la ventana cargada y aplica solo las diferencias
+        if not self.pages:
+            self.reset()
+            return
+        after = self.pages[0][0]
+        loaded = sum(len(page[1]) for page in self.pages)
+        last = self.pages[-1][2]
+        exhausted = self.exhausted
+        self._request(after, loaded + self.page_size, lambda rows: self._apply_window(after, rows, last, exhausted))
+
+    def when_loaded(self, callback):
+        # callback() en cuanto se muestre la primera página (o ya, si se mostró)
+        if self.loaded:
+            callback()
+        else:
+            self._loaded_callbacks.append(callback)
+
+    def selected_id(self):
+        selected = self.tree.selection()
+        return self.rows[selected[0]][0] if selected else None
+
+    def upsert(self, row):
+        # Inserta o actualiza una fila si cae dentro de la ventana cargada
+        row_id = self.id_of(row)
+        cursor = self.key_of(row)
+        values = self.values_of(row)
+        item = self.items.get(row_id)
+        if item is not None:
+            if self.rows[item][1] == cursor:
+                self.rows[item] = (row_id, cursor, values)
+                self.tree.item(item, values=values, tags=self.tags_of(row_id))
+                return
+            self.remove(row_id)
+        if cursor is None:
+            return
+        if not self.pages:
+            if self.exhausted:
+                self.pages.append([None, [], cursor])
+            else:
+                return
+        offset = 0
+        for index, page in enumerate(self.pages):
+            after, items, page_last = page
+            is_last = index == len(self.pages) - 1
+            if (after is None or cursor > after) and (cursor <= page_last or (is_last and self.exhausted)):
+                position = bisect.bisect_left([self.rows[i][1] for i in items], cursor)
+                item = self._insert(offset + position, row_id, cursor, values)
+                items.insert(position, item)
+                if cursor > page_last:
+                    page[2] = cursor
+                return
+            offset += len(items)
+
+    def remove(self, row_id):
+        item = self.items.get(row_id)
+        if item is None:
+            return
+        for page in self.pages:
+            if item in page[1]:
+                page[1].remove(item)
+                break
+        self._delete([item])
+
+    def retag(self, row_ids):
+        # Recalcula las etiquetas de las filas cargadas (p. ej. al confirmarse una escritura diferida)
+        for row_id in row_ids:
+            item = self.items.get(row_id)
+            if item is not None:
+                self.tree.item(item, tags=self.tags_of(row_id))
+
+    def _insert(self, index, row_id, cursor, values):
+        item = self.tree.insert('', index, values=values, tags=self.tags_of(row_id))
+        self.items[row_id] = item
+        self.rows[item] = (row_id, cursor, values)
+        return item
+
+    def _delete(self, items):
+        for item in items:
+            del self.items[self.rows.pop(item)[0]]
+        self.tree.delete(*items)
+
+    def _apply_window(self, after, rows, last, exhausted):
+        # Si no se había llegado al final, lo que quede más allá del último cursor sigue sin cargarse
+        if not exhausted:
+            rows = [row for row in rows if self.key_of(row) <= last]
+        fresh = {self.id_of(row) for row in rows}
+        self._delete([item for row_id, item in self.items.items() if row_id not in fresh])
+        ordered = []
+        for index, row in enumerate(rows):
+            row_id = self.id_of(row)
+            cursor = self.key_of(row)
+            values = self.values_of(row)
+            item = self.items.get(row_id)
+            if item is None:
+                item = self._insert(index, row_id, cursor, values)
+            else:
+                if self.rows[item][2] != values:
+                    self.tree.item(item, values=values)
+                self.rows[item] = (row_id, cursor, values)
+                if self.tree.index(item) != index:
+                    self.tree.move(item, '', index)
+            ordered.append(item)
+        # Reparte de nuevo los items en páginas
+        self.pages = []
+        for start in range(0, len(ordered), self.page_size):
+            chunk = ordered[start:start + self.page_size]
+            self.pages.append([after, chunk, self.rows[chunk[-1]][1]])
+            after = self.pages[-1][2]
+        if self.pages and not exhausted:
+            self.pages[-1][2] = max(self.pages[-1][2], last)
+        self.exhausted = exhausted
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._busy or self._scheduled:
+            return
+        if float(last) >= 0.9 and not self.exhausted and self.pages:
+            self._schedule(self._load_next)
+        elif float(first) <= 0.1 and self.previous:
+            self._schedule(self._load_previous)
+
+    def _schedule(self, load):
+        def run():
+            self._scheduled = False
+            load()
+        self._scheduled = True
+        self.tree.after_idle(run)
+
+    def _request(self, after, limit, show):
+        self._busy = True
+        self.runner.submit(self.fetch_page, after, limit,
+                           on_done=lambda rows: self._finish(show, rows),
+                           on_error=self._failed, key=self)
+
+    def _finish(self, show, rows):
+        self._busy = False
+        show(rows)
+
+    def _failed(self, error):
+        self._busy = False
+        messagebox.showerror("Error", f"Error al cargar la lista: {error}")
+
+    def _top_index(self):
+        return round(self.tree.yview()[0] * len(self.tree.get_children()))
+
+    def _move_top(self, index):
+        total = len(self.tree.get_children())
+        if total:
+            self.tree.yview_moveto(max(index, 0) / total)
+
+    def _load_next(self):
+        if self._busy or self.exhausted:
+            return
+        after = self.pages[-1][2] if self.pages else None
+        self._request(after, self.page_size, lambda rows: self._show_next(after, rows))
+
+    def _show_next(self, after, rows):
+        if not self.loaded:
+            self.loaded = True
+            self.tree.after_idle(self._notify_loaded)
+        if len(rows) < self.page_size:
+            self.exhausted = True
+        if not rows:
+            return
+        end = len(self.tree.get_children())
+        items = [self._insert(end + index, self.id_of(row), self.key_of(row), self.values_of(row)) for index, row in enumerate(rows)]
+        self.pages.append([after, items, self.key_of(rows[-1])])
+        if len(self.pages) > self.max_pages:
+            # Descarta la página de arriba y conserva el desplazamiento visible
+            top = self._top_index()
+            dropped = self.pages.pop(0)
+            self.previous.append(dropped[0])
+            self._delete(dropped[1])
+            self._move_top(top - len(dropped[1]))
+
+    def _notify_loaded(self):
+        callbacks, self._loaded_callbacks = self._loaded_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _load_previous(self):
+        if self._busy or not self.previous:
+            return
+        after = self.previous.pop()
+        self._request(after, self.page_size, lambda rows: self._show_previous(after, rows))
+
+    def _show_previous(self, after, rows):
+        # Si alguna fila ya está cargada (cambios entre medias) no se duplica
+        rows = [row for row in rows if self.id_of(row) not in self.items]
+        if not rows:
+            return
+        top = self._top_index()
+        items = [self._insert(index, self.id_of(row), self.key_of(row), self.values_of(row)) for index, row in enumerate(rows)]
+        self.pages.insert(0, [after, items, self.key_of(rows[-1])])
+        if len(self.pages) > self.max_pages:
+            dropped = self.pages.pop()
+            self._delete(dropped[1])
+            self.exhausted = False
+        self._move_top(top + len(items))
+
+
+class ChangePoller:
+    # Pregunta periódicamente por los cambios de una etiqueta (CRUD.changes_since) y los entrega a la
+    # pestaña: on_reset() cuando hay que recargar la ventana (incluida la primera vez), on_changes(filas,
+    # claves borradas) en el caso normal. Sin cambios cada sondeo es una sola búsqueda por índice
+    def __init__(self, widget, crud, runner, label, on_reset, on_changes, interval=CHANGE_POLL_MS):
+        self.widget = widget
+        self.crud = crud
+        self.runner = runner
+        self.label = label
+        self.on_reset = on_reset
+        self.on_changes = on_changes
+        self.interval = interval
+        self.version = None
+        self.poll()
+
+    def poll(self):
+        self.runner.submit(self.crud.changes_since, self.label, self.version,
+                           on_done=self._apply, on_error=lambda error: self._schedule(), key=self, background=True)
+
+    def _apply(self, changes):
+        if changes['reset']:
+            self.on_reset()
+        elif changes['changed'] or changes['deleted']:
+            self.on_changes(changes['changed'], changes['deleted'])
+        self.version = changes['version']
+        self._schedule()
+
+    def _schedule(self):
+        # Si falla (p. ej. sin conexión) se vuelve a intentar en el siguiente intervalo
+        if self.widget.winfo_exists():
+            self.widget.after(self.interval, self.poll)
+
 
 class MainApplication:
-    def __init__(self, master, crud):
+    def __init__(self, master, crud, buffer=None):
         self.master = master
         self.crud = crud
+        self.buffer = buffer  # escritura diferida (diferido.WriteBehindBuffer) o None
 
         self.tab_control = ttk.Notebook(master)
 
         self.department_tab = ttk.Frame(self.tab_control)
         self.employee_tab = ttk.Frame(self.tab_control)
+        self.analytics_tab = ttk.Frame(self.tab_control)
 
         self.tab_control.add(self.department_tab, text='Departamentos')
         self.tab_control.add(self.employee_tab, text='Empleados')
+        self.tab_control.add(self.analytics_tab, text='Análisis')
 
         self.tab_control.pack(expand=1, fill="both")
 
-        DepartmentTab(self.department_tab, crud)
-        EmployeeTab(self.employee_tab, crud) # Asumiendo que creaste una clase para la pestaña de empleados
+        # Barra de estado: indica cuándo hay consultas en curso
+        self.status_bar = tk.Frame(master)
+        self.status_bar.pack(fill=tk.X)
+        self.status_label = tk.Label(self.status_bar, text="Listo")
+        self.status_label.pack(side=tk.LEFT)
+        self.pending_label = tk.Label(self.status_bar, text="", fg='gray')
+        self.pending_label.pack(side=tk.LEFT, padx=10)
+        self.progress = ttk.Progressbar(self.status_bar, mode='indeterminate', length=120)
+        self.progress.pack(side=tk.RIGHT)
+
+        # Las llamadas al CRUD se hacen fuera del hilo de Tk para no congelar la ventana
+        self.runner = BackgroundRunner(master, on_busy=self.set_busy)
+
+        self.departments = DepartmentTab(self.department_tab, crud, self.runner, buffer)
+        self.employees = EmployeeTab(self.employee_tab, crud, self.runner, buffer) # Asumiendo que creaste una clase para la pestaña de empleados
+        AnalyticsTab(self.analytics_tab, crud, self.runner)
+
+        # Menú de importación y exportación; los ficheros se procesan en segundo plano
+        menubar = tk.Menu(master)
+        file_menu = tk.Menu(menubar, tearoff=0)
+        file_menu.add_command(label="Importar departamentos...", command=lambda: self.import_file('departments'))
+        file_menu.add_command(label="Importar empleados...", command=lambda: self.import_file('employees'))
+        file_menu.add_separator()
+        file_menu.add_command(label="Exportar departamentos...", command=lambda: self.export_file('departments'))
+        file_menu.add_command(label="Exportar empleados...", command=lambda: self.export_file('employees'))
+        menubar.add_cascade(label="Archivo", menu=file_menu)
+        master.config(menu=menubar)
+
+        if buffer is not None:
+            # El búfer avisa desde su propio hilo; la interfaz se actualiza en el de Tk
+            buffer.on_pending = lambda count: self.runner.post(self.show_pending, count)
+            buffer.on_flushed = lambda report: self.runner.post(self.flushed, report)
+
+    FILE_TYPES = [("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Todos", "*.*")]
+
+    def import_file(self, label):
+        path = filedialog.askopenfilename(parent=self.master, filetypes=self.FILE_TYPES)
+        if not path:
+            return
+        import_rows = intercambio.import_departments if label == 'departments' else intercambio.import_employees
+        # Con el punto de control, repetir la importación de un fichero interrumpido continúa donde se quedó
+        self.runner.submit(import_rows, self.crud, path, None, intercambio.BATCH_SIZE, self.progress_callback,
+                           path + '.checkpoint', path + '.errors.jsonl',
+                           on_done=lambda report: self.imported(label, path, report))
+
+    def imported(self, label, path, report):
+        if label == 'departments':
+            self.departments.refresh_departments()
+        else:
+            self.employees.refresh_employees()
+        message = f"Filas importadas: {report['imported']}\nFilas con errores: {report['errors']}"
+        if report['skipped']:
+            message += f"\nFilas ya importadas antes: {report['skipped']}"
+        if report['errors']:
+            message += f"\n\nDetalle en {path}.errors.jsonl"
+        messagebox.showinfo("Importar", message)
+
+    def export_file(self, label):
+        path = filedialog.asksaveasfilename(parent=self.master, filetypes=self.FILE_TYPES, defaultextension='.csv')
+        if not path:
+            return
+        export_rows = intercambio.export_departments if label == 'departments' else intercambio.export_employees
+        self.runner.submit(export_rows, self.crud, path, None, intercambio.FETCH_SIZE, self.progress_callback,
+                           on_done=lambda count: messagebox.showinfo("Exportar", f"Exportadas {count} filas a {path}"))
+
+    def progress_callback(self, state):
+        # Se llama desde el hilo de trabajo; la etiqueta se actualiza en el hilo de Tk
+        self.runner.post(self.show_progress, state)
+
+    def show_progress(self, state):
+        if state.get('total_bytes'):
+            self.status_label.config(text=f"{state['rows']} filas ({100 * state['bytes'] / state['total_bytes']:.0f}%)")
+        else:
+            self.status_label.config(text=f"{state['rows']} filas")
+
+    def show_pending(self, count):
+        self.pending_label.config(text=f"{count} cambios pendientes" if count else "")
+
+    def flushed(self, report):
+        # Las filas volcadas dejan de marcarse como pendientes; si alguna falló se recarga su lista
+        # para volver a mostrar lo que hay en la base de datos y se informa del error de cada una
+        tabs = {'Department': self.departments, 'Employee': self.employees}
+        for label, tab in tabs.items():
+            tab.pages.retag([key for kind, key in [*report['written'], *report['errors']] if kind == label])
+        if not report['errors']:
+            return
+        for label in {label for label, _ in report['errors']}:
+            tabs[label].pages.refresh()
+        names = {'Department': "Departamento", 'Employee': "Empleado"}
+        lines = [f"{names[label]} {key}: {message}" for (label, key), message in sorted(report['errors'].items())]
+        if len(lines) > 20:
+            lines = lines[:20] + [f"... y {len(lines) - 20} más"]
+        messagebox.showerror("Cambios no guardados", "\n".join(lines))
+
+    def when_ready(self, callback):
+        # callback() cuando las dos listas muestran su primera página (para medir el arranque)
+        remaining = [2]
+
+        def loaded():
+            remaining[0] -= 1
+            if not remaining[0]:
+                callback()
+
+        self.departments.pages.when_loaded(loaded)
+        self.employees.pages.when_loaded(loaded)
+
+    def set_busy(self, busy):
+        if busy:
+            self.status_label.config(text="Consultando...")
+            self.progress.start(10)
+        else:
+            self.status_label.config(text="Listo")
+            self.progress.stop()
 
 
 class DepartmentTab:
-    def __init__(self, master, crud):
+    def __init__(self, master, crud, runner, buffer=None):
         self.master = master
         self.crud = crud
+        self.runner = runner
+        self.buffer = buffer
+
+        frame = tk.Frame(master)
+        frame.pack(fill=tk.BOTH, expand=True)
 
-        self.tree = ttk.Treeview(master, columns=('Dept No', 'DName', 'Location'), show='headings')
+        self.tree = ttk.Treeview(frame, columns=('Dept No', 'DName', 'Location'), show='headings')
         self.tree.heading('Dept No', text='Dept No')
         self.tree.heading('DName', text='DName')
         self.tree.heading('Location', text='Location')
-        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.tree.tag_configure('pending', foreground='gray')
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.pages = PagedTree(self.tree, scrollbar, self.runner, self.fetch_page,
+                               id_of=lambda department: department.dept_no,
+                               key_of=lambda department: department.dept_no,
+                               values_of=tuple, tags_of=self.tags_of)
 
         self.refresh_button = tk.Button(master, text="Refrescar Lista", command=self.refresh_departments)
         self.refresh_button.pack()
@@ -47,50 +478,69 @@ class DepartmentTab:
         self.delete_button = tk.Button(master, text="Eliminar Departamento", command=self.delete_department)
         self.delete_button.pack()
 
-        self.refresh_departments()
+        # La primera consulta de cambios pide la recarga inicial
+        self.changes = ChangePoller(master, crud, runner, 'Department', self.refresh_departments, self.apply_changes)
 
-    def refresh_departments(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
+    def apply_changes(self, changed, deleted):
+        # Las filas con escrituras diferidas sin volcar conservan lo que se editó en la interfaz
+        for department in changed:
+            if not self.is_pending(department.dept_no):
+                self.pages.upsert(department)
+        for dept_no in deleted:
+            if not self.is_pending(dept_no):
+                self.pages.remove(dept_no)
 
-        departments = self.crud.read_all_departments()
-        for department in departments:
-            self.tree.insert('', tk.END, values=(department['dept_no'], department['dname'], department['loc']))
+    def fetch_page(self, after, limit):
+        return overlay_pending(self.buffer, 'Department', self.crud.read_departments_page(after, limit), lambda department: department.dept_no)
+
+    def is_pending(self, dept_no):
+        return self.buffer is not None and self.buffer.is_pending('Department', dept_no)
+
+    def tags_of(self, dept_no):
+        return ('pending',) if self.is_pending(dept_no) else ()
+
+    def refresh_departments(self):
+        self.pages.refresh()
 
     def add_department(self):
-        AddDepartmentPopup(self.master, self.crud, self.refresh_departments)
-        pass
+        AddDepartmentPopup(self.master, self.crud, self.runner, self.pages.upsert)
 
     def update_department(self):
-        selected_item = self.tree.selection()
-        if selected_item:
-            dept_no = self.tree.item(selected_item[0])['values'][0]
-            UpdateDepartmentPopup(self.master, self.crud, dept_no, self.refresh_departments)
+        dept_no = self.pages.selected_id()
+        if dept_no is not None:
+            UpdateDepartmentPopup(self.master, self.crud, self.runner, dept_no, self.pages.upsert, self.buffer)
         else:
             messagebox.showinfo("Seleccionar", "Por favor, selecciona un departamento primero.")
 
     def delete_department(self):
-        selected_item = self.tree.selection()
-        if selected_item:
-            dept_no = self.tree.item(selected_item[0])['values'][0]
-            if self.crud.department_has_employees(dept_no):
-                messagebox.showwarning("Eliminar Departamento", "No se puede eliminar un departamento que tiene empleados.")
-            else:
-                if messagebox.askyesno("Eliminar Departamento", "¿Estás seguro de que quieres eliminar este departamento?"):
-                    self.crud.delete_department(dept_no)
-                    self.refresh_departments()
-                    messagebox.showinfo("Eliminar Departamento", "Departamento eliminado con éxito.")
-        else:
+        dept_no = self.pages.selected_id()
+        if dept_no is None:
             messagebox.showinfo("Seleccionar", "Por favor, selecciona un departamento primero.")
+        elif messagebox.askyesno("Eliminar Departamento", "¿Estás seguro de que quieres eliminar este departamento?"):
+            # La comprobación de empleados y el borrado van en una sola sentencia
+            self.runner.submit(self.crud.delete_department_if_empty, dept_no,
+                               on_done=lambda status: self.department_deleted(dept_no, status))
+
+    def department_deleted(self, dept_no, status):
+        if status == HAS_EMPLOYEES:
+            messagebox.showwarning("Eliminar Departamento", "No se puede eliminar un departamento que tiene empleados.")
+            return
+        self.pages.remove(dept_no)
+        if status == OK:
+            messagebox.showinfo("Eliminar Departamento", "Departamento eliminado con éxito.")
+        else:
+            messagebox.showinfo("Eliminar Departamento", "El departamento ya no existía.")
 
 
 
 class UpdateDepartmentPopup:
-    def __init__(self, master, crud, dept_no, refresh_callback):
+    def __init__(self, master, crud, runner, dept_no, on_saved, buffer=None):
         self.top = tk.Toplevel(master)
         self.crud = crud
+        self.runner = runner
         self.dept_no = dept_no
-        self.refresh_callback = refresh_callback
+        self.on_saved = on_saved
+        self.buffer = buffer
 
         self.top.title("Actualizar Departamento")
 
@@ -102,30 +552,51 @@ class UpdateDepartmentPopup:
         self.loc_entry = tk.Entry(self.top)
         self.loc_entry.pack()
 
-        update_button = tk.Button(self.top, text="Actualizar", command=self.update_department)
-        update_button.pack()
+        self.update_button = tk.Button(self.top, text="Actualizar", command=self.update_department, state=tk.DISABLED)
+        self.update_button.pack()
 
         # Rellena los campos con los datos actuales del departamento
-        self.populate_fields()
+        self.runner.submit(self.crud.read_department, self.dept_no, on_done=self.populate_fields)
 
-    def populate_fields(self):
-        department = self.crud.read_department(self.dept_no)
+    def populate_fields(self, department):
+        if not self.top.winfo_exists():
+            return
+        # Si hay un cambio sin volcar, se parte de él y no de lo que hay en la base de datos
+        pending = self.buffer.pending('Department', self.dept_no) if self.buffer else None
+        if department and pending and pending[0] != DELETE:
+            department = department._replace(dname=pending[1]['dname'], loc=pending[1]['loc'])
         if department:
-            self.dname_entry.insert(0, department['dname'])
-            self.loc_entry.insert(0, department['loc'])
+            self.dname_entry.insert(0, department.dname)
+            self.loc_entry.insert(0, department.loc)
+        self.update_button.config(state=tk.NORMAL)
 
     def update_department(self):
         new_dname = self.dname_entry.get()
         new_loc = self.loc_entry.get()
-        self.crud.update_department(self.dept_no, new_dname, new_loc)
-        self.refresh_callback()  # Actualiza la lista en la interfaz principal
+        if self.buffer is not None:
+            # Se muestra ya el cambio; el búfer lo escribirá con el siguiente lote
+            self.buffer.update_department(self.dept_no, new_dname, new_loc)
+            self.saved(DepartmentRow(self.dept_no, new_dname, new_loc))
+            return
+        self.update_button.config(state=tk.DISABLED)
+        self.runner.submit(self.crud.update_department, self.dept_no, new_dname, new_loc,
+                           on_done=self.saved, on_error=self.failed)
+
+    def saved(self, department):
+        if department:
+            self.on_saved(department)  # Actualiza solo esta fila en la interfaz principal
         self.top.destroy()
 
+    def failed(self, error):
+        self.update_button.config(state=tk.NORMAL)
+        messagebox.showerror("Error", f"Error al actualizar departamento: {error}")
+
 class AddDepartmentPopup:
-    def __init__(self, master, crud, refresh_callback):
+    def __init__(self, master, crud, runner, on_saved):
         self.top = tk.Toplevel(master)
         self.crud = crud
-        self.refresh_callback = refresh_callback
+        self.runner = runner
+        self.on_saved = on_saved
 
         self.top.title("Agregar Departamento")
 
@@ -141,8 +612,8 @@ class AddDepartmentPopup:
         self.loc_entry = tk.Entry(self.top)
         self.loc_entry.pack()
 
-        add_button = tk.Button(self.top, text="Agregar", command=self.add_department)
-        add_button.pack()
+        self.add_button = tk.Button(self.top, text="Agregar", command=self.add_department)
+        self.add_button.pack()
 
     def add_department(self):
         dept_no_str = self.deptno_entry.get()
@@ -154,32 +625,75 @@ class AddDepartmentPopup:
             dept_no = int(dept_no_str)
 
             if dname and loc:
-                self.crud.create_department(dept_no, dname, loc)
-                self.refresh_callback()  # Actualiza la lista en la interfaz principal
-                self.top.destroy()
+                self.add_button.config(state=tk.DISABLED)
+                self.runner.submit(self.crud.create_department, dept_no, dname, loc,
+                                   on_done=self.saved, on_error=self.failed)
             else:
                 messagebox.showwarning("Advertencia", "Todos los campos son obligatorios.")
         except ValueError:
             # Maneja el caso en que DEPTNO no es un número
             messagebox.showwarning("Advertencia", "ID del Departamento debe ser un número.")
 
+    def saved(self, department):
+        self.on_saved(department)  # Añade solo esta fila en la interfaz principal
+        self.top.destroy()
+
+    def failed(self, error):
+        self.add_button.config(state=tk.NORMAL)
+        messagebox.showerror("Error", f"Error al agregar departamento: {error}")
+
 
 
 class EmployeeTab:
-    def __init__(self, master, crud):
+    def __init__(self, master, crud, runner, buffer=None):
         self.master = master
         self.crud = crud
-
-        self.tree = ttk.Treeview(master, columns=('Emp No', 'EName', 'Job', 'Mgr', 'Hire Date', 'Sal', 'Comm', 'Dept No'), show='headings')
-        self.tree.heading('Emp No', text='Emp No')
+        self.runner = runner
+        self.buffer = buffer
+
+        # Filtros de búsqueda: (etiqueta, argumento de search_employees, conversión del texto)
+        search = tk.Frame(master)
+        search.pack(fill=tk.X)
+        self.filters = {}
+        self.filter_entries = []
+        fields = [
+            ("Nombre:", 'name_prefix', str.upper),
+            ("Texto:", 'text', str),
+            ("Puesto:", 'job', str.upper),
+            ("Depto:", 'dept_no', int),
+            ("Sal. mín:", 'min_sal', float),
+            ("Sal. máx:", 'max_sal', float),
+            ("Desde (dd/mm/yyyy):", 'hired_from', lambda text: datetime.strptime(text, "%d/%m/%Y")),
+            ("Hasta (dd/mm/yyyy):", 'hired_to', lambda text: datetime.strptime(text, "%d/%m/%Y")),
+        ]
+        for index, (label, name, convert) in enumerate(fields):
+            tk.Label(search, text=label).grid(row=index // 4, column=(index % 4) * 2, sticky=tk.E)
+            entry = tk.Entry(search, width=12)
+            entry.grid(row=index // 4, column=(index % 4) * 2 + 1, sticky=tk.W)
+            entry.bind('<KeyRelease>', lambda event: self.schedule_search())
+            self.filter_entries.append((name, convert, entry))
+        self.search_status = tk.Label(search, text="")
+        self.search_status.grid(row=2, column=0, columnspan=8, sticky=tk.W)
+        self._search_job = None
+
+        frame = tk.Frame(master)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        # Con los agregados de equipo activados se añaden sus columnas, leídas página a página con team_stats
+        self.team_columns = ('Team', 'Team Pay', 'Team Depth') if crud.team_aggregates else ()
+        self.tree = ttk.Treeview(frame, columns=('Emp No', 'EName', 'Job', 'Mgr', 'Hire Date', 'Sal', 'Comm', 'Dept No') + self.team_columns, show='headings')
+        self.tree.heading('Emp No', text='Emp No', command=lambda: self.sort_by('emp_no'))
         self.tree.heading('EName', text='EName')
-        self.tree.heading('Job', text='Job')
+        self.tree.heading('Job', text='Job', command=lambda: self.sort_by('job'))
         self.tree.heading('Mgr', text='Mgr')
         self.tree.heading('Hire Date', text='Hire Date')
         self.tree.heading('Sal', text='Sal')
         self.tree.heading('Comm', text='Comm')
-        self.tree.heading('Dept No', text='Dept No')
-        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.tree.heading('Dept No', text='Dept No', command=lambda: self.sort_by('dept_no'))
+        self.tree.tag_configure('pending', foreground='gray')
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         self.tree.column('Emp No', width=70)
         self.tree.column('EName', width=100)
@@ -189,6 +703,17 @@ class EmployeeTab:
         self.tree.column('Sal', width=70)
         self.tree.column('Comm', width=70)
         self.tree.column('Dept No', width=70)
+        for column in self.team_columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=80)
+
+        # Orden actual; el cursor de página es (valor de la clave, emp_no)
+        self.order_by = 'emp_no'
+        self.pages = PagedTree(self.tree, scrollbar, self.runner, self.fetch_page,
+                               id_of=lambda employee: employee.emp_no,
+                               key_of=self.cursor_of,
+                               values_of=self.values_of,
+                               tags_of=self.tags_of)
 
         self.refresh_button = tk.Button(master, text="Refrescar Lista", command=self.refresh_employees)
         self.refresh_button.pack()
@@ -202,45 +727,184 @@ class EmployeeTab:
         self.delete_button = tk.Button(master, text="Eliminar Empleado", command=self.delete_employee)
         self.delete_button.pack()
 
-        self.refresh_employees()
+        # La primera consulta de cambios pide la recarga inicial
+        self.changes = ChangePoller(master, crud, runner, 'Employee', self.refresh_employees, self.apply_changes)
 
 
         # Agregar botones para CRUD aquí
     def add_employee(self):
-        AddEmployeePopup(self.master, self.crud, self.refresh_employees)
+        AddEmployeePopup(self.master, self.crud, self.runner, self.employee_saved)
     def delete_employee(self):
-        selected_item = self.tree.selection()
-        if selected_item:
-            emp_no = self.tree.item(selected_item[0])['values'][0]
+        emp_no = self.pages.selected_id()
+        if emp_no is not None:
             if messagebox.askyesno("Eliminar Empleado", f"¿Estás seguro de que deseas eliminar al empleado con ID {emp_no}?"):
-                self.crud.delete_employee(emp_no)
-                self.refresh_employees()
+                if self.buffer is not None:
+                    self.buffer.delete_employee(emp_no)
+                    self.pages.remove(emp_no)
+                    return
+                self.runner.submit(self.crud.delete_employee, emp_no, on_done=lambda _: self.employee_deleted(emp_no))
         else:
             messagebox.showwarning("Advertencia", "Por favor, selecciona un empleado primero.")
     
     def update_employee(self):
-        selected_item = self.tree.selection()
-        if selected_item:
-            emp_no = self.tree.item(selected_item[0])['values'][0]
-            UpdateEmployeePopup(self.master, self.crud, emp_no, self.refresh_employees)
+        emp_no = self.pages.selected_id()
+        if emp_no is not None:
+            UpdateEmployeePopup(self.master, self.crud, self.runner, emp_no, self.employee_saved, self.buffer)
         else:
             messagebox.showwarning("Advertencia", "Por favor, selecciona un empleado primero.")
 
 
+    def apply_changes(self, changed, deleted):
+        if self.filters or self.team_columns:
+            self.pages.refresh()
+            return
+        for employee in changed:
+            if not self.is_pending(employee.emp_no):
+                self.pages.upsert(employee)
+        for emp_no in deleted:
+            if not self.is_pending(emp_no):
+                self.pages.remove(emp_no)
+
+    def is_pending(self, emp_no):
+        return self.buffer is not None and self.buffer.is_pending('Employee', emp_no)
+
+    def tags_of(self, emp_no):
+        return ('pending',) if self.is_pending(emp_no) else ()
+
+    def employee_saved(self, employee):
+        # Con filtros activos no se sabe aquí si la fila los cumple; se vuelve a pedir la ventana.
+        # Con agregados de equipo también, porque cambian los de toda la cadena de managers
+        if self.filters or self.team_columns:
+            self.pages.refresh()
+        else:
+            self.pages.upsert(employee)
+
+    def employee_deleted(self, emp_no):
+        self.pages.remove(emp_no)
+        if self.team_columns:
+            self.pages.refresh()
+
+    def values_of(self, employee):
+        values = tuple(employee._replace(hire_date=display_date(employee.hire_date)))
+        if not self.team_columns:
+            return values
+        # Una fila sin agregados (p. ej. de una escritura diferida) deja las columnas de equipo vacías
+        team = values[len(EMPLOYEE_FIELDS):] or ('',) * len(self.team_columns)
+        return values[:len(EMPLOYEE_FIELDS)] + tuple('' if value is None else value for value in team)
+
+    def fetch_page(self, after, limit):
+        after_key, after_emp_no = after if after else (None, None)
+        if self.filters:
+            rows = self.crud.search_employees(**self.filters, after_emp_no=after_emp_no, limit=limit)
+        else:
+            rows = self.crud.read_employees_page(after_emp_no, limit, self.order_by, after_key)
+        if self.team_columns:
+            # Una búsqueda por clave por fila de la página, sin recorrer ningún subárbol. Los agregados
+            # van en la propia fila, así que salen de memoria con ella cuando PagedTree descarta su página
+            teams = self.crud.team_stats([employee.emp_no for employee in rows])
+            empty = TeamRow(None, None, None)
+            rows = [EmployeeTeamRow(*employee, *teams.get(employee.emp_no, empty)) for employee in rows]
+        return overlay_pending(self.buffer, 'Employee', rows, lambda employee: employee.emp_no)
+
+    def schedule_search(self):
+        # Cada pulsación reinicia la espera, así solo se consulta cuando se deja de escribir
+        if self._search_job is not None:
+            self.master.after_cancel(self._search_job)
+        self._search_job = self.master.after(SEARCH_DELAY_MS, self.search)
+
+    def search(self):
+        self._search_job = None
+        filters = {}
+        for name, convert, entry in self.filter_entries:
+            text = entry.get().strip()
+            if not text:
+                continue
+            try:
+                filters[name] = convert(text)
+            except ValueError:
+                # Valor a medio escribir: se espera a que sea válido
+                self.search_status.config(text=f"Filtro no válido: {text}")
+                return
+        self.search_status.config(text="")
+        if filters == self.filters:
+            return
+        self.filters = filters
+        if filters:
+            # La búsqueda se pagina por emp_no
+            self.order_by = 'emp_no'
+        self.pages.reset()
+
+    def cursor_of(self, employee):
+        # Las filas sin valor en la clave de orden no aparecen en la lista paginada
+        key = getattr(employee, self.order_by)
+        if key is None:
+            return None
+        return (key, employee.emp_no)
+
+    def sort_by(self, order_by):
+        if self.filters:
+            return
+        self.order_by = order_by
+        self.pages.reset()
+
     def refresh_employees(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
+        self.pages.refresh()
+
+
+class AnalyticsTab:
+    # Informes agregados calculados en la base de datos
+    REPORTS = {
+        'Por departamento': (lambda crud: crud.department_stats(),
+                             ('dept_no', 'dname', 'headcount', 'total_sal', 'avg_sal', 'min_sal', 'max_sal', 'total_comm')),
+        'Por puesto': (lambda crud: crud.job_stats(),
+                       ('job', 'headcount', 'total_sal', 'avg_sal', 'min_sal', 'max_sal', 'total_comm')),
+        'Contrataciones por departamento y año': (lambda crud: crud.hire_histogram('dept_no', 'year'),
+                                                 ('group', 'period', 'hires')),
+        'Contrataciones por puesto y año': (lambda crud: crud.hire_histogram('job', 'year'),
+                                           ('group', 'period', 'hires')),
+    }
+
+    def __init__(self, master, crud, runner):
+        self.master = master
+        self.crud = crud
+        self.runner = runner
 
-        employees = self.crud.read_all_employees()
-        for employee in employees:
-            self.tree.insert('', tk.END, values=(employee['emp_no'], employee['ename'], employee['job'], employee['mgr'], employee['hire_date'], employee['sal'], employee['comm'], employee['dept_no']))
+        controls = tk.Frame(master)
+        controls.pack(fill=tk.X)
+        tk.Label(controls, text="Informe:").pack(side=tk.LEFT)
+        self.report = tk.StringVar(value=next(iter(self.REPORTS)))
+        selector = ttk.Combobox(controls, textvariable=self.report, values=list(self.REPORTS), state='readonly', width=40)
+        selector.pack(side=tk.LEFT)
+        selector.bind('<<ComboboxSelected>>', lambda event: self.refresh_report())
+
+        self.tree = ttk.Treeview(master, show='headings')
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        self.refresh_button = tk.Button(master, text="Refrescar Informe", command=self.refresh_report)
+        self.refresh_button.pack()
+
+        self.refresh_report()
+
+    def refresh_report(self):
+        query, columns = self.REPORTS[self.report.get()]
+        self.runner.submit(query, self.crud, on_done=lambda rows: self.show_report(columns, rows), key=self)
+
+    def show_report(self, columns, rows):
+        self.tree.delete(*self.tree.get_children())
+        self.tree.configure(columns=columns)
+        for column in columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=100)
+        for row in rows:
+            self.tree.insert('', tk.END, values=[round(row[column], 2) if isinstance(row[column], float) else row[column] for column in columns])
 
 
 class AddEmployeePopup:
-    def __init__(self, master, crud, refresh_callback):
+    def __init__(self, master, crud, runner, on_saved):
         self.top = tk.Toplevel(master)
         self.crud = crud
-        self.refresh_callback = refresh_callback
+        self.runner = runner
+        self.on_saved = on_saved
 
         self.top.title("Agregar Empleado")
 
@@ -285,8 +949,8 @@ class AddEmployeePopup:
         self.deptno_entry.pack()
 
         # Botón para agregar empleado
-        add_button = tk.Button(self.top, text="Agregar", command=self.add_employee)
-        add_button.pack()
+        self.add_button = tk.Button(self.top, text="Agregar", command=self.add_employee)
+        self.add_button.pack()
 
     def add_employee(self):
         try:
@@ -298,80 +962,100 @@ class AddEmployeePopup:
             sal = float(self.sal_entry.get())
             comm = float(self.comm_entry.get()) if self.comm_entry.get() else None
             dept_no = int(self.deptno_entry.get())
-            
-            #Verificar el mgr
-            if mgr is not None and not self.crud.read_employee(mgr):
-                messagebox.showerror("Error", f"No se puede agregar el empleado porque el manager con ID {mgr} no existe.")
-                return
-
-            # Verifica si el departamento existe antes de realizar la acción
-            result = self.crud._driver.session().run("MATCH (d:Department {dept_no: $dept_no}) RETURN COUNT(d) AS deptCount", dept_no=dept_no)
-            dept_count = result.single()['deptCount']
-
-            if dept_count == 0:
-                # El departamento no existe, se deniega la acción
-                messagebox.showerror("Error", f"No se puede agregar el empleado porque el departamento {dept_no} no existe.")
-            else:
-                # Llamada al CRUD para agregar empleado
-                self.crud.create_employee(emp_no, ename, job, mgr, hire_date, sal, comm, dept_no)
-                self.refresh_callback()  # Actualiza la lista en la interfaz principal
-                self.top.destroy()
         except ValueError as e:
             messagebox.showerror("Error", f"Error al agregar empleado: {e}")
+            return
+
+        # El CRUD comprueba manager y departamento y crea el empleado en una sola transacción
+        self.add_button.config(state=tk.DISABLED)
+        self.runner.submit(self.crud.create_employee_checked, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no,
+                           on_done=lambda result: self.saved(result, emp_no, mgr, dept_no), on_error=self.failed)
+
+    def saved(self, result, emp_no, mgr, dept_no):
+        if result['status'] == OK:
+            self.on_saved(result['employee'])  # Añade solo esta fila en la interfaz principal
+            self.top.destroy()
+            return
+        self.add_button.config(state=tk.NORMAL)
+        if result['status'] == MISSING_MANAGER:
+            messagebox.showerror("Error", f"No se puede agregar el empleado porque el manager con ID {mgr} no existe.")
+        elif result['status'] == CYCLE:
+            messagebox.showerror("Error", f"No se puede agregar el empleado porque la cadena de managers de {mgr} ya depende de él.")
+        elif result['status'] == MISSING_DEPARTMENT:
+            # El departamento no existe, se deniega la acción
+            messagebox.showerror("Error", f"No se puede agregar el empleado porque el departamento {dept_no} no existe.")
+        elif result['status'] == DUPLICATE:
+            messagebox.showerror("Error", f"Ya existe un empleado con ID {emp_no}.")
+
+    def failed(self, error):
+        self.add_button.config(state=tk.NORMAL)
+        messagebox.showerror("Error", f"Error al agregar empleado: {error}")
 
 
 class UpdateEmployeePopup:
-    def __init__(self, master, crud, emp_no, refresh_callback):
+    def __init__(self, master, crud, runner, emp_no, on_saved, buffer=None):
         self.top = tk.Toplevel(master)
         self.crud = crud
+        self.runner = runner
         self.emp_no = emp_no
-        self.refresh_callback = refresh_callback
+        self.on_saved = on_saved
+        self.buffer = buffer
 
         self.top.title("Actualizar Empleado")
 
-        employee = self.crud.read_employee(emp_no)
+        # El formulario se construye cuando llega el empleado
+        self.runner.submit(self.crud.read_employee, emp_no, on_done=self.build_form)
+
+    def build_form(self, employee):
+        if not self.top.winfo_exists():
+            return
         if not employee:
             messagebox.showerror("Error", "Empleado no encontrado.")
             self.top.destroy()
             return
 
+        # Si hay un cambio sin volcar, los campos editables parten de él
+        pending = self.buffer.pending('Employee', self.emp_no) if self.buffer else None
+        if pending and pending[0] != DELETE:
+            employee = employee._replace(**{field: pending[1][field] for field in ('job', 'mgr', 'sal', 'comm', 'dept_no')})
+
         # Guardar los valores actuales que no se van a cambiar
-        self.current_ename = employee['ename']
-        self.current_hire_date = employee['hire_date']
+        self.current_ename = employee.ename
+        self.current_hire_date = employee.hire_date
 
         # Puesto de Trabajo
         tk.Label(self.top, text="Puesto de Trabajo:").pack()
         self.job_entry = tk.Entry(self.top)
-        self.job_entry.insert(0, employee['job'])
+        self.job_entry.insert(0, employee.job)
         self.job_entry.pack()
 
         # Manager
         tk.Label(self.top, text="ID del Manager:").pack()
         self.mgr_entry = tk.Entry(self.top)
-        self.mgr_entry.insert(0, employee['mgr'] if employee['mgr'] else "")
+        self.mgr_entry.insert(0, employee.mgr if employee.mgr else "")
         self.mgr_entry.pack()
 
         # Salario
         tk.Label(self.top, text="Salario:").pack()
         self.sal_entry = tk.Entry(self.top)
-        self.sal_entry.insert(0, employee['sal'])
+        self.sal_entry.insert(0, employee.sal)
         self.sal_entry.pack()
 
         # Comisión
         tk.Label(self.top, text="Comisión:").pack()
         self.comm_entry = tk.Entry(self.top)
-        self.comm_entry.insert(0, employee['comm'] if employee['comm'] else "")
+        self.comm_entry.insert(0, employee.comm if employee.comm else "")
         self.comm_entry.pack()
 
         # Número de Departamento
         tk.Label(self.top, text="Número de Departamento:").pack()
         self.deptno_entry = tk.Entry(self.top)
-        self.deptno_entry.insert(0, employee['dept_no'])
+        self.deptno_entry.insert(0, employee.dept_no)
         self.deptno_entry.pack()
 
         # Botón para actualizar empleado
-        update_button = tk.Button(self.top, text="Actualizar", command=self.update_employee)
-        update_button.pack()
+        self.update_button = tk.Button(self.top, text="Actualizar", command=self.update_employee)
+        self.update_button.pack()
 
     def update_employee(self):
         try:
@@ -385,23 +1069,38 @@ class UpdateEmployeePopup:
             sal = float(self.sal_entry.get())
             comm = float(self.comm_entry.get()) if self.comm_entry.get() else None
             dept_no = int(self.deptno_entry.get())
-
-            # Verificar si el mgr especificado existe
-            if mgr is not None and not self.crud.read_employee(mgr):
-                messagebox.showerror("Error", f"No se puede actualizar el empleado porque el manager con ID {mgr} no existe.")
-                return
-            
-            # Verifica si el departamento existe antes de realizar la acción
-            result = self.crud._driver.session().run("MATCH (d:Department {dept_no: $dept_no}) RETURN COUNT(d) AS deptCount", dept_no=dept_no)
-            dept_count = result.single()['deptCount']
-
-            if dept_count == 0:
-                # El departamento no existe, se deniega la acción
-                messagebox.showerror("Error", f"No se puede actualizar el empleado porque el departamento {dept_no} no existe.")
-            else:
-                # Llamada al CRUD para actualizar
-                self.crud.update_employee(self.emp_no, ename, job, mgr, hire_date, sal, comm, dept_no)
-                self.refresh_callback()
-                self.top.destroy()
         except ValueError as e:
             messagebox.showerror("Error", f"Error al actualizar empleado: {e}")
+            return
+
+        if self.buffer is not None:
+            # Manager y departamento se comprueban al volcar; si no existen se avisa entonces
+            self.buffer.update_employee(self.emp_no, ename, job, mgr, hire_date, sal, comm, dept_no)
+            self.on_saved(EmployeeRow(self.emp_no, ename, job, mgr, hire_date, sal, comm, dept_no))
+            self.top.destroy()
+            return
+
+        # El CRUD comprueba manager y departamento y actualiza en una sola transacción
+        self.update_button.config(state=tk.DISABLED)
+        self.runner.submit(self.crud.update_employee_checked, self.emp_no, ename, job, mgr, hire_date, sal, comm, dept_no,
+                           on_done=lambda result: self.saved(result, mgr, dept_no), on_error=self.failed)
+
+    def saved(self, result, mgr, dept_no):
+        if result['status'] == OK:
+            self.on_saved(result['employee'])
+            self.top.destroy()
+            return
+        self.update_button.config(state=tk.NORMAL)
+        if result['status'] == MISSING_MANAGER:
+            messagebox.showerror("Error", f"No se puede actualizar el empleado porque el manager con ID {mgr} no existe.")
+        elif result['status'] == CYCLE:
+            messagebox.showerror("Error", f"No se puede actualizar el empleado porque el manager con ID {mgr} es él mismo o uno de sus subordinados.")
+        elif result['status'] == MISSING_DEPARTMENT:
+            # El departamento no existe, se deniega la acción
+            messagebox.showerror("Error", f"No se puede actualizar el empleado porque el departamento {dept_no} no existe.")
+        else:
+            messagebox.showerror("Error", "Empleado no encontrado.")
+
+    def failed(self, error):
+        self.update_button.config(state=tk.NORMAL)
+        messagebox.showerror("Error", f"Error al actualizar empleado: {error}")
@@ -1,26 +1,51 @@
+import time
+from almacen import open_storage
+from config import load_config, WRITE_BEHIND_SECTION, WRITE_BEHIND
+from diferido import WriteBehindBuffer
 from interfaz import *
 
 if __name__ == "__main__":
+    started = time.perf_counter()
+    elapsed_ms = lambda: (time.perf_counter() - started) * 1000
+
     root = tk.Tk()
-    uri = 'bolt://localhost:7687'
-    user = 'neo4j'
-    password = '12345678'
+    # Almacén (Neo4j o en memoria), conexión, pool y caché desde variables de entorno CRUD_* o crud.ini (ver config.py)
+    crud = open_storage()
+    # Escritura diferida de las ediciones, desactivada por defecto ([write_behind] enabled = yes)
+    write_behind = load_config(section=WRITE_BEHIND_SECTION, defaults=WRITE_BEHIND)
+    buffer = WriteBehindBuffer(crud, write_behind['max_pending'], write_behind['flush_interval']) if write_behind['enabled'] else None
 
-    crud = CRUD(uri, user, password)
-    
     #crud.delete_all()
     #crud.see_all_D()
     #crud.see_all_E()
     #crud.insert_scott_D()
     #crud.insert_scott_E()
+    #crud.migrate_manages()
     #crud.see_all_D()
     #crud.see_all_E()
     
 
 
-    app = MainApplication(root, crud)
+    # La ventana se muestra enseguida; las cargas iniciales, el esquema y el calentamiento del pool
+    # de conexiones van en segundo plano
+    app = MainApplication(root, crud, buffer)
+
+    def schema_ready(schema):
+        if schema['created']:
+            print("Esquema creado:", ", ".join(schema['created']))
+
+    app.runner.submit(crud.warm_up, on_done=lambda stats: print(f"Pool listo: {stats['connections']} conexiones en {stats['total_ms']:.0f} ms"))
+    app.runner.submit(crud.ensure_schema, on_done=schema_ready)
+    root.after_idle(lambda: print(f"Ventana visible en {elapsed_ms():.0f} ms"))
+    app.when_ready(lambda: print(f"Listas cargadas en {elapsed_ms():.0f} ms"))
     root.mainloop()
 
-    
+    app.runner.shutdown()
+
+    # Lo que quede pendiente se escribe antes de cerrar la conexión
+    if buffer is not None:
+        report = buffer.close()
+        for (label, key), message in sorted(report['errors'].items()):
+            print(f"No se guardó {label} {key}: {message}")
 
     crud.close()
@@ -0,0 +1,765 @@
+import bisect
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from almacen import (Storage, ConstraintViolation, chunks, as_row, BATCH_SIZE, PAGE_SIZE, CHANGE_LIMIT, FETCH_SIZE,
+                     EMPLOYEE_ORDER_KEYS, TRACKED_LABELS, OK, MISSING_MANAGER, MISSING_DEPARTMENT, CYCLE, DUPLICATE,
+                     NOT_FOUND, HAS_EMPLOYEES)
+from modelos import DEPARTMENT_FIELDS, EMPLOYEE_FIELDS, DepartmentRow, EmployeeRow, EmployeeDetailRow, TeamRow
+
+# Almacén en memoria con la misma interfaz que CRUD: sirve de referencia local para comparar el coste
+# de las consultas de Neo4j y para instalaciones sin servidor en las que los datos caben en RAM.
+# Los nodos son filas inmutables (DepartmentRow/EmployeeRow) en diccionarios por clave; las relaciones
+# WORKS_IN se guardan como conjuntos por departamento y las MANAGES se deducen del índice por mgr.
+# Índices secundarios: conjuntos de emp_no por dept_no, mgr y job, y listas ordenadas (bisect) para
+# paginar por emp_no, (dept_no, emp_no) y (job, emp_no). Un solo cerrojo protege todo: cada método
+# público equivale a una transacción. save()/load() guardan y recuperan una instantánea en JSON.
+# Con team_aggregates=True se mantienen también los agregados de equipo de cada empleado (TeamRow),
+# que no se guardan en la instantánea sino que se reconstruyen al cargarla
+
+# Nombres de los índices que mantienen las estructuras (lo que devuelve ensure_schema)
+INDEXES = ('department_dept_no', 'employee_emp_no', 'employee_dept_no', 'employee_mgr', 'employee_job')
+
+# Propiedades de Employee con índice secundario
+INDEXED = ('dept_no', 'mgr', 'job')
+
+# Máximo de ediciones por término en la búsqueda aproximada (como `término~` en Lucene)
+MAX_EDITS = 2
+
+
+def _remove_sorted(keys, key):
+    index = bisect.bisect_left(keys, key)
+    if index < len(keys) and keys[index] == key:
+        del keys[index]
+
+
+def _rows(rows, as_tuples):
+    return [tuple(row) for row in rows] if as_tuples else list(rows)
+
+
+def _as_date(value):
+    # Algunas fechas antiguas quedaron guardadas como texto ISO
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _within_edits(term, word, max_edits=MAX_EDITS):
+    # Distancia de Levenshtein acotada: se abandona en cuanto toda una fila supera el máximo
+    if abs(len(term) - len(word)) > max_edits:
+        return False
+    previous = list(range(len(word) + 1))
+    for i, char in enumerate(term, 1):
+        current = [i]
+        for j, other in enumerate(word, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        if min(current) > max_edits:
+            return False
+        previous = current
+    return previous[-1] <= max_edits
+
+
+def _matches(employee, filters, terms):
+    # Mismas condiciones que EMPLOYEE_FILTERS en crud.py; una propiedad nula no cumple ninguna
+    def compare(value, bound, check):
+        return bound is None or (value is not None and check(value, bound))
+
+    if filters.get('name_prefix') is not None and not (employee.ename or '').startswith(filters['name_prefix']):
+        return False
+    if filters.get('job') is not None and employee.job != filters['job']:
+        return False
+    if filters.get('dept_no') is not None and employee.dept_no != filters['dept_no']:
+        return False
+    if not (compare(employee.sal, filters.get('min_sal'), lambda value, bound: value >= bound)
+            and compare(employee.sal, filters.get('max_sal'), lambda value, bound: value <= bound)
+            and compare(employee.hire_date, filters.get('hired_from'), lambda value, bound: value >= bound)
+            and compare(employee.hire_date, filters.get('hired_to'), lambda value, bound: value <= bound)):
+        return False
+    if terms:
+        words = f"{employee.ename or ''} {employee.job or ''}".lower().split()
+        return all(any(_within_edits(term, word) for word in words) for term in terms)
+    return True
+
+
+class MemoryCRUD(Storage):
+    write_errors = (ConstraintViolation,)
+
+#CONNECT
+
+    def __init__(self, snapshot=None, team_aggregates=False):
+        self.snapshot = snapshot  # con fichero, se carga aquí si existe y se guarda en close()
+        self.team_aggregates = team_aggregates
+        self._lock = threading.RLock()
+        self._clear()
+        self._counters = {label: {'version': 0, 'reset_at': 0} for label in TRACKED_LABELS}
+        if snapshot and os.path.exists(snapshot):
+            self.load(snapshot)
+
+    def _clear(self):
+        self._departments = {}  # dept_no -> DepartmentRow
+        self._employees = {}  # emp_no -> EmployeeRow
+        self._dept_keys = []  # dept_no ordenados
+        self._order = {'emp_no': [], 'dept_no': [], 'job': []}  # claves de paginación ordenadas
+        self._index = {name: {} for name in INDEXED}  # propiedad -> valor -> {emp_no}
+        self._works_in = {}  # dept_no -> {emp_no}
+        self._works_in_of = {}  # emp_no -> dept_no
+        self._teams = {}  # emp_no -> TeamRow, solo con team_aggregates
+        # Seguimiento de cambios: clave -> versión en orden de escritura, y lápidas (versión, clave)
+        self._versions = {label: OrderedDict() for label in TRACKED_LABELS}
+        self._tombstones = {label: [] for label in TRACKED_LABELS}
+
+    def close(self):
+        if self.snapshot:
+            self.save()
+
+    def warm_up(self, connections=None):
+        # No hay conexiones que abrir
+        return {'connectivity_ms': 0.0, 'total_ms': 0.0, 'connections': 0}
+
+    def ping(self):
+        return 0.0
+
+    def ensure_schema(self):
+        return {'created': [], 'existing': list(INDEXES)}
+
+    def metrics(self):
+        return None
+
+    def cache_stats(self):
+        return None
+
+#SNAPSHOT
+
+    def save(self, path=None):
+        # Se escribe en un temporal y se renombra para no dejar nunca una instantánea a medias
+        path = path or self.snapshot
+        with self._lock:
+            state = {
+                'departments': [list(self._departments[dept_no]) for dept_no in self._dept_keys],
+                'employees': [[_serialize(value) for value in self._employees[emp_no]] for emp_no in self._order['emp_no']],
+                'works_in': sorted(self._works_in_of.items()),
+                'counters': self._counters,
+            }
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(state, file, ensure_ascii=False)
+        os.replace(temporary, path)
+        return {'departments': len(state['departments']), 'employees': len(state['employees'])}
+
+    def load(self, path=None):
+        # Sustituye todo el contenido; los clientes con una versión anterior tendrán que recargar
+        path = path or self.snapshot
+        with open(path, encoding='utf-8') as file:
+            state = json.load(file)
+        hire_date = EMPLOYEE_FIELDS.index('hire_date')
+        with self._lock:
+            self._clear()
+            for values in state['departments']:
+                department = DepartmentRow._make(values)
+                self._departments[department.dept_no] = department
+                self._dept_keys.append(department.dept_no)
+            self._dept_keys.sort()
+            for values in state['employees']:
+                if values[hire_date] is not None:
+                    values[hire_date] = datetime.fromisoformat(values[hire_date])
+                self._index_employee(EmployeeRow._make(values))
+            for emp_no, dept_no in state['works_in']:
+                self._link(emp_no, dept_no)
+            self._counters = {label: dict(state['counters'].get(label, {'version': 0, 'reset_at': 0})) for label in TRACKED_LABELS}
+            for label in TRACKED_LABELS:
+                self.mark_reset(label)
+            if self.team_aggregates:
+                self.rebuild_team_aggregates()
+        return {'departments': len(self._departments), 'employees': len(self._employees)}
+
+#STRUCTURES
+
+    def _index_employee(self, employee):
+        emp_no = employee.emp_no
+        self._employees[emp_no] = employee
+        for name in INDEXED:
+            value = getattr(employee, name)
+            if value is not None:
+                self._index[name].setdefault(value, set()).add(emp_no)
+        bisect.insort(self._order['emp_no'], emp_no)
+        for name in ('dept_no', 'job'):
+            value = getattr(employee, name)
+            if value is not None:
+                bisect.insort(self._order[name], (value, emp_no))
+
+    def _unindex_employee(self, emp_no):
+        employee = self._employees.pop(emp_no)
+        for name in INDEXED:
+            value = getattr(employee, name)
+            if value is not None:
+                keys = self._index[name][value]
+                keys.discard(emp_no)
+                if not keys:
+                    del self._index[name][value]
+        _remove_sorted(self._order['emp_no'], emp_no)
+        for name in ('dept_no', 'job'):
+            value = getattr(employee, name)
+            if value is not None:
+                _remove_sorted(self._order[name], (value, emp_no))
+        return employee
+
+    def _link(self, emp_no, dept_no):
+        self._unlink(emp_no)
+        self._works_in.setdefault(dept_no, set()).add(emp_no)
+        self._works_in_of[emp_no] = dept_no
+
+    def _unlink(self, emp_no):
+        dept_no = self._works_in_of.pop(emp_no, None)
+        if dept_no is None:
+            return 0
+        employees = self._works_in[dept_no]
+        employees.discard(emp_no)
+        if not employees:
+            del self._works_in[dept_no]
+        return 1
+
+    def _manages(self, emp_no):
+        # Relaciones MANAGES de un empleado: la de su manager (si existe) y las de sus subordinados
+        employee = self._employees[emp_no]
+        return (employee.mgr in self._employees) + len(self._index['mgr'].get(emp_no, ()))
+
+    def _bump(self, label):
+        counter = self._counters[label]
+        counter['version'] += 1
+        return counter['version']
+
+    def _touch(self, label, version, key):
+        versions = self._versions[label]
+        versions[key] = version
+        versions.move_to_end(key)
+
+    def _bury(self, label, version, key):
+        self._versions[label].pop(key, None)
+        self._tombstones[label].append((version, key))
+
+    def _store_departments(self, departments):
+        # Altas y cambios de departamentos con una sola versión
+        version = self._bump('Department')
+        for department in departments:
+            if department.dept_no not in self._departments:
+                bisect.insort(self._dept_keys, department.dept_no)
+            self._departments[department.dept_no] = department
+            self._touch('Department', version, department.dept_no)
+        return departments
+
+    def _ensure_departments(self, dept_nos):
+        # Como ENSURE_DEPARTMENTS: crea vacíos los departamentos que falten
+        missing = sorted({dept_no for dept_no in dept_nos if dept_no not in self._departments})
+        if missing:
+            self._store_departments([DepartmentRow(dept_no, None, None) for dept_no in missing])
+
+    def _store_employees(self, employees, move=True):
+        # Altas y cambios de empleados con una sola versión; con move=True la relación WORKS_IN
+        # pasa al departamento de la fila
+        version = self._bump('Employee')
+        old_managers = []
+        for employee in employees:
+            if employee.emp_no in self._employees:
+                old_managers.append(self._unindex_employee(employee.emp_no).mgr)
+            self._index_employee(employee)
+            if move or employee.emp_no not in self._works_in_of:
+                self._link(employee.emp_no, employee.dept_no)
+            self._touch('Employee', version, employee.emp_no)
+        if self.team_aggregates:
+            # Como CRUD: primero las cadenas de los managers anteriores y después las de las filas escritas
+            self._refresh_teams(old_managers + [employee.emp_no for employee in employees])
+        return employees
+
+    def _drop_employees(self, emp_nos):
+        # Devuelve las relaciones borradas (WORKS_IN y MANAGES)
+        version = self._bump('Employee')
+        relationships = 0
+        managers = []
+        for emp_no in emp_nos:
+            relationships += self._manages(emp_no) + self._unlink(emp_no)
+            managers.append(self._unindex_employee(emp_no).mgr)
+            self._teams.pop(emp_no, None)
+            self._bury('Employee', version, emp_no)
+        if self.team_aggregates:
+            self._refresh_teams(managers)
+        return relationships
+
+    def _refresh_teams(self, emp_nos):
+        # Como consultas.REFRESH_TEAMS: desde cada clave hacia arriba, cada manager se recalcula con los
+        # valores de sus subordinados directos
+        for emp_no in dict.fromkeys(emp_nos):
+            seen = set()
+            while emp_no in self._employees and emp_no not in seen:
+                seen.add(emp_no)
+                employee = self._employees[emp_no]
+                children = [self._teams[child] for child in self._index['mgr'].get(emp_no, ()) if child in self._teams]
+                self._teams[emp_no] = TeamRow(
+                    1 + sum(child.team_size for child in children),
+                    (employee.sal or 0) + (employee.comm or 0) + sum(child.team_pay for child in children),
+                    max((child.team_depth + 1 for child in children), default=0))
+                emp_no = employee.mgr
+
+    def _creates_cycle(self, emp_no, mgr):
+        # El nuevo manager es el propio empleado o está por debajo de él (al crear, si la cadena del
+        # manager acaba en un mgr que apunta a la clave que se va a crear)
+        seen = set()
+        while mgr is not None and mgr not in seen:
+            if mgr == emp_no:
+                return True
+            if mgr not in self._employees:
+                return False
+            seen.add(mgr)
+            mgr = self._employees[mgr].mgr
+        return False
+
+    def _drop_department(self, dept_no):
+        relationships = 0
+        for emp_no in list(self._works_in.get(dept_no, ())):
+            relationships += self._unlink(emp_no)
+        del self._departments[dept_no]
+        _remove_sorted(self._dept_keys, dept_no)
+        self._bury('Department', self._bump('Department'), dept_no)
+        return relationships
+
+#CREATE
+
+    def create_department(self, dept_no, dname, loc):
+        with self._lock:
+            if dept_no in self._departments:
+                raise ConstraintViolation(f"Ya existe el departamento {dept_no}")
+            return self._store_departments([DepartmentRow(dept_no, dname, loc)])[0]
+
+    def create_employee(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
+        with self._lock:
+            if emp_no in self._employees:
+                raise ConstraintViolation(f"Ya existe el empleado {emp_no}")
+            self._ensure_departments([dept_no])
+            return self._store_employees([EmployeeRow(emp_no, ename, job, mgr, hire_date, sal, comm, dept_no)])[0]
+
+    def create_employee_checked(self, emp_no, ename, job, mgr, hire_date, sal, comm, dept_no):
+        with self._lock:
+            if emp_no in self._employees:
+                return {'status': DUPLICATE, 'employee': None}
+            if dept_no not in self._departments:
+                return {'status': MISSING_DEPARTMENT, 'employee': None}
+            if mgr is not None and mgr not in self._employees:
+                return {'status': MISSING_MANAGER, 'employee': None}
+            if self._creates_cycle(emp_no, mgr):
+                return {'status': CYCLE, 'employee': None}
+            employee = self._store_employees([EmployeeRow(emp_no, ename, job, mgr, hire_date, sal, comm, dept_no)])[0]
+            return {'status': OK, 'employee': employee}
+
+#BULK
+
+    # Cada lote se comprueba entero antes de escribirlo: si una clave está repetida no se escribe nada de él
+    def bulk_create_departments(self, rows, batch_size=BATCH_SIZE):
+        results = []
+        for batch_no, chunk in enumerate(chunks(rows, batch_size)):
+            batch = [DepartmentRow(**as_row(row, DEPARTMENT_FIELDS)) for row in chunk]
+            with self._lock:
+                self._check_new(batch, self._departments, 'dept_no')
+                self._store_departments(batch)
+            results.append({'batch': batch_no, 'rows': len(batch), 'nodes_created': len(batch), 'relationships_created': 0,
+                            'properties_set': sum(value is not None for row in batch for value in row) + len(batch)})
+        return results
+
+    def bulk_create_employees(self, rows, batch_size=BATCH_SIZE):
+        results = []
+        for batch_no, chunk in enumerate(chunks(rows, batch_size)):
+            batch = [EmployeeRow(**as_row(row, EMPLOYEE_FIELDS)) for row in chunk]
+            with self._lock:
+                self._check_new(batch, self._employees, 'emp_no')
+                self._ensure_departments([employee.dept_no for employee in batch])
+                self._store_employees(batch)
+                manages = sum(employee.mgr in self._employees for employee in batch)
+            results.append({'batch': batch_no, 'rows': len(batch), 'nodes_created': len(batch), 'relationships_created': len(batch) + manages,
+                            'properties_set': sum(value is not None for row in batch for value in row) + len(batch)})
+        return results
+
+    @staticmethod
+    def _check_new(batch, table, key):
+        seen = set()
+        for row in batch:
+            value = getattr(row, key)
+            if value in table or value in seen:
+                raise ConstraintViolation(f"Clave duplicada: {key} = {value}")
+            seen.add(value)
+
+    def bulk_update_departments(self, rows, batch_size=BATCH_SIZE):
+        updated = []
+        for chunk in chunks(rows, batch_size):
+            with self._lock:
+                batch = [DepartmentRow(**as_row(row, DEPARTMENT_FIELDS)) for row in chunk]
+                batch = [department for department in batch if department.dept_no in self._departments]
+                updated.extend(department.dept_no for department in self._store_departments(batch))
+        return updated
+
+    def bulk_update_employees(self, rows, batch_size=BATCH_SIZE):
+        # Como update_employee_checked: no se actualizan las filas cuyo manager o departamento no existen,
+        # ni las que cerrarían un ciclo de managers
+        updated = []
+        for chunk in chunks(rows, batch_size):
+            with self._lock:
+                batch = [EmployeeRow(**as_row(row, EMPLOYEE_FIELDS)) for row in chunk]
+                batch = [employee for employee in batch
+                         if employee.emp_no in self._employees and employee.dept_no in self._departments
+                         and (employee.mgr is None or (employee.mgr in self._employees
+                                                       and not self._creates_cycle(employee.emp_no, employee.mgr)))]
+                updated.extend(employee.emp_no for employee in self._store_employees(batch))
+        return updated
+
+    def bulk_delete_departments(self, dept_nos, batch_size=BATCH_SIZE):
+        # Solo borra los departamentos sin empleados
+        deleted = []
+        for batch in chunks(dept_nos, batch_size):
+            with self._lock:
+                for dept_no in batch:
+                    if dept_no in self._departments and not self._works_in.get(dept_no):
+                        self._drop_department(dept_no)
+                        deleted.append(dept_no)
+        return deleted
+
+    def bulk_delete_employees(self, emp_nos, batch_size=BATCH_SIZE):
+        deleted = []
+        for batch in chunks(emp_nos, batch_size):
+            with self._lock:
+                batch = [emp_no for emp_no in dict.fromkeys(batch) if emp_no in self._employees]
+                self._drop_employees(batch)
+                deleted.extend(batch)
+        return deleted
+
+#READ
+
+    def read_department(self, dept_no):
+        with self._lock:
+            return self._departments.get(dept_no)
+
+    def read_employee(self, emp_no):
+        # Como en Neo4j, un empleado sin relación WORKS_IN no se encuentra
+        with self._lock:
+            employee = self._employees.get(emp_no)
+            dept_no = self._works_in_of.get(emp_no)
+            if employee is None or dept_no is None:
+                return None
+            return EmployeeDetailRow(*employee, self._departments[dept_no].dname)
+
+    def read_all_departments(self, as_tuples=False):
+        with self._lock:
+            return _rows([self._departments[dept_no] for dept_no in self._dept_keys], as_tuples)
+
+    def read_all_employees(self, as_tuples=False):
+        with self._lock:
+            return _rows([self._employees[emp_no] for emp_no in self._order['emp_no']], as_tuples)
+
+    def read_departments_page(self, after_dept_no=None, limit=PAGE_SIZE, as_tuples=False):
+        with self._lock:
+            start = 0 if after_dept_no is None else bisect.bisect_right(self._dept_keys, after_dept_no)
+            return _rows([self._departments[dept_no] for dept_no in self._dept_keys[start:start + limit]], as_tuples)
+
+    def read_employees_page(self, after_emp_no=None, limit=PAGE_SIZE, order_by='emp_no', after_key=None, as_tuples=False):
+        if order_by not in EMPLOYEE_ORDER_KEYS:
+            raise ValueError(f"No se puede paginar por {order_by}")
+        with self._lock:
+            order = self._order[order_by]
+            if after_emp_no is None:
+                start = 0
+            elif order_by == 'emp_no':
+                start = bisect.bisect_right(order, after_emp_no)
+            else:
+                start = bisect.bisect_right(order, (after_key, after_emp_no))
+            keys = order[start:start + limit]
+            if order_by != 'emp_no':
+                keys = [emp_no for _, emp_no in keys]
+            return _rows([self._employees[emp_no] for emp_no in keys], as_tuples)
+
+    def search_employees(self, name_prefix=None, job=None, dept_no=None, min_sal=None, max_sal=None,
+                         hired_from=None, hired_to=None, text=None, after_emp_no=None, limit=PAGE_SIZE):
+        # Parte del índice más selectivo disponible (dept_no o job) y filtra el resto
+        filters = {'name_prefix': name_prefix, 'job': job, 'dept_no': dept_no, 'min_sal': min_sal, 'max_sal': max_sal,
+                   'hired_from': hired_from, 'hired_to': hired_to}
+        terms = text.lower().split() if text else []
+        with self._lock:
+            if dept_no is not None or job is not None:
+                name, value = ('dept_no', dept_no) if dept_no is not None else ('job', job)
+                candidates = sorted(self._index[name].get(value, ()))
+            else:
+                candidates = self._order['emp_no']
+            start = 0 if after_emp_no is None else bisect.bisect_right(candidates, after_emp_no)
+            found = []
+            for emp_no in candidates[start:]:
+                employee = self._employees[emp_no]
+                if _matches(employee, filters, terms):
+                    found.append(employee)
+                    if len(found) == limit:
+                        break
+            return found
+
+    # Las lecturas en streaming copian solo las claves; las filas se leen de fetch_size en fetch_size
+    def iter_departments(self, fetch_size=FETCH_SIZE, as_tuples=False):
+        with self._lock:
+            keys = list(self._dept_keys)
+        return self._iter(keys, self._departments, fetch_size, as_tuples)
+
+    def iter_employees(self, fetch_size=FETCH_SIZE, as_tuples=False):
+        with self._lock:
+            keys = list(self._order['emp_no'])
+        return self._iter(keys, self._employees, fetch_size, as_tuples)
+
+    def _iter(self, keys, table, fetch_size, as_tuples):
+        for chunk in chunks(keys, fetch_size):
+            with self._lock:
+                rows = [table[key] for key in chunk if key in table]
+            yield from _rows(rows, as_tuples)
+
+#HIERARCHY
+
+    def reporting_chain(self, emp_no):
+        with self._lock:
+            chain = []
+            seen = {emp_no}
+            employee = self._employees.get(emp_no)
+            while employee is not None and employee.mgr in self._employees and employee.mgr not in seen:
+                employee = self._employees[employee.mgr]
+                seen.add(employee.emp_no)
+                chain.append(employee)
+            return chain
+
+    def subordinates(self, emp_no, max_depth=None):
+        with self._lock:
+            if emp_no not in self._employees:
+                return []
+            found = []
+            seen = {emp_no}
+            level = [emp_no]
+            depth = 0
+            while level and (max_depth is None or depth < max_depth):
+                depth += 1
+                level = sorted(s for m in level for s in self._index['mgr'].get(m, ()) if s not in seen)
+                seen.update(level)
+                found.extend({'employee': self._employees[s], 'depth': depth} for s in level)
+            return found
+
+    def span_of_control(self, emp_no):
+        with self._lock:
+            if emp_no not in self._employees:
+                return None
+            reports = self.subordinates(emp_no)
+            return {'direct_reports': len(self._index['mgr'].get(emp_no, ())), 'total_reports': len(reports),
+                    'depth': reports[-1]['depth'] if reports else 0}
+
+#TEAMS
+
+    def team_stats(self, emp_nos):
+        # {emp_no: TeamRow}; sin los agregados activados los valores son None, como en Neo4j
+        with self._lock:
+            return {emp_no: self._teams.get(emp_no, TeamRow(None, None, None)) for emp_no in emp_nos if emp_no in self._employees}
+
+    def rebuild_team_aggregates(self, batch_size=BATCH_SIZE):
+        # Cada paso recalcula la cadena de un empleado: la última vez que se pasa por un manager es
+        # posterior a cualquier cambio por debajo, así que todos acaban con su valor correcto
+        with self._lock:
+            self._teams = {}
+            self._refresh_teams(self._employees)
+            return {'properties_set': len(self._teams) * 3}
+
+#UPDATE
+
+    def update_department(self, dept_no, new_dname, new_loc):
+        with self._lock:
+            if dept_no not in self._departments:
+                return None
+            return self._store_departments([DepartmentRow(dept_no, new_dname, new_loc)])[0]
+
+    def update_employee(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
+        # Como CRUD.update_employee: cambia las propiedades pero no mueve la relación WORKS_IN
+        with self._lock:
+            if emp_no not in self._employees:
+                return None
+            employee = EmployeeRow(emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no)
+            return self._store_employees([employee], move=False)[0]
+
+    def update_employee_checked(self, emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no):
+        with self._lock:
+            if emp_no not in self._employees:
+                return {'status': NOT_FOUND, 'employee': None}
+            if new_dept_no not in self._departments:
+                return {'status': MISSING_DEPARTMENT, 'employee': None}
+            if new_mgr is not None and new_mgr not in self._employees:
+                return {'status': MISSING_MANAGER, 'employee': None}
+            if self._creates_cycle(emp_no, new_mgr):
+                return {'status': CYCLE, 'employee': None}
+            employee = EmployeeRow(emp_no, new_ename, new_job, new_mgr, new_hire_date, new_sal, new_comm, new_dept_no)
+            return {'status': OK, 'employee': self._store_employees([employee])[0]}
+
+#AGGREGATES
+
+    @staticmethod
+    def _stats(employees):
+        salaries = [employee.sal for employee in employees if employee.sal is not None]
+        return {
+            'headcount': len(employees),
+            'total_sal': sum(salaries),
+            'avg_sal': sum(salaries) / len(salaries) if salaries else None,
+            'min_sal': min(salaries, default=None),
+            'max_sal': max(salaries, default=None),
+            'total_comm': sum(employee.comm or 0 for employee in employees),
+        }
+
+    def department_stats(self):
+        with self._lock:
+            return [{'dept_no': dept_no, 'dname': self._departments[dept_no].dname,
+                     **self._stats([self._employees[emp_no] for emp_no in self._works_in.get(dept_no, ())])}
+                    for dept_no in self._dept_keys]
+
+    def job_stats(self):
+        # Los nulos van al final, como en el ORDER BY de Cypher
+        with self._lock:
+            groups = {}
+            for employee in self._employees.values():
+                groups.setdefault(employee.job, []).append(employee)
+            return [{'job': job, **self._stats(employees)}
+                    for job, employees in sorted(groups.items(), key=lambda item: (item[0] is None, item[0] or ''))]
+
+    def hire_histogram(self, group_by='dept_no', interval='year'):
+        if group_by not in ('dept_no', 'job'):
+            raise ValueError(f"No se puede agrupar por {group_by}")
+        if interval not in ('year', 'month'):
+            raise ValueError(f"Intervalo no válido: {interval}")
+        with self._lock:
+            counts = {}
+            for employee in self._employees.values():
+                if employee.hire_date is None:
+                    continue
+                hired = _as_date(employee.hire_date)
+                period = str(hired.year) if interval == 'year' else f"{hired.year}-{hired.month:02d}"
+                key = (getattr(employee, group_by), period)
+                counts[key] = counts.get(key, 0) + 1
+        return [{'group': group, 'period': period, 'hires': hires}
+                for (group, period), hires in sorted(counts.items(), key=lambda item: (item[0][0] is None, item[0]))]
+
+#CHANGES
+
+    def changes_since(self, label, version=None, limit=CHANGE_LIMIT):
+        if label not in TRACKED_LABELS:
+            raise ValueError(f"Etiqueta sin seguimiento de cambios: {label}")
+        table = self._departments if label == 'Department' else self._employees
+        with self._lock:
+            current, reset_at = self._counters[label]['version'], self._counters[label]['reset_at']
+            changes = {'version': current, 'reset': False, 'changed': [], 'deleted': []}
+            if version is None or version < reset_at or version > current:
+                changes['reset'] = True
+                return changes
+            if version == current:
+                return changes
+            # Las versiones están en orden de escritura: se recorren desde la más reciente
+            changed = []
+            for key, written in reversed(self._versions[label].items()):
+                if written <= version:
+                    break
+                changed.append(key)
+                if len(changed) > limit:
+                    changes['reset'] = True
+                    return changes
+            changes['changed'] = [table[key] for key in reversed(changed)]
+            tombstones = self._tombstones[label]
+            start = bisect.bisect_right(tombstones, version, key=lambda tombstone: tombstone[0])
+            changes['deleted'] = list(dict.fromkeys(key for _, key in tombstones[start:] if key not in table))
+            return changes
+
+    def mark_reset(self, label):
+        with self._lock:
+            version = self._bump(label)
+            self._counters[label]['reset_at'] = version
+            self.prune_tombstones(label, version)
+            return version
+
+    def prune_tombstones(self, label, up_to_version, batch_size=BATCH_SIZE):
+        if label not in TRACKED_LABELS:
+            raise ValueError(f"Etiqueta sin seguimiento de cambios: {label}")
+        with self._lock:
+            tombstones = self._tombstones[label]
+            end = bisect.bisect_right(tombstones, up_to_version, key=lambda tombstone: tombstone[0])
+            del tombstones[:end]
+            counter = self._counters[label]
+            counter['reset_at'] = max(counter['reset_at'], up_to_version)
+            return {'nodes_deleted': end, 'relationships_deleted': 0}
+
+#DELETE
+
+    def delete_department(self, dept_no):
+        # Como DETACH DELETE: los empleados se quedan sin relación WORKS_IN
+        with self._lock:
+            if dept_no not in self._departments:
+                return False
+            self._drop_department(dept_no)
+            return True
+
+    def delete_employee(self, emp_no):
+        with self._lock:
+            if emp_no not in self._employees:
+                return False
+            self._drop_employees([emp_no])
+            return True
+
+    def delete_department_if_empty(self, dept_no):
+        with self._lock:
+            if dept_no not in self._departments:
+                return NOT_FOUND
+            if self._works_in.get(dept_no):
+                return HAS_EMPLOYEES
+            self._drop_department(dept_no)
+            return OK
+
+    def delete_department_cascade(self, dept_no, batch_size=BATCH_SIZE, progress=None):
+        with self._lock:
+            report = self._delete_employees(sorted(self._works_in.get(dept_no, ())), batch_size, progress)
+            report['department_deleted'] = self.delete_department(dept_no)
+            return report
+
+    def delete_employees_where(self, name_prefix=None, job=None, dept_no=None, min_sal=None, max_sal=None,
+                               hired_from=None, hired_to=None, batch_size=BATCH_SIZE, progress=None):
+        filters = {'name_prefix': name_prefix, 'job': job, 'dept_no': dept_no, 'min_sal': min_sal, 'max_sal': max_sal,
+                   'hired_from': hired_from, 'hired_to': hired_to}
+        if all(value is None for value in filters.values()):
+            raise ValueError("delete_employees_where necesita al menos un filtro")
+        with self._lock:
+            emp_nos = [emp_no for emp_no, employee in self._employees.items() if _matches(employee, filters, [])]
+            return self._delete_employees(emp_nos, batch_size, progress)
+
+    def _delete_employees(self, emp_nos, batch_size, progress):
+        # Como los borrados masivos de CRUD: sin lápidas, los clientes recargan
+        report = {'nodes_deleted': 0, 'relationships_deleted': 0}
+        for batch in chunks(emp_nos, batch_size):
+            report['relationships_deleted'] += self._drop_employees(batch)
+            report['nodes_deleted'] += len(batch)
+            if progress:
+                progress(dict(report))
+        self.mark_reset('Employee')
+        return report
+
+    def department_has_employees(self, dept_no):
+        with self._lock:
+            return bool(self._index['dept_no'].get(dept_no))
+
+#ALL
+
+    def delete_all(self, batch_size=BATCH_SIZE, progress=None):
+        # Los contadores de cambios se conservan para que los clientes sepan que tienen que recargar
+        with self._lock:
+            report = {
+                'nodes_deleted': len(self._departments) + len(self._employees),
+                'relationships_deleted': len(self._works_in_of) + sum(employee.mgr in self._employees for employee in self._employees.values()),
+            }
+            self._clear()
+            for label in TRACKED_LABELS:
+                self.mark_reset(label)
+        if progress:
+            progress(dict(report))
+        print("Todos los nodos han sido borrados.")
+        return report
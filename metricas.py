@@ -0,0 +1,134 @@
+import bisect
+import logging
+import threading
+
+# Registro de consultas lentas; se configura como cualquier otro logger de la aplicación
+slow_query_log = logging.getLogger('crud.slow_queries')
+
+# Límites superiores (ms) de los cubos de los histogramas; el último cubo recoge todo lo demás
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+COUNTER_NAMES = (
+    'nodes_created', 'nodes_deleted', 'relationships_created', 'relationships_deleted',
+    'properties_set', 'labels_added', 'labels_removed', 'indexes_added', 'constraints_added',
+)
+
+
+class Histogram:
+    # Histograma de cubos fijos: memoria constante sea cual sea el número de observaciones
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, fraction):
+        # Estimación por el límite superior del cubo donde cae el cuantil
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([*map(str, self.bounds), 'inf'], self.counts)),
+        }
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.wall_ms = Histogram()
+        self.available_after_ms = Histogram()
+        self.consumed_after_ms = Histogram()
+        self.counters = dict.fromkeys(COUNTER_NAMES, 0)
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'wall_ms': self.wall_ms.snapshot(),
+            'result_available_after_ms': self.available_after_ms.snapshot(),
+            'result_consumed_after_ms': self.consumed_after_ms.snapshot(),
+            'counters': dict(self.counters),
+        }
+
+
+class QueryMetrics:
+    # Métricas por método del CRUD: tiempo de pared, tiempos del servidor, filas y contadores de escritura
+    def __init__(self, slow_query_ms=None):
+        self.slow_query_ms = slow_query_ms
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, wall_ms, summaries, rows):
+        with self._lock:
+            stats = self._methods.setdefault(method, MethodStats())
+            stats.calls += 1
+            stats.rows += rows
+            stats.wall_ms.observe(wall_ms)
+            for summary in summaries:
+                if summary.result_available_after is not None:
+                    stats.available_after_ms.observe(summary.result_available_after)
+                if summary.result_consumed_after is not None:
+                    stats.consumed_after_ms.observe(summary.result_consumed_after)
+                counters = summary.counters
+                for name in COUNTER_NAMES:
+                    stats.counters[name] += getattr(counters, name)
+        if self.slow_query_ms is not None and wall_ms >= self.slow_query_ms:
+            queries = ' | '.join(' '.join(summary.query.split()) for summary in summaries if summary.query)
+            slow_query_log.warning("%s tardó %.1f ms (%d filas): %s", method, wall_ms, rows, queries)
+
+    def record_error(self, method, wall_ms):
+        with self._lock:
+            stats = self._methods.setdefault(method, MethodStats())
+            stats.calls += 1
+            stats.errors += 1
+            stats.wall_ms.observe(wall_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {method: stats.snapshot() for method, stats in sorted(self._methods.items())}
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+
+
+class RecordingTx:
+    # Envuelve una transacción para quedarse con los resultados y poder leer su ResultSummary después
+    def __init__(self, tx):
+        self._tx = tx
+        self.results = []
+
+    def run(self, query, parameters=None, **kwargs):
+        result = self._tx.run(query, parameters, **kwargs)
+        self.results.append(result)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
@@ -0,0 +1,47 @@
+from collections import namedtuple
+
+# Filas compactas que devuelve el CRUD en lugar de nodos de Neo4j completos: las consultas proyectan
+# solo estas propiedades y aquí se convierten. namedtuple no tiene __dict__ por instancia y se puede
+# desempaquetar o pasar tal cual como valores de una fila del Treeview
+
+DEPARTMENT_FIELDS = ('dept_no', 'dname', 'loc')
+EMPLOYEE_FIELDS = ('emp_no', 'ename', 'job', 'mgr', 'hire_date', 'sal', 'comm', 'dept_no')
+# Agregados de equipo materializados en cada empleado (ver CRUD.team_stats)
+TEAM_FIELDS = ('team_size', 'team_pay', 'team_depth')
+
+DepartmentRow = namedtuple('DepartmentRow', DEPARTMENT_FIELDS)
+EmployeeRow = namedtuple('EmployeeRow', EMPLOYEE_FIELDS)
+TeamRow = namedtuple('TeamRow', TEAM_FIELDS)
+# Empleado con el nombre de su departamento, como lo devuelve read_employee
+EmployeeDetailRow = namedtuple('EmployeeDetailRow', EMPLOYEE_FIELDS + ('department_name',))
+# Empleado con sus agregados de equipo, tal como lo muestra la lista de la interfaz
+EmployeeTeamRow = namedtuple('EmployeeTeamRow', EMPLOYEE_FIELDS + TEAM_FIELDS)
+
+HIRE_DATE = EMPLOYEE_FIELDS.index('hire_date')
+
+
+def native(value):
+    # Fechas y horas de Neo4j a sus equivalentes de Python; el resto no cambia
+    return value.to_native() if hasattr(value, 'to_native') else value
+
+
+def department_row(values, as_tuples=False):
+    if values is None:
+        return None
+    return tuple(values) if as_tuples else DepartmentRow._make(values)
+
+
+def employee_row(values, as_tuples=False):
+    if values is None:
+        return None
+    values = list(values)
+    values[HIRE_DATE] = native(values[HIRE_DATE])
+    return tuple(values) if as_tuples else EmployeeRow._make(values)
+
+
+def employee_detail_row(values):
+    if values is None:
+        return None
+    values = list(values)
+    values[HIRE_DATE] = native(values[HIRE_DATE])
+    return EmployeeDetailRow._make(values)
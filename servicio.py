@@ -0,0 +1,337 @@
+import argparse
+import json
+import re
+import sys
+import traceback
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from almacen import (open_storage, PAGE_SIZE, OK, DUPLICATE, NOT_FOUND, HAS_EMPLOYEES, MISSING_MANAGER, MISSING_DEPARTMENT, CYCLE,
+                     CONFLICT, INVALID, UNAVAILABLE, FAILED)
+from intercambio import parse_department, parse_employee
+
+# Acceso sin interfaz gráfica al CRUD: un servidor HTTP local con una API JSON y un comando `call`
+# que ejecuta la misma ruta sin pasar por HTTP (para scripts y cron). Un solo CRUD, y por tanto un
+# solo driver y pool de conexiones, atiende todas las peticiones; el servidor usa un hilo por petición.
+#
+#   python servicio.py serve --port 8080
+#   python servicio.py call GET /employees/7369
+#   python servicio.py call POST /departments '{"dept_no": 50, "dname": "IT", "loc": "MADRID"}'
+#
+# Rutas:
+#   GET    /health
+#   GET    /metrics
+#   GET    /departments?after=&limit=
+#   POST   /departments                  {"dept_no", "dname", "loc"}
+#   POST   /departments/bulk             [{...}, ...]
+#   GET    /departments/<dept_no>
+#   PUT    /departments/<dept_no>        {"dname", "loc"}
+#   DELETE /departments/<dept_no>        solo si no tiene empleados (409 si los tiene)
+#   GET    /employees?after=&limit=&order_by=&after_key=
+#   GET    /employees?name_prefix=&job=&dept_no=&min_sal=&max_sal=&hired_from=&hired_to=&text=&after=
+#   POST   /employees                    {"emp_no", "ename", "job", "mgr", "hire_date", "sal", "comm", "dept_no"}
+#   POST   /employees/bulk               [{...}, ...]
+#   GET    /employees/<emp_no>
+#   PUT    /employees/<emp_no>           mismos campos que al crear, sin emp_no
+#   DELETE /employees/<emp_no>
+#   GET    /employees/<emp_no>/subordinates?max_depth=
+#   GET    /employees/<emp_no>/chain
+#   GET    /employees/<emp_no>/team          agregados de equipo (con team_aggregates)
+#   POST   /teams/rebuild                    reconstruye los agregados de equipo
+#   GET    /stats/departments
+#   GET    /stats/jobs
+#   GET    /stats/hires?group_by=dept_no|job&interval=year|month
+#   GET    /changes/<Department|Employee>?version=
+#   POST   /changes/<Department|Employee>/prune?up_to_version=
+#                                        borra las lápidas hasta esa versión; los clientes más antiguos recargan.
+#                                        Cada reinicio (mark_reset) ya borra las anteriores a él
+
+# Estado HTTP de cada resultado de las escrituras validadas
+STATUS_CODES = {OK: 200, DUPLICATE: 409, HAS_EMPLOYEES: 409, NOT_FOUND: 404, MISSING_MANAGER: 422, MISSING_DEPARTMENT: 422, CYCLE: 422}
+
+# Estado HTTP y prefijo del mensaje de cada clase de error del almacén (Storage.error_kind). Así el
+# servicio no importa el driver de Neo4j y con backend = memory funciona sin tenerlo instalado
+ERROR_CODES = {
+    CONFLICT: (409, ""),
+    INVALID: (400, "Petición no válida: "),
+    UNAVAILABLE: (503, "Base de datos no disponible: "),
+    FAILED: (500, "Error de la base de datos: "),
+}
+
+SEARCH_FILTERS = {
+    'name_prefix': str, 'job': str, 'dept_no': int, 'min_sal': float, 'max_sal': float,
+    'hired_from': datetime.fromisoformat, 'hired_to': datetime.fromisoformat, 'text': str,
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def jsonable(value):
+    # Filas (namedtuple) a objetos, fechas a ISO 8601
+    if hasattr(value, '_asdict'):
+        value = value._asdict()
+    if isinstance(value, dict):
+        return {key: jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    if hasattr(value, 'to_native'):
+        value = value.to_native()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class Service:
+    # Enrutado independiente del transporte: handle() devuelve (estado HTTP, cuerpo).
+    # Cada ruta es (método, patrón, manejador, cuerpo esperado): dict, list (de objetos) o None si no lleva
+    def __init__(self, crud):
+        self.crud = crud
+        self.routes = [
+            ('GET', r'/health', self.health, None),
+            ('GET', r'/metrics', self.metrics, None),
+            ('GET', r'/departments', self.list_departments, None),
+            ('POST', r'/departments', self.create_department, dict),
+            ('POST', r'/departments/bulk', self.bulk_departments, list),
+            ('GET', r'/departments/(\d+)', self.get_department, None),
+            ('PUT', r'/departments/(\d+)', self.update_department, dict),
+            ('DELETE', r'/departments/(\d+)', self.delete_department, None),
+            ('GET', r'/employees', self.list_employees, None),
+            ('POST', r'/employees', self.create_employee, dict),
+            ('POST', r'/employees/bulk', self.bulk_employees, list),
+            ('GET', r'/employees/(\d+)', self.get_employee, None),
+            ('PUT', r'/employees/(\d+)', self.update_employee, dict),
+            ('DELETE', r'/employees/(\d+)', self.delete_employee, None),
+            ('GET', r'/employees/(\d+)/subordinates', self.subordinates, None),
+            ('GET', r'/employees/(\d+)/chain', self.reporting_chain, None),
+            ('GET', r'/employees/(\d+)/team', self.team, None),
+            ('POST', r'/teams/rebuild', self.rebuild_teams, None),
+            ('GET', r'/stats/departments', lambda query: self.crud.department_stats(), None),
+            ('GET', r'/stats/jobs', lambda query: self.crud.job_stats(), None),
+            ('GET', r'/stats/hires', self.hire_histogram, None),
+            ('GET', r'/changes/(\w+)', self.changes, None),
+            ('POST', r'/changes/(\w+)/prune', self.prune_tombstones, None),
+        ]
+
+    def handle(self, method, path, query=None, body=None):
+        url = urlsplit(path)
+        query = dict(query or {}, **{name: values[-1] for name, values in parse_qs(url.query).items()})
+        try:
+            allowed = False
+            for route_method, pattern, handler, expected in self.routes:
+                match = re.fullmatch(pattern, url.path.rstrip('/') or '/')
+                if not match:
+                    continue
+                if route_method != method:
+                    allowed = True
+                    continue
+                args = [group if group.isalpha() else int(group) for group in match.groups()]
+                if method in ('POST', 'PUT'):
+                    self._check_body(body, expected)
+                    args.append(body)
+                result = handler(*args, query)
+                # (estado, cuerpo); las filas también son tuplas, pero con nombre
+                if type(result) is tuple:
+                    return result[0], jsonable(result[1])
+                return 200, jsonable(result)
+            if allowed:
+                raise HTTPError(405, f"Método no permitido: {method} {url.path}")
+            raise HTTPError(404, f"Ruta no encontrada: {method} {url.path}")
+        except HTTPError as error:
+            return error.status, {'error': str(error)}
+        except (ValueError, TypeError, KeyError) as error:
+            return 400, {'error': f"Petición no válida: {error}"}
+        except Exception as error:
+            kind = self.crud.error_kind(error)
+            if kind is not None:
+                status, prefix = ERROR_CODES[kind]
+                return status, {'error': prefix + (getattr(error, 'message', None) or str(error))}
+            # Una petición nunca debe tumbar el hilo del servidor: se registra y se responde con 500
+            traceback.print_exc()
+            return 500, {'error': f"Error interno: {error}"}
+
+    @staticmethod
+    def _check_body(body, expected):
+        if expected is dict and not isinstance(body, dict):
+            raise HTTPError(400, "El cuerpo tiene que ser un objeto JSON")
+        if expected is list and not (isinstance(body, list) and all(isinstance(row, dict) for row in body)):
+            raise HTTPError(400, "El cuerpo tiene que ser una lista de objetos JSON")
+
+    @staticmethod
+    def _int(query, name, default=None):
+        return int(query[name]) if query.get(name) not in (None, '') else default
+
+    @staticmethod
+    def _found(value):
+        if value is None:
+            raise HTTPError(404, "No encontrado")
+        return value
+
+#GENERAL
+
+    def health(self, query):
+        # Solo un PING: los sondeos de vida pueden llegar muy seguidos. warm_up se llama al arrancar
+        return {'status': 'ok', 'ping_ms': self.crud.ping()}
+
+    def metrics(self, query):
+        return {'queries': self.crud.metrics(), 'cache': self.crud.cache_stats()}
+
+    def changes(self, label, query):
+        return self.crud.changes_since(label, self._int(query, 'version'))
+
+    def prune_tombstones(self, label, body, query):
+        up_to_version = self._int(query, 'up_to_version')
+        if up_to_version is None:
+            raise HTTPError(400, "Falta up_to_version")
+        return self.crud.prune_tombstones(label, up_to_version)
+
+#DEPARTMENTS
+
+    def list_departments(self, query):
+        return self.crud.read_departments_page(self._int(query, 'after'), self._int(query, 'limit', PAGE_SIZE))
+
+    def get_department(self, dept_no, query):
+        return self._found(self.crud.read_department(dept_no))
+
+    def create_department(self, body, query):
+        return 201, self.crud.create_department(*parse_department(body))
+
+    def bulk_departments(self, body, query):
+        return 201, self.crud.bulk_create_departments([parse_department(row) for row in body])
+
+    def update_department(self, dept_no, body, query):
+        return self._found(self.crud.update_department(dept_no, body.get('dname'), body.get('loc')))
+
+    def delete_department(self, dept_no, query):
+        status = self.crud.delete_department_if_empty(dept_no)
+        return STATUS_CODES[status], {'status': status}
+
+#EMPLOYEES
+
+    def list_employees(self, query):
+        limit = self._int(query, 'limit', PAGE_SIZE)
+        filters = {name: convert(query[name]) for name, convert in SEARCH_FILTERS.items() if query.get(name)}
+        if filters:
+            return self.crud.search_employees(**filters, after_emp_no=self._int(query, 'after'), limit=limit)
+        order_by = query.get('order_by', 'emp_no')
+        after_key = query.get('after_key')
+        if after_key is not None and order_by == 'dept_no':
+            after_key = int(after_key)
+        return self.crud.read_employees_page(self._int(query, 'after'), limit, order_by, after_key)
+
+    def get_employee(self, emp_no, query):
+        return self._found(self.crud.read_employee(emp_no))
+
+    def create_employee(self, body, query):
+        result = self.crud.create_employee_checked(*parse_employee(body))
+        return (201 if result['status'] == OK else STATUS_CODES[result['status']]), result
+
+    def bulk_employees(self, body, query):
+        return 201, self.crud.bulk_create_employees([parse_employee(row) for row in body])
+
+    def update_employee(self, emp_no, body, query):
+        result = self.crud.update_employee_checked(*parse_employee(dict(body, emp_no=emp_no)))
+        return STATUS_CODES[result['status']], result
+
+    def delete_employee(self, emp_no, query):
+        if not self.crud.delete_employee(emp_no):
+            raise HTTPError(404, "No encontrado")
+        return {'deleted': True}
+
+    def subordinates(self, emp_no, query):
+        return self.crud.subordinates(emp_no, self._int(query, 'max_depth'))
+
+    def reporting_chain(self, emp_no, query):
+        return self.crud.reporting_chain(emp_no)
+
+    def team(self, emp_no, query):
+        return self._found(self.crud.team_stats([emp_no]).get(emp_no))
+
+    def rebuild_teams(self, body, query):
+        return self.crud.rebuild_team_aggregates()
+
+    def hire_histogram(self, query):
+        return self.crud.hire_histogram(query.get('group_by', 'dept_no'), query.get('interval', 'year'))
+
+
+class Handler(BaseHTTPRequestHandler):
+    # self.server.service es el Service compartido por todos los hilos
+    def _dispatch(self):
+        body = None
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                body = json.loads(self.rfile.read(length))
+        except ValueError as error:
+            self._send(400, {'error': f"JSON no válido: {error}"})
+            return
+        status, payload = self.server.service.handle(self.command, self.path, body=body)
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(crud, host='127.0.0.1', port=8080, verbose=False):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = Service(crud)
+    server.verbose = verbose
+    print(f"Escuchando en http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API JSON y línea de comandos sobre el CRUD, sin interfaz gráfica")
+    parser.add_argument('--config', help="fichero de configuración (por defecto, CRUD_CONFIG o crud.ini)")
+    parser.add_argument('--instrument', action='store_true', help="recoge métricas por método (GET /metrics)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    server = commands.add_parser('serve', help="arranca el servidor HTTP")
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8080)
+    server.add_argument('--verbose', action='store_true', help="registra cada petición")
+
+    call = commands.add_parser('call', help="ejecuta una ruta de la API y escribe la respuesta")
+    call.add_argument('method', choices=['GET', 'POST', 'PUT', 'DELETE'], type=str.upper)
+    call.add_argument('path')
+    call.add_argument('body', nargs='?', help="cuerpo JSON; '-' lo lee de la entrada estándar")
+    args = parser.parse_args(argv)
+
+    crud = open_storage(args.config, instrument=args.instrument)
+    try:
+        if args.command == 'serve':
+            crud.warm_up()
+            serve(crud, args.host, args.port, args.verbose)
+            return 0
+        body = None
+        if args.body:
+            body = json.load(sys.stdin) if args.body == '-' else json.loads(args.body)
+        status, payload = Service(crud).handle(args.method, args.path, body=body)
+        print(json.dumps(payload, ensure_ascii=False, indent=2))
+        return 0 if status < 400 else 1
+    finally:
+        crud.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
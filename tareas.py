@@ -0,0 +1,83 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+# Intervalo con el que el hilo de Tk recoge los resultados de los hilos de trabajo
+POLL_MS = 50
+
+
+class BackgroundRunner:
+    # Ejecuta las llamadas al CRUD en un pool de hilos y entrega los resultados en el hilo de Tk
+    def __init__(self, master, workers=4, on_busy=None):
+        self.master = master
+        self.on_busy = on_busy
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crud')
+        self._results = queue.Queue()
+        self._latest = {}  # clave -> future más reciente, las anteriores quedan obsoletas
+        self._pending = 0
+        self._closed = False
+        self.master.after(POLL_MS, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None, background=False):
+        # Con `key`, una llamada nueva cancela (o descarta el resultado de) la anterior con la misma clave.
+        # Con background=True no cuenta para el indicador de actividad (sondeos periódicos)
+        if key is not None:
+            previous = self._latest.get(key)
+            if previous is not None:
+                previous.cancel()
+        future = self._executor.submit(fn, *args)
+        if key is not None:
+            self._latest[key] = future
+        if not background:
+            self._set_pending(self._pending + 1)
+        future.add_done_callback(lambda done: self._results.put(('result', done, key, on_done, on_error, background)))
+        return future
+
+    def post(self, fn, *args):
+        # Permite a los hilos de trabajo pedir que algo se ejecute en el hilo de Tk (p. ej. progreso)
+        self._results.put(('call', fn, args))
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def shutdown(self):
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _set_pending(self, pending):
+        was_busy = self.busy
+        self._pending = pending
+        if self.on_busy and was_busy != self.busy:
+            self.on_busy(self.busy)
+
+    def _poll(self):
+        try:
+            while True:
+                item = self._results.get_nowait()
+                if item[0] == 'call':
+                    item[1](*item[2])
+                else:
+                    self._deliver(*item[1:])
+        except queue.Empty:
+            pass
+        if not self._closed:
+            self.master.after(POLL_MS, self._poll)
+
+    def _deliver(self, future, key, on_done, on_error, background):
+        if not background:
+            self._set_pending(self._pending - 1)
+        if future.cancelled():
+            return
+        if key is not None:
+            if self._latest.get(key) is not future:
+                return  # Resultado obsoleto: ya se pidió algo más reciente con la misma clave
+            del self._latest[key]
+        error = future.exception()
+        if error is not None:
+            if on_error:
+                on_error(error)
+            else:
+                messagebox.showerror("Error", f"Error al consultar la base de datos: {error}")
+        elif on_done:
+            on_done(future.result())
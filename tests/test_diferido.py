@@ -0,0 +1,21 @@
+from diferido import WriteBehindBuffer
+from memoria import MemoryCRUD
+
+
+def test_partial_failure_keeps_committed_chunks():
+    # Con batch_size=2 el primer lote (1 y 2) se confirma y el segundo (3) choca con un emp_no existente:
+    # solo el 3 tiene que salir como error
+    crud = MemoryCRUD()
+    crud.create_department(10, 'ACCOUNTING', 'NEW YORK')
+    crud.create_employee(3, 'KING', 'PRESIDENT', None, None, 5000, None, 10)
+    buffer = WriteBehindBuffer(crud, flush_interval=3600, batch_size=2)
+    try:
+        for emp_no in (1, 2, 3):
+            buffer.create_employee(emp_no, f'E{emp_no}', 'CLERK', None, None, 1000, None, 10)
+        report = buffer.flush()
+    finally:
+        buffer.close()
+    assert report['written'] == [('Employee', 1), ('Employee', 2)]
+    assert list(report['errors']) == [('Employee', 3)]
+    names = {employee.emp_no: employee.ename for employee in crud.read_all_employees()}
+    assert names == {1: 'E1', 2: 'E2', 3: 'KING'}
@@ -0,0 +1,195 @@
+import argparse
+import sys
+from collections import namedtuple
+from config import load_config
+from consultas import QUERIES, SAMPLE_PAGE_KEYS
+from crud import CRUD
+
+# Comprobación de los planes de todas las sentencias del registro (consultas.QUERIES) contra un Neo4j
+# local: cada una se planifica con EXPLAIN (no se ejecuta, así que las escrituras no tocan los datos) y
+# se comprueba que usa los operadores esperados, que no recorre etiquetas enteras si no debe y que el
+# planificador no estima más filas de las previstas. Cualquier fallo sale con código 1, para usarlo
+# antes de fusionar cambios en las consultas o en el esquema.
+#
+#   python verificar_planes.py
+#   python verificar_planes.py read_employee search_employees --show
+
+# Recorridos de todos los nodos de una etiqueta o de toda la base
+SCANS = ('NodeByLabelScan', 'AllNodesScan')
+
+# Búsquedas por clave única (dept_no, emp_no, ChangeVersion.label); incluye la variante (Locking) de
+# MERGE y la búsqueda por rango sobre el mismo índice
+UNIQUE = 'NodeUniqueIndexSeek'
+
+# Cualquier uso de un índice de rango; cada requisito acepta cualquiera de sus alternativas
+INDEX = ('NodeIndexSeek', 'NodeUniqueIndexSeek', 'NodeIndexScan', 'MultiNodeIndexSeek', 'AssertingMultiNodeIndexSeek')
+
+# Ordenaciones de todas las filas: las páginas por clave tienen que salir ya ordenadas del índice.
+# Por prefijo, así que incluye Top1WithTies; PartialSort/PartialTop no cuentan, porque solo ordenan
+# el desempate por emp_no dentro de cada valor de la clave que ya llega ordenada del índice
+SORTS = ('Sort', 'Top')
+
+# Filas estimadas como mucho en cualquier operador de una operación sobre una sola clave
+KEY_ROWS = 10
+
+# uses: operadores que tienen que aparecer (una cadena, o una tupla de alternativas);
+# forbids: operadores que no pueden aparecer; max_rows: límite de EstimatedRows de cada operador.
+# Los nombres se comparan por prefijo y sin el sufijo @base_de_datos de Neo4j 5
+Expectation = namedtuple('Expectation', ('uses', 'forbids', 'max_rows'), defaults=((), SCANS, None))
+
+# Por nombre completo o por operación (lo que va antes del primer ':'); una sentencia del registro sin
+# expectativa también es un fallo, así no se puede añadir una consulta sin decidir qué plan debe tener
+EXPECTED = {
+    'create_department': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    'ensure_departments': Expectation((UNIQUE,)),
+    'create_employee': Expectation((UNIQUE, 'NodeIndexSeek')),
+    'create_employee_checked': Expectation((UNIQUE, 'NodeIndexSeek')),
+    'bulk_create_departments': Expectation((UNIQUE,)),
+    'bulk_create_employees': Expectation((UNIQUE, 'NodeIndexSeek')),
+    'bulk_update_departments': Expectation((UNIQUE,)),
+    'bulk_update_employees': Expectation((UNIQUE, 'NodeIndexSeek')),
+    'bulk_delete_departments': Expectation((UNIQUE,)),
+    'bulk_delete_employees': Expectation((UNIQUE,)),
+    'load_employees': Expectation((UNIQUE,)),
+    'load_employees_retry': Expectation((UNIQUE,)),
+    'read_department': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    'read_employee': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    # Listados completos y agregados: recorrer la etiqueta es lo esperado
+    'read_all_departments': Expectation(forbids=('AllNodesScan',)),
+    'read_all_employees': Expectation(forbids=('AllNodesScan',)),
+    'department_stats': Expectation(forbids=('AllNodesScan',)),
+    'job_stats': Expectation(forbids=('AllNodesScan',)),
+    'hire_histogram': Expectation(forbids=('AllNodesScan',)),
+    'iter_departments': Expectation(('NodeIndexScan',), SCANS + SORTS),
+    'iter_employees': Expectation(('NodeIndexScan',), SCANS + SORTS),
+    'read_departments_page': Expectation(('NodeIndexScan',), SCANS + SORTS),
+    'read_departments_page:after': Expectation((UNIQUE,), SCANS + SORTS),
+    'read_employees_page:emp_no': Expectation(('NodeIndexScan',), SCANS + SORTS),
+    'read_employees_page:emp_no:after': Expectation((UNIQUE,), SCANS + SORTS),
+    # Las páginas siguientes por otra clave tienen que buscar el rango en el índice: un NodeIndexScan
+    # leería el índice desde el principio en cada página
+    **{f'read_employees_page:{key}:after': Expectation(('NodeIndexSeek',), SCANS + SORTS)
+       for key in SAMPLE_PAGE_KEYS if key != 'emp_no'},
+    'read_employees_page': Expectation((INDEX,), SCANS + SORTS),
+    'search_employees': Expectation((INDEX,), SCANS + SORTS),
+    'search_employees:text': Expectation(('ProcedureCall',)),
+    'migrate_manages:create': Expectation((UNIQUE,), forbids=('AllNodesScan',)),
+    'migrate_manages:delete': Expectation(forbids=('AllNodesScan',)),
+    'reporting_chain': Expectation((UNIQUE,)),
+    'subordinates': Expectation((UNIQUE,)),
+    'span_of_control': Expectation((UNIQUE,)),
+    'refresh_teams': Expectation((UNIQUE,)),
+    'team_stats': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    # La reconstrucción completa recorre todos los empleados a propósito
+    'rebuild_teams': Expectation(forbids=('AllNodesScan',)),
+    'update_department': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    'update_employee': Expectation((UNIQUE, 'NodeIndexSeek')),
+    'update_employee_checked': Expectation((UNIQUE, 'NodeIndexSeek')),
+    'change_version': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    'changed_rows': Expectation(('NodeIndexSeek',), SCANS + SORTS),
+    'deleted_keys': Expectation(('NodeIndexSeek', UNIQUE)),
+    'mark_reset': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    'raise_reset_at': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    'delete_department': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    'delete_employee': Expectation((UNIQUE,), max_rows=KEY_ROWS),
+    'delete_department_if_empty': Expectation((UNIQUE,)),
+    'department_has_employees': Expectation(('NodeIndexSeek',)),
+    'delete_department_cascade': Expectation((UNIQUE,)),
+    'prune_tombstones': Expectation(('NodeIndexSeek',)),
+    'delete_employees_where': Expectation(('NodeIndexSeek',)),
+    # Borrar todo recorre la base entera a propósito
+    'delete_all': Expectation(forbids=()),
+}
+
+
+def expectation_of(name):
+    return EXPECTED.get(name) or EXPECTED.get(name.split(':')[0])
+
+
+def _operator(plan):
+    return plan['operatorType'].split('@')[0]
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get('children', []):
+        yield from _walk(child)
+
+
+def check_plan(plan, expectation):
+    # Devuelve la lista de problemas del plan; vacía si cumple la expectativa
+    operators = [(_operator(node), node.get('arguments', {}).get('EstimatedRows')) for node in _walk(plan)]
+    names = [operator for operator, _ in operators]
+    problems = []
+    for requirement in expectation.uses:
+        alternatives = (requirement,) if isinstance(requirement, str) else requirement
+        if not any(name.startswith(alternative) for name in names for alternative in alternatives):
+            problems.append(f"no usa {' ni '.join(alternatives)}")
+    for forbidden in expectation.forbids:
+        if any(name.startswith(forbidden) for name in names):
+            problems.append(f"usa {forbidden}")
+    if expectation.max_rows is not None:
+        for operator, rows in operators:
+            if rows is not None and rows > expectation.max_rows:
+                problems.append(f"{operator} estima {rows:g} filas (máximo {expectation.max_rows})")
+    return problems
+
+
+def format_plan(plan, depth=0):
+    rows = plan.get('arguments', {}).get('EstimatedRows')
+    details = plan.get('arguments', {}).get('Details', '')
+    lines = [f"{'  ' * depth}{_operator(plan)}  filas={rows if rows is None else f'{rows:g}'}  {details}".rstrip()]
+    for child in plan.get('children', []):
+        lines.extend(format_plan(child, depth + 1))
+    return lines
+
+
+def verify(crud, names=None, show=False):
+    # Devuelve {nombre: [problemas]} solo con las sentencias que fallan
+    failures = {}
+    for name, (query, parameters) in QUERIES.items():
+        if names and name not in names and name.split(':')[0] not in names:
+            continue
+        expectation = expectation_of(name)
+        if expectation is None:
+            failures[name] = ["sin expectativa en verificar_planes.EXPECTED"]
+            continue
+        try:
+            plan = crud.explain(query, **parameters)
+        except Exception as error:
+            failures[name] = [f"EXPLAIN falló: {getattr(error, 'message', None) or error}"]
+            continue
+        problems = check_plan(plan, expectation)
+        if problems:
+            failures[name] = problems
+        if show or problems:
+            print(f"{name}:", file=sys.stderr)
+            print('\n'.join('    ' + line for line in format_plan(plan)), file=sys.stderr)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Comprueba con EXPLAIN que las consultas del CRUD siguen usando sus índices")
+    parser.add_argument('names', nargs='*', help="sentencias u operaciones a comprobar (por defecto, todas)")
+    parser.add_argument('--config', help="fichero de configuración (por defecto, CRUD_CONFIG o crud.ini)")
+    parser.add_argument('--no-schema', action='store_true', help="no crea antes las restricciones e índices que falten")
+    parser.add_argument('--show', action='store_true', help="escribe el plan de todas las sentencias, no solo de las que fallan")
+    args = parser.parse_args(argv)
+
+    crud = CRUD(**load_config(args.config))
+    try:
+        if not args.no_schema:
+            crud.ensure_schema()
+        failures = verify(crud, set(args.names), args.show)
+    finally:
+        crud.close()
+    checked = sum(1 for name in QUERIES if not args.names or name in args.names or name.split(':')[0] in args.names)
+    for name, problems in failures.items():
+        for problem in problems:
+            print(f"FALLO {name}: {problem}")
+    print(f"{checked - len(failures)} de {checked} sentencias con el plan esperado")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())